@@ -0,0 +1,37 @@
+"""
+Leaflet choropleth of the districts that keeps the geometry in the browser.
+
+The district TopoJSON levels of detail (see utils.topology) are served as static files next to
+the frontend, and each is fetched once, when the map is first zoomed to its level; a rerun only
+sends the value per district, the class breaks and colours, so recolouring the map costs a few
+hundred bytes instead of the whole map HTML.
+"""
+# Import libraries
+import os
+
+import streamlit.components.v1 as components
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend')
+
+_component_func = components.declare_component('district_choropleth', path=FRONTEND_DIR)
+
+
+def district_choropleth(values, colors, breaks, column, caption, version, decimals=2, height=600, key=None):
+    """
+    Draw the districts coloured by `values` (in the topology's Area order, None when missing).
+
+    `breaks` holds the len(colors) + 1 class boundaries. `version` identifies the TopoJSON
+    build (the manifest hash), so the browser only refetches the geometry when it has changed.
+    """
+    return _component_func(
+        values=values,
+        colors=colors,
+        breaks=breaks,
+        column=column,
+        caption=caption,
+        version=version,
+        decimals=decimals,
+        height=height,
+        key=key,
+        default=None,
+    )
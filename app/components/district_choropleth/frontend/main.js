@@ -0,0 +1,149 @@
+// The map, the district layer and the geometry outlive reruns; only the values change
+let map = null
+let layer = null
+let legend = null
+let loadedVersion = null
+let loading = null
+let args = null
+// Levels of detail from the manifest, their fetched features by file, and the one shown
+let levels = []
+const levelFeatures = {}
+let shownLevel = null
+
+const HIGHLIGHT = {fillColor: "#ffff00", color: "#ff0000", weight: 3, fillOpacity: 0.5}
+
+function classColor(value) {
+  if (value === null || value === undefined) {
+    return "white"
+  }
+  const {breaks, colors} = args
+  for (let i = 0; i < colors.length - 1; i++) {
+    if (value < breaks[i + 1]) {
+      return colors[i]
+    }
+  }
+  return colors[colors.length - 1]
+}
+
+function featureStyle(feature) {
+  return {fillColor: classColor(args.values[feature.id]), fillOpacity: 0.7, color: "black", weight: 1.5}
+}
+
+function formatValue(value) {
+  if (value === null || value === undefined) {
+    return "No data"
+  }
+  return value.toLocaleString(undefined, {maximumFractionDigits: args.decimals})
+}
+
+function tooltip(featureLayer) {
+  const feature = featureLayer.feature
+  return "<b>District:</b> " + feature.properties.Area + "<br><b>" + args.column + ":</b> " + formatValue(args.values[feature.id])
+}
+
+function drawLegend() {
+  if (legend) {
+    legend.remove()
+  }
+  legend = L.control({position: "topright"})
+  legend.onAdd = function() {
+    const div = L.DomUtil.create("div", "legend")
+    const rows = args.colors.map(function(color, i) {
+      return '<i style="background:' + color + '"></i>' + formatValue(args.breaks[i]) + " – " + formatValue(args.breaks[i + 1])
+    })
+    div.innerHTML = "<b>" + args.caption + "</b><br>" + rows.join("<br>")
+    return div
+  }
+  legend.addTo(map)
+}
+
+function levelForZoom(zoom) {
+  // Levels are sorted by min_zoom; take the most detailed one the zoom has reached
+  let chosen = levels[0]
+  for (const level of levels) {
+    if (zoom >= level.min_zoom) {
+      chosen = level
+    }
+  }
+  return chosen
+}
+
+function fetchLevel(level) {
+  // Each file is fetched at most once; the hash makes the browser refetch only after a rebuild
+  if (!levelFeatures[level.file]) {
+    levelFeatures[level.file] = fetch("./" + level.file + "?v=" + level.hash)
+      .then(function(response) { return response.json() })
+      .then(function(topology) { return topojson.feature(topology, topology.objects.districts) })
+  }
+  return levelFeatures[level.file]
+}
+
+function showLevel(level) {
+  return fetchLevel(level).then(function(districts) {
+    // A later zoom may have asked for another level while this one was loading
+    if (level !== levelForZoom(map.getZoom()) || level === shownLevel) {
+      return
+    }
+    if (layer) {
+      layer.remove()
+    }
+    layer = L.geoJSON(districts, {
+      style: featureStyle,
+      onEachFeature: function(feature, featureLayer) {
+        featureLayer.bindTooltip(tooltip, {sticky: true})
+        featureLayer.on("mouseover", function() { featureLayer.setStyle(HIGHLIGHT) })
+        featureLayer.on("mouseout", function() { layer.resetStyle(featureLayer) })
+      },
+    }).addTo(map)
+    shownLevel = level
+  })
+}
+
+function loadTopology(version) {
+  return fetch("./districts.json?v=" + version)
+    .then(function(response) { return response.json() })
+    .then(function(manifest) {
+      levels = manifest.levels
+      shownLevel = null
+      loadedVersion = version
+      return showLevel(levelForZoom(map.getZoom()))
+    })
+}
+
+function restyle() {
+  if (layer) {
+    layer.setStyle(featureStyle)
+  }
+  drawLegend()
+}
+
+function onRender(event) {
+  args = event.detail.args
+  document.getElementById("map").style.height = args.height + "px"
+  Streamlit.setFrameHeight(args.height)
+  if (!map) {
+    map = L.map("map").setView([60.18, 25.05], 10.5)
+    L.tileLayer("https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png", {
+      attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors &copy; <a href="https://carto.com/attributions">CARTO</a>',
+      subdomains: "abcd",
+      maxZoom: 20,
+    }).addTo(map)
+    map.on("zoomend", function() {
+      if (levels.length) {
+        showLevel(levelForZoom(map.getZoom())).then(restyle)
+      }
+    })
+  }
+  if (args.version !== loadedVersion) {
+    if (!loading) {
+      loading = loadTopology(args.version).finally(function() { loading = null })
+    }
+    // Style with whatever arguments are current once the geometry is in
+    loading.then(restyle)
+  } else {
+    restyle()
+  }
+}
+
+Streamlit.events.addEventListener(Streamlit.RENDER_EVENT, onRender)
+Streamlit.setComponentReady()
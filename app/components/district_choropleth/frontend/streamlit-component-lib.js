@@ -0,0 +1,24 @@
+// Minimal Streamlit component API: the iframe message protocol without any build tooling
+function sendMessageToStreamlitClient(type, data) {
+  window.parent.postMessage(Object.assign({isStreamlitMessage: true, type: type}, data), "*")
+}
+
+const Streamlit = {
+  RENDER_EVENT: "streamlit:render",
+  events: new EventTarget(),
+  setComponentReady: function() {
+    sendMessageToStreamlitClient("streamlit:componentReady", {apiVersion: 1})
+  },
+  setFrameHeight: function(height) {
+    sendMessageToStreamlitClient("streamlit:setFrameHeight", {height: height})
+  },
+  setComponentValue: function(value) {
+    sendMessageToStreamlitClient("streamlit:setComponentValue", {value: value, dataType: "json"})
+  },
+}
+
+window.addEventListener("message", function(event) {
+  if (event.data.type === Streamlit.RENDER_EVENT) {
+    Streamlit.events.dispatchEvent(new CustomEvent(Streamlit.RENDER_EVENT, {detail: event.data}))
+  }
+})
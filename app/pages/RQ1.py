@@ -1,16 +1,23 @@
 # Import libraries
 import streamlit as st
-import pandas as pd
-import geopandas as gpd
 import folium
+import branca
+import numpy as np
+from branca.utilities import color_brewer
 from streamlit_folium import st_folium
 import streamlit_highcharts as hc
-
-# Load data at the start to avoid reloading on every interaction
-@st.cache_data
+from components.district_choropleth import district_choropleth
+from utils import datastore
+from utils.bundle import data_version
+from utils.geometry import load_district_geometry
+from utils.indexes import default_config, load_index_engine
+from utils.profiling import profiled, section
+from utils.topology import load_district_topology, topology_version
+
+# Shared with the other pages through the data store, which loads each dataset once per process
+@profiled('RQ1')
 def load_data():
-    indexes = pd.read_csv('app/data/indexes.csv')
-    return indexes
+    return datastore.district_data(), datastore.indexes()
 
 def display_year_filters(df):
     year_list = list(df['Year'].unique())
@@ -18,42 +25,62 @@ def display_year_filters(df):
     year = st.sidebar.selectbox('Year', year_list, len(year_list)-1)
     return year
 
-def display_map(df, year, statistics_column, geojson_file):
-    df_year = df[(df['Year'] == year)]
-    gdf = gpd.read_file(geojson_file).to_crs(epsg=4326)
-    gdf = gdf.merge(df_year, on='Area', how='left')
-    gdf[statistics_column] = gdf[statistics_column].round(3)
-    st.header(f'{statistics_column} in year {year}')
-    st.markdown(
-        """
-        Let's explore the socio-economic and demographic characteristics of Helsinki's districts.
-        Especially, check out *'proportion of foreign language speakers'* and *'proportion of higher education'* in different years (in the left sidebar) to see how the city has become more segregated over time.   
-        **Note**: Districts or years with missing data are displayed in white.
-        """
-    )
-    map = folium.Map(location = [60.1800, 25.05], zoom_start=10.5, tiles='cartodb positron')
-    
-    folium.Choropleth(
-        geo_data=gdf,
-        name="choropleth",
-        data=gdf,
-        columns=["Area", statistics_column],
-        key_on="feature.properties.Area",
-        fill_color="OrRd",
-        fill_opacity=0.7,
-        line_opacity=0.1,
-        nan_fill_color="white",
-        highlight=True,
-        legend_name=f'{statistics_column} in {year}',
-    ).add_to(map)
-    folium.GeoJson(
-        gdf,
-        style_function=lambda feature: {
-            'fillColor': 'transparent',
+def district_classes(values, fill_color):
+    """
+    Colours and boundaries of six equal-width classes over the values present, as
+    folium.Choropleth draws them by default. Both are empty when every value is missing.
+    """
+    present = [value for value in values if value is not None]
+    if not present:
+        return [], []
+    return color_brewer(fill_color, 6), np.linspace(min(present), max(present), 7).tolist()
+
+def render_district_map(df_year, column, fill_color, legend_name, decimals, geojson_file, key):
+    """
+    Draw the district choropleth with the client-side component, which only receives the
+    values, or with Folium when the district TopoJSON has not been built.
+    """
+    topology = load_district_topology(topology_version())
+    if topology is None:
+        with section('RQ1', 'load_geometry'):
+            geometry = load_district_geometry(geojson_file)
+        with section('RQ1', f'build_{key}'):
+            map = folium.Map(location=[60.1800, 25.05], zoom_start=10.5, tiles='cartodb positron')
+            add_district_choropleth(map, geometry, df_year, column, fill_color, legend_name, decimals)
+        with section('RQ1', f'st_folium_{key}') as timer:
+            timer.payload(lambda: map.get_root().render())
+            st_folium(map, width=1000, height=600)
+        return
+    with section('RQ1', key) as timer:
+        values = topology.values(df_year, column, decimals)
+        colors, breaks = district_classes(values, fill_color)
+        timer.payload(lambda: {'values': values, 'colors': colors, 'breaks': breaks, 'column': column, 'caption': legend_name})
+        district_choropleth(values, colors, breaks, column, legend_name, topology.version, decimals, height=600, key=key)
+
+def add_district_choropleth(map, geometry, df_year, column, fill_color, legend_name, decimals):
+    """
+    Colour the districts by `column` in a single GeoJSON layer with a stepped colour legend.
+    """
+    values = df_year[['Area', column]].copy()
+    values[column] = values[column].round(decimals)
+    collection = geometry.feature_collection(values, column)
+    colors, breaks = district_classes([feature['properties'][column] for feature in collection['features']], fill_color)
+    colormap = None
+    if breaks:
+        colormap = branca.colormap.StepColormap(colors, index=breaks, vmin=breaks[0], vmax=breaks[-1], caption=legend_name)
+
+    def style_function(feature):
+        value = feature['properties'][column]
+        return {
+            'fillColor': 'white' if value is None or colormap is None else colormap(value),
+            'fillOpacity': 0.7,
             'color': 'black',
             'weight': 1.5,
-            'fillOpacity': 0.0,
-        },
+        }
+
+    folium.GeoJson(
+        collection,
+        style_function=style_function,
         highlight_function=lambda feature: {
             'fillColor': '#ffff00',
             'color': '#ff0000',
@@ -61,12 +88,25 @@ def display_map(df, year, statistics_column, geojson_file):
             'fillOpacity': 0.5,
         },
         tooltip=folium.GeoJsonTooltip(
-            fields=['Area', statistics_column],
-            aliases=['District:', f'{statistics_column}:'],
+            fields=['Area', column],
+            aliases=['District:', f'{column}:'],
             localize=True
         )
     ).add_to(map)
-    st_folium(map, width=1000, height=600)
+    if colormap is not None:
+        colormap.add_to(map)
+
+def display_map(df, year, statistics_column, geojson_file):
+    df_year = df[(df['Year'] == year)]
+    st.header(f'{statistics_column} in year {year}')
+    st.markdown(
+        """
+        Let's explore the socio-economic and demographic characteristics of Helsinki's districts.
+        Especially, check out *'proportion of foreign language speakers'* and *'proportion of higher education'* in different years (in the left sidebar) to see how the city has become more segregated over time.   
+        **Note**: Districts or years with missing data are displayed in white.
+        """
+    )
+    render_district_map(df_year, statistics_column, "OrRd", f'{statistics_column} in {year}', 3, geojson_file, 'statistics_map')
     
     return df_year, statistics_column
 
@@ -111,11 +151,6 @@ def display_index_map(df, selected_index, geojson_file):
         st.warning(f"No data available for {selected_year}.")
         return
 
-    gdf = gpd.read_file(geojson_file).to_crs(epsg=4326)
-    gdf = gdf.merge(df_year, on="Area", how="left")
-
-    gdf[selected_index] = gdf[selected_index].round(2)
-
     st.subheader(f"{selected_index} Map ({selected_year})")
     st.markdown("""
                 Let’s explore the four indices across Helsinki’s districts. 
@@ -123,48 +158,35 @@ def display_index_map(df, selected_index, geojson_file):
                 """
     )
 
-    map_center = [60.1800, 25.05]
-    map = folium.Map(location=map_center, zoom_start=10.5, tiles="cartodb positron")
-
-    folium.Choropleth(
-        geo_data=gdf,
-        name="choropleth",
-        data=gdf,
-        columns=["Area", selected_index],
-        key_on="feature.properties.Area",
-        fill_color="Greys",
-        fill_opacity=0.7,
-        line_opacity=0.2,
-        nan_fill_color="white",
-        highlight=True,
-        legend_name=f"{selected_index} ({selected_year})",
-    ).add_to(map)
-
-    folium.GeoJson(
-        gdf,
-        style_function=lambda feature: {
-            "fillColor": "transparent",
-            "color": "black",
-            "weight": 1.5,
-            "fillOpacity": 0.0,
-        },
-        highlight_function=lambda feature: {
-            "fillColor": "#ffff00",
-            "color": "#ff0000",
-            "weight": 3,
-            "fillOpacity": 0.5,
-        },
-        tooltip=folium.GeoJsonTooltip(
-            fields=["Area", selected_index],
-            aliases=["District:", f"{selected_index}:"],
-            localize=True,
-        ),
-    ).add_to(map)
-
-    st_folium(map, width=1000, height=600)
+    render_district_map(df_year, selected_index, "Greys", f"{selected_index} ({selected_year})", 2, geojson_file, 'index_map')
 
     return selected_index
 
+def display_index_weights():
+    """
+    Sidebar controls for the what-if mode; returns the index configuration, or None when the published indices are used.
+    """
+    if not st.sidebar.toggle("What-if index weights", help="Recompute the EPI and PSAI with your own weights and indicators."):
+        return None
+    config = default_config()
+    st.sidebar.markdown("**Economic Prosperity Index weights**")
+    labels = {
+        "Income subject to state taxation euro average": "Income",
+        "Gini coefficient disposable income": "Gini (inverted)",
+        "Unemployment rate": "Unemployment (inverted)",
+        "Proportion of higher education": "Higher education",
+    }
+    for column, label in labels.items():
+        config['epi']['weights'][column] = st.sidebar.slider(label, 0.0, 1.0, config['epi']['weights'][column], 0.05)
+    psai_indicators = config['psai']['indicators']
+    config['psai']['indicators'] = st.sidebar.multiselect(
+        "Public Service Accessibility Index indicators",
+        psai_indicators,
+        default=psai_indicators,
+        format_func=lambda col: col.replace("Service points for ", "").replace(" per 1000 persons", ""),
+    )
+    return config
+
 def main():
     APP_TITLE = "RQ1: What are the socio-economic and demographic characteristics of Helsinki’s districts?"
 
@@ -178,7 +200,7 @@ def main():
         """
     )
     
-    district_data = pd.read_csv('app/data/district_data.csv')
+    district_data, indexes = load_data()
 
     notes = {
         "Population": "The total number of people living in a given area.",
@@ -226,8 +248,6 @@ def main():
     df_year, selected_stat = display_map(district_data, selected_year, statistics_column, 'app/data/districts.geojson')
     display_statistics(df_year, selected_stat)
     
-    indexes = load_data()
-    
     st.markdown("### Socioeconomic and Demographic Characteristics of Helsinki’s Districts")
     
     st.markdown(
@@ -384,8 +404,17 @@ def main():
         "Public Service Accessibility Index"
     ]
     selected_index = st.sidebar.selectbox("Select an Index to Visualise", index_options)
+    index_config = display_index_weights()
+    if index_config is not None:
+        # Only the index columns whose configuration changed are recomputed; the rest come from the engine's memo
+        with section('RQ1', 'compute_indexes'):
+            indexes = load_index_engine(data_version()).compute(index_config)
+        district_indexes_data = district_data.merge(indexes, on=["Area", "Year"], how="left")
+        if index_config != default_config():
+            st.info("What-if mode: the map shows indices recomputed with the weights and indicators chosen in the sidebar.")
 
     selected_stat = display_index_map(district_indexes_data, selected_index, 'app/data/districts.geojson')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with section('RQ1', 'rerun'):
+        main()
\ No newline at end of file
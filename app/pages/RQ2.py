@@ -3,79 +3,207 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import folium
-from folium.plugins import MarkerCluster
+import branca
+from folium.plugins import FastMarkerCluster
 from streamlit_folium import st_folium
 import plotly.graph_objects as go
 import streamlit_highcharts as hc
 import gensim
 from sklearn.model_selection import train_test_split
-import spacy
-nlp = spacy.load("fi_core_news_sm")
 
 import random
+import time
 import matplotlib.pyplot as plt
-import re
-
-# Load data at the start to avoid reloading on every interaction
-@st.cache_data
+from utils.binning import ZOOM_CELL_SIZES, ProposalBins, bins_to_geojson
+from utils import datastore
+from utils.bundle import TOPIC_COLUMNS, data_version
+from utils.charts import heatmap_points, render_chart
+from utils.doc_topics import load_doc_topics
+from utils.geometry import load_district_geometry
+from utils.profiling import profiled, section
+from utils.search import load_search_index
+from utils.text import preprocess
+from utils.topics import active_model_files, get_prediction_cache, model_fingerprint, predict_topics_batch, topic_columns
+
+# Shared with the other pages through the data store, which loads each dataset once per
+# process and per bundle version, so ingested proposals show up on the next rerun
+@profiled('RQ2')
 def load_data():
-    pro_merged = pd.read_csv('app/data/pro_merged.csv')
-    sample_proposals = pd.read_csv('app/data/sample_proposals.csv')
-    topic_numbers = pd.read_csv('app/data/topic_numbers.csv')
-    lda_model = gensim.models.ldamodel.LdaModel.load("app/data/lda_model.model")
-    dictionary = gensim.corpora.Dictionary.load("app/data/lda_dictionary.dict")
-    propsals_by_round_district = pd.read_csv('app/data/proposals_by_round_district.csv')
-    top_proposals = pd.read_csv('app/data/top_proposals_per_topic.csv')
-    district_topic_data = pd.read_csv("app/data/district_topic_proportions.csv")
-    return pro_merged, sample_proposals, topic_numbers, lda_model, dictionary, propsals_by_round_district, top_proposals, district_topic_data
+    pro_merged = datastore.proposals()
+    sample_proposals = datastore.sample_proposals()
+    topic_numbers = datastore.topic_numbers()
+    district_topic_data = datastore.district_topic_proportions()
+    return pro_merged, sample_proposals, topic_numbers, district_topic_data
+
+# Keyed by the model fingerprint so activating another version or replacing the files reloads them;
+# one entry, so the previous model is released instead of staying in memory
+@profiled('RQ2')
+@st.cache_resource(max_entries=1)
+def load_topic_model(fingerprint):
+    files = active_model_files()
+    lda_model = gensim.models.ldamodel.LdaModel.load(files['model'])
+    dictionary = gensim.corpora.Dictionary.load(files['dictionary'])
+    return lda_model, dictionary
 
 @st.cache_data
-def get_sampled_df(pro_merged):
-    sampled_df = pro_merged.dropna(subset=['latitude', 'longitude'])
-    sampled_df, _ = train_test_split(sampled_df, test_size=1 - (100 / len(sampled_df)), stratify=sampled_df['selected'], random_state=42)
+def get_sampled_df(_pro_merged, sample_size, rounds=None, vote_results=None, version=None):
+    sampled_df = _pro_merged.dropna(subset=['latitude', 'longitude'])
+    if rounds is not None:
+        sampled_df = sampled_df[sampled_df['round'].isin(rounds)]
+    if vote_results is not None:
+        sampled_df = sampled_df[sampled_df['selected'].isin(vote_results)]
+    if sample_size < len(sampled_df) and sampled_df['selected'].value_counts().min() >= 2:
+        sampled_df, _ = train_test_split(sampled_df, test_size=1 - (sample_size / len(sampled_df)), stratify=sampled_df['selected'], random_state=42)
+    elif sample_size < len(sampled_df):
+        sampled_df = sampled_df.sample(sample_size, random_state=42)
     return sampled_df
 
-def display_map(pro_merged):
+# Columns shipped to the browser for each marker; popups are assembled client-side
+MARKER_COLUMNS = ['latitude', 'longitude', 'is_selected', 'title', 'round', 'versionsCount', 'total_comments_count', 'district']
+
+@st.cache_data
+def build_marker_payload(_pro_merged, sample_size, rounds, vote_results, version=None):
+    """
+    Serialise the map points for one filter combination into compact rows for FastMarkerCluster.
+    """
+    sampled_df = get_sampled_df(_pro_merged, sample_size, rounds, vote_results, version)
+    payload = pd.DataFrame({
+        'latitude': sampled_df['latitude'].round(6),
+        'longitude': sampled_df['longitude'].round(6),
+        'is_selected': (sampled_df['selected'] == 'Selected').astype(int),
+        'title': sampled_df['title'].fillna('').astype(str),
+        'round': sampled_df['round'].astype(int),
+        'versionsCount': sampled_df['versionsCount'].fillna(0).astype(int),
+        'total_comments_count': sampled_df['total_comments_count'].fillna(0).astype(int),
+        'district': sampled_df['district'].astype(str).replace('nan', ''),
+    })
+    return payload[MARKER_COLUMNS].to_numpy(dtype=object).tolist()
+
+marker_callback = """
+function (row) {
+    var escape = function (value) {
+        var div = document.createElement('div');
+        div.textContent = value;
+        return div.innerHTML;
+    };
+    var selected = row[2] === 1;
+    var icon = L.AwesomeMarkers.icon({
+        icon: selected ? 'ok-sign' : 'remove-sign',
+        markerColor: selected ? 'green' : 'red',
+        prefix: 'glyphicon'
+    });
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindPopup(
+        '<b>Title:</b> ' + escape(row[3]) + '<br>' +
+        '<b>Round:</b> ' + row[4] + '<br>' +
+        '<b>Versions Count:</b> ' + row[5] + '<br>' +
+        '<b>Total Comments:</b> ' + row[6] + '<br>' +
+        '<b>District:</b> ' + escape(row[7]),
+        {maxWidth: 250}
+    );
+    return marker;
+}
+"""
+
+@st.cache_resource
+def load_proposal_bins(_pro_merged, version=None):
+    topic_mixtures = datastore.sample_proposals()[['id', 'round'] + TOPIC_COLUMNS]
+    return ProposalBins(_pro_merged, topic_mixtures)
+
+BIN_METRICS = {
+    "Number of proposals": "count",
+    "Share selected": "selected_ratio",
+    "Mean budget (€)": "mean_budget",
+    "Dominant topic": "dominant_topic",
+}
+topic_palette = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2"]
+
+@st.cache_data
+def build_bin_layer(_bins, layer, cell_size, rounds, vote_results, version=None):
+    """
+    Aggregate the proposals for one filter combination and return the bins as GeoJSON.
+    The payload grows with the number of bins, not the number of proposals.
+    """
+    proposals = _bins.proposals
+    mask = (proposals['round'].isin(rounds) & proposals['selected'].isin(vote_results)).to_numpy()
+    if layer == "Districts":
+        bins = _bins.districts(load_district_geometry(), mask)
+        properties = ['Area']
+    else:
+        bins = _bins.grid(cell_size, 'hex' if layer == "Hexagon bins" else 'square', mask)
+        properties = []
+    bins['selected_ratio'] = bins['selected_ratio'].round(3)
+    bins['mean_budget'] = bins['mean_budget'].round(0)
+    bins['topic'] = [topic_summaries.get(t, {'title': f"Topic {t + 1}"})['title'] if t >= 0 else 'No topic' for t in bins['dominant_topic']]
+    return bins_to_geojson(bins, properties + ['count', 'selected_ratio', 'mean_budget', 'dominant_topic', 'topic'])
+
+def add_bin_layer(m, geojson, metric_label):
+    metric = BIN_METRICS[metric_label]
+    features = geojson['features']
+    if metric == 'dominant_topic':
+        fill = lambda props: topic_palette[props['dominant_topic'] % len(topic_palette)] if props['dominant_topic'] >= 0 else '#cccccc'
+    else:
+        values = [f['properties'][metric] for f in features if f['properties'][metric] is not None]
+        colormap = branca.colormap.linear.OrRd_09.scale(min(values, default=0), max(values, default=1))
+        colormap.caption = metric_label
+        colormap.add_to(m)
+        fill = lambda props: colormap(props[metric]) if props[metric] is not None else '#ffffff'
+    fields = [field for field in ['Area', 'count', 'selected_ratio', 'mean_budget', 'topic'] if field in features[0]['properties']] if features else []
+    aliases = {'Area': 'District:', 'count': 'Proposals:', 'selected_ratio': 'Share selected:', 'mean_budget': 'Mean budget (€):', 'topic': 'Dominant topic:'}
+    folium.GeoJson(
+        geojson,
+        style_function=lambda feature: {
+            'fillColor': fill(feature['properties']),
+            'color': 'black',
+            'weight': 0.5,
+            'fillOpacity': 0.7,
+        },
+        tooltip=folium.GeoJsonTooltip(fields=fields, aliases=[aliases[field] for field in fields], localize=True) if fields else None,
+    ).add_to(m)
+
+def display_map(pro_merged, version):
     st.subheader('2. Proposals on a Map')
     st.write("""
              When a proposal is submitted, a proposer can mark the location of the proposal on a map, a crucial information for understanding the association between the proposal content and its geographical context.
              Let's explore the red and green markers on the map, which represent the proposals that were not selected and selected, respectively.
              """)
-    sampled_df = get_sampled_df(pro_merged)
-
-    m = folium.Map(location=[60.1699, 24.9384], zoom_start=12)
-    marker_cluster = MarkerCluster().add_to(m)
-
-    for _, row in sampled_df.iterrows():
-        icon_color = 'green' if row['selected'] == 'Selected' else 'red'
-        icon = folium.Icon(color=icon_color, icon='ok-sign' if row['selected'] == 'Selected' else 'remove-sign')
-        
-        popup_content = (
-            f"<b>Title:</b> {row['title']}<br>"
-            f"<b>Round:</b> {row['round']}<br>"
-            f"<b>Versions Count:</b> {row['versionsCount']}<br>"
-            f"<b>Total Comments:</b> {row['total_comments_count']}<br>"
-            f"<b>District:</b> {row['district']}"
-        )
-        
-        folium.Marker(
-            location=[row['latitude'], row['longitude']],
-            popup=folium.Popup(popup_content, max_width=250),
-            icon=icon
-        ).add_to(marker_cluster)
-
-    legend_html = '''
-         <div style="position: fixed; 
-                     bottom: 25px; left: 25px; width: 150px; height: 90px; 
-                     background-color: white; border:2px solid grey; z-index:9999; font-size:14px;">
-         &nbsp;<b>Vote result</b><br>
-         &nbsp;<i class="fa fa-map-marker fa-2x" style="color:green"></i>&nbsp;Selected<br>
-         &nbsp;<i class="fa fa-map-marker fa-2x" style="color:red"></i>&nbsp;Not Selected
-         </div>
-         '''
-    m.get_root().html.add_child(folium.Element(legend_html))
-
-    st_folium(m, width=1000, height=600)
+    geolocated = pro_merged.dropna(subset=['latitude', 'longitude'])
+    st.sidebar.markdown("**Proposals on the map**")
+    round_options = sorted(int(r) for r in geolocated['round'].unique())
+    rounds = st.sidebar.multiselect("Round", round_options, default=round_options)
+    vote_options = ['Selected', 'Not selected']
+    vote_results = st.sidebar.multiselect("Vote result", vote_options, default=vote_options)
+    layer = st.sidebar.radio("Map layer", ["Markers", "Hexagon bins", "Square bins", "Districts"])
+
+    if layer == "Markers":
+        sample_size = st.sidebar.slider("Number of proposals", min_value=min(100, len(geolocated)), max_value=len(geolocated), value=len(geolocated), step=100)
+        payload = build_marker_payload(pro_merged, sample_size, tuple(rounds), tuple(vote_results), version)
+        st.caption(f"Showing {len(payload)} of {len(geolocated)} geolocated proposals.")
+        m = folium.Map(location=[60.1699, 24.9384], zoom_start=12)
+        FastMarkerCluster(payload, callback=marker_callback).add_to(m)
+        legend_html = '''
+             <div style="position: fixed; 
+                         bottom: 25px; left: 25px; width: 150px; height: 90px; 
+                         background-color: white; border:2px solid grey; z-index:9999; font-size:14px;">
+             &nbsp;<b>Vote result</b><br>
+             &nbsp;<i class="fa fa-map-marker fa-2x" style="color:green"></i>&nbsp;Selected<br>
+             &nbsp;<i class="fa fa-map-marker fa-2x" style="color:red"></i>&nbsp;Not Selected
+             </div>
+             '''
+        m.get_root().html.add_child(folium.Element(legend_html))
+    else:
+        zoom = 11
+        if layer != "Districts":
+            zoom = st.sidebar.select_slider("Zoom level", options=list(ZOOM_CELL_SIZES), value=12, format_func=lambda z: f"{z} ({ZOOM_CELL_SIZES[z]} m bins)")
+        metric_label = st.sidebar.selectbox("Colour bins by", list(BIN_METRICS))
+        geojson = build_bin_layer(load_proposal_bins(pro_merged, version), layer, ZOOM_CELL_SIZES.get(zoom), tuple(rounds), tuple(vote_results), version)
+        st.caption(f"Aggregated into {len(geojson['features'])} bins.")
+        m = folium.Map(location=[60.1699, 24.9384], zoom_start=zoom, tiles='cartodb positron')
+        add_bin_layer(m, geojson, metric_label)
+
+    with section('RQ2', 'st_folium_proposal_map') as timer:
+        timer.payload(lambda: m.get_root().render())
+        st_folium(m, width=1000, height=600)
     
 def display_random_sample(sample_proposals):
     st.subheader("1. What is a 'proposal'?")
@@ -97,6 +225,35 @@ def display_random_sample(sample_proposals):
         st.write(f"**Round:** {sampled_proposal['round']}")
         st.write(f"**District:** {sampled_proposal['district']}")
     
+def display_search(pro_merged, lda_model, dictionary, fingerprint, version):
+    st.markdown("**Search proposals**")
+    with st.spinner("Building the search index..."):
+        search_index = load_search_index(version, fingerprint, lda_model, dictionary)
+    if search_index is None:
+        st.info("Search needs the Finnish spaCy model, which is not installed here.")
+        return
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        query = st.text_input("Words or a description of a proposal", placeholder="e.g. koirapuisto")
+    with col2:
+        mode = st.radio("Match by", ["Keywords", "Similar topics"], horizontal=True, help="Keywords ranks proposals by BM25 over their lemmatised title and text; similar topics compares the LDA topic mixture of your text with each proposal's.")
+    col3, col4, col5 = st.columns([3, 2, 1])
+    with col3:
+        districts = st.multiselect("District", sorted(pro_merged['district'].dropna().unique()), placeholder="All districts")
+    with col4:
+        rounds = st.multiselect("Round", sorted(pro_merged['round'].unique()), placeholder="All rounds")
+    with col5:
+        k = st.number_input("Results", min_value=5, max_value=100, value=20, step=5)
+    if not query.strip():
+        return
+    start = time.perf_counter()
+    with section('RQ2', 'search'):
+        results = search_index.search(query, 'keywords' if mode == "Keywords" else 'topics', int(k), districts, rounds, lda_model, dictionary)
+    elapsed = (time.perf_counter() - start) * 1000
+    st.caption(f"{len(results)} proposals in {elapsed:.1f} ms (searching {search_index.manifest['documents']} proposals)")
+    if not results.empty:
+        st.dataframe(results, hide_index=True, use_container_width=True, column_config={"score": st.column_config.NumberColumn("Score", format="%.3f")})
+
 def display_coh_per(topic_data):
     st.subheader('3.1 Coherence and Perplexity Scores (10 iterations per topic number)')
     topic_grouped = topic_data.groupby('topic').agg({
@@ -184,17 +341,17 @@ def plot_topic_words_highcharts(lda_model, topic_num, topic_title):
     }
     hc.streamlit_highcharts(chart_options, height=500)
 
-def display_topics(lda_model, topic_summaries, top_proposals):
+def display_topics(lda_model, topic_summaries, doc_topics, sample_proposals):
     col1, col2 = st.columns(2)
     topic_num = col1.slider("Select Topic", 1, lda_model.num_topics, 1) - 1 
-    topic_title = topic_summaries[topic_num]["title"]
-    selected_topic = topic_summaries[topic_num]
+    selected_topic = topic_summaries.get(topic_num, {"title": f"Topic {topic_num + 1}", "description": ""})
+    topic_title = selected_topic["title"]
     with col1:
         plot_topic_words_highcharts(lda_model, topic_num, topic_title)
     with col2:
         col2.subheader(selected_topic["title"])
         col2.write(selected_topic["description"])
-        filtered_proposals = top_proposals[top_proposals['topic'] == topic_num + 1] 
+        filtered_proposals = doc_topics.top_documents(topic_num, 10).merge(sample_proposals[['id', 'round', 'title', 'texts']], on=['id', 'round'], how='left')
 
         if not filtered_proposals.empty:
             top_proposals = filtered_proposals.iloc[5:7]  
@@ -202,13 +359,13 @@ def display_topics(lda_model, topic_summaries, top_proposals):
             
             for i, proposal in top_proposals.iterrows():
                 col2.write(f"**Title**: {proposal['title']}")
-                col2.write(f"**Text**: {proposal['text']}")
+                col2.write(f"**Text**: {proposal['texts']}")
                 col2.write(f"**Probability**: {proposal['probability']:.3f}")
                 col2.write("---")  
         else:
             col2.markdown(f"### No proposals available for {selected_topic['title']}")
 
-def plot_topic_distribution(proposals_by_round_district, topic_summaries):
+def plot_topic_distribution(doc_topics, topic_summaries):
     """
     Plot a bar chart to show the distribution of topics across all proposals, 
     sorted by values and labeled with the topic titles.
@@ -220,10 +377,8 @@ def plot_topic_distribution(proposals_by_round_district, topic_summaries):
                 """
     )
 
-    topic_columns = [f"Topic_{i}" for i in range(7)]  
-    topic_distribution = proposals_by_round_district[topic_columns].sum()
-    topic_distribution_normalized = topic_distribution / topic_distribution.sum()
-    topic_titles = [topic_summaries[i]['title'] for i in range(7)]
+    topic_distribution_normalized = [float(share) for share in doc_topics.topic_shares()]
+    topic_titles = [topic_summaries.get(i, {'title': f"Topic {i + 1}"})['title'] for i in range(doc_topics.num_topics)]
     topics_sorted = sorted(zip(topic_titles, topic_distribution_normalized), key=lambda x: x[1], reverse=True)
     categories, values = zip(*topics_sorted)
 
@@ -247,17 +402,12 @@ def plot_topic_distribution(proposals_by_round_district, topic_summaries):
     }
     hc.streamlit_highcharts(chart_options)
     
-def prepare_heatmap_data(df):
+def prepare_heatmap_data(doc_topics):
     """
     Prepare the data for a heatmap where districts are on the y-axis
     and topics are on the x-axis.
     """
-    topic_columns = [f"Topic_{i}" for i in range(7)]  
-    heatmap_data = df.groupby('district')[topic_columns].mean().reset_index()
-
-    heatmap_data.fillna(0, inplace=True)
-
-    return heatmap_data
+    return doc_topics.group_means('district').fillna(0).reset_index()
 
 district_order = [
     "Pitäjänmäki", "Munkkiniemi", "Kaarela", "Haaga", "Reijola",  # Western
@@ -270,7 +420,7 @@ district_order = [
     "Östersundom"  # Östersundom
 ]
 
-def create_heatmap(df, topic_summaries, district_order):
+def create_heatmap(doc_topics, topic_summaries, district_order):
     st.subheader("3.4 Heatmap of Topic Distribution by District")
     st.markdown("""
                 The heatmap reveals both city-wide trends and distinct local patterns in citizen priorities. At the city-wide level, *Enhancing Pathways and Park Connectivity* (Topic 5) stands out as a shared concern across nearly all districts, reflecting widespread demand for improved recreational infrastructure. *Developing Spaces for Children and Youth* (Topic 7) emerges as the second most prevalent theme, with a notable cluster in northern districts such as Itä-Pakila, Tuomarinkylä, Maunula, Pukinmäki, Malmi, and Puistola—areas that also report a relatively higher proportion of youth population (see the RQ1 page). 
@@ -278,71 +428,72 @@ def create_heatmap(df, topic_summaries, district_order):
                 Additionally, certain districts emphasise specific themes: Myllypuro (Topic 4: 0.33), Östersundom (Topic 2: 0.32), and Vironniemi (Topic 3: 0.32), each highlighting distinct priorities that warrant closer examination of their local contexts.
                 """
     )
-    heatmap_data = prepare_heatmap_data(df)
-    def format_title(title):
-        if ":" in title:
-            title = title.split(":", 1)[-1].strip()
-        import textwrap
-        return "<br>".join(textwrap.wrap(title, width=35, break_long_words=False))
-    topic_titles = [format_title(topic_summaries[i]["title"]) for i in range(7)] 
-    heatmap_data = heatmap_data.set_index('district').reindex(district_order).reset_index()
-    districts = heatmap_data['district'].tolist()
-    data_matrix = []
-    for topic_idx, topic in enumerate(topic_titles):
-        for district_idx, district in enumerate(districts):
-            data_matrix.append([district_idx, topic_idx, heatmap_data.iloc[district_idx, topic_idx + 1]])
-
-    chart_options = {
-        'chart': {
-            'type': 'heatmap',
-            'plotBorderWidth': 1,
-            'height': 800 
-        },
-        'title': {'text': 'Topic Distribution by District'},
-        'xAxis': {
-            'categories': districts,  
-            'title': {'text': 'Districts'},
-            'labels': {
-                'rotation': 45,
-                'style': {'fontSize': '15px'}
-            }
-        },
-        'yAxis': {
-            'categories': topic_titles,  
-            'title': {'text': 'Topics'},
-            'reversed': True,
-            'labels': {
-                'useHTML': True,
-                'style': {'fontSize': '15px'}
-            }
-        },
-        'colorAxis': {
-            'min': 0,
-            'minColor': '#FFFFFF',
-            'maxColor': '#000000'  
-        },
-        'legend': {
-            'align': 'right',
-            'layout': 'vertical',
-            'margin': 0,
-            'verticalAlign': 'top',
-            'y': 25,
-            'symbolHeight': 280
-        },
-        'series': [{
-            'name': 'Proportion of Topic in District',
-            'borderWidth': 1,
-            'data': data_matrix, 
-            'dataLabels': {
-                'enabled': True,
-                'format': '{point.value:.2f}'
+    def build():
+        heatmap_data = prepare_heatmap_data(doc_topics)
+        def format_title(title):
+            if ":" in title:
+                title = title.split(":", 1)[-1].strip()
+            import textwrap
+            return "<br>".join(textwrap.wrap(title, width=35, break_long_words=False))
+        topic_titles = [format_title(topic_summaries.get(i, {"title": f"Topic {i + 1}"})["title"]) for i in range(doc_topics.num_topics)]
+        heatmap_data = heatmap_data.set_index('district').reindex(district_order)
+        districts = heatmap_data.index.tolist()
+        data_matrix = heatmap_points(heatmap_data.to_numpy())
+
+        chart_options = {
+            'chart': {
+                'type': 'heatmap',
+                'plotBorderWidth': 1,
+                'height': 800 
+            },
+            'title': {'text': 'Topic Distribution by District'},
+            'xAxis': {
+                'categories': districts,  
+                'title': {'text': 'Districts'},
+                'labels': {
+                    'rotation': 45,
+                    'style': {'fontSize': '15px'}
+                }
+            },
+            'yAxis': {
+                'categories': topic_titles,  
+                'title': {'text': 'Topics'},
+                'reversed': True,
+                'labels': {
+                    'useHTML': True,
+                    'style': {'fontSize': '15px'}
+                }
+            },
+            'colorAxis': {
+                'min': 0,
+                'minColor': '#FFFFFF',
+                'maxColor': '#000000'  
+            },
+            'legend': {
+                'align': 'right',
+                'layout': 'vertical',
+                'margin': 0,
+                'verticalAlign': 'top',
+                'y': 25,
+                'symbolHeight': 280
+            },
+            'series': [{
+                'name': 'Proportion of Topic in District',
+                'borderWidth': 1,
+                'data': data_matrix, 
+                'dataLabels': {
+                    'enabled': True,
+                    'format': '{point.value:.2f}'
+                }
+            }],
+            'tooltip': {
+                'enabled': False
             }
-        }],
-        'tooltip': {
-            'enabled': False
         }
-    }
-    hc.streamlit_highcharts(chart_options, height=800)
+        return chart_options
+
+    key = (doc_topics.manifest['model_fingerprint'], tuple(district_order))
+    render_chart('topic_district_heatmap', key, build, height=800)
 
 major_district_mapping = {
     "Pitäjänmäki": "Western", "Munkkiniemi": "Western", "Kaarela": "Western", "Haaga": "Western", "Reijola": "Western",
@@ -356,35 +507,66 @@ major_district_mapping = {
 }
     
 
-combined_stopwords = set(spacy.lang.fi.stop_words.STOP_WORDS)
-
-def preprocess(text):
-    text = text.lower()
-    text = re.sub(r',([^ ])', r', \1', text)
-    text = re.sub(r'http\S+|www.\S+', '', text)
-    text = re.sub(r'<[A-Za-z]+>', '', text)
-    text = re.sub(r'[<>@#%&]', '', text)  
-    text = re.sub(r'&[a-z]+;', '', text)  
-    text = re.sub(r'\d+', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    doc = nlp(text)
-    tokens = [token.lemma_ for token in doc if not token.is_punct and token.lemma_.lower() not in combined_stopwords]
-    
-    return tokens
+# Shorter texts have too few words left after preprocessing for a stable topic mixture
+MIN_TEXT_LENGTH = 100
+
+def predict_topics(unseen_text, dictionary, lda_model, topic_summaries, fingerprint):
+    def infer():
+        with section('RQ2', 'spacy_preprocess'):
+            unseen_tokenized_text = preprocess(unseen_text)
+        unseen_bow = dictionary.doc2bow(unseen_tokenized_text)
+        return lda_model.get_document_topics(unseen_bow, minimum_probability=0.0)
 
-def predict_topics(unseen_text, dictionary, lda_model, topic_summaries):
-    unseen_tokenized_text = preprocess(unseen_text)
-    unseen_bow = dictionary.doc2bow(unseen_tokenized_text)
-    topic_distribution = lda_model.get_document_topics(unseen_bow, minimum_probability=0.0)
+    topic_distribution = get_prediction_cache().get_or_compute(unseen_text, fingerprint, infer)
     
     bubble_chart_data = []
     for topic_id, proportion in topic_distribution:
         bubble_chart_data.append({
-            "z": proportion * 100,  
-            "name": topic_summaries[topic_id]["title"] 
+            "z": float(proportion) * 100,
+            "name": topic_summaries.get(topic_id, {"title": f"Topic {topic_id + 1}"})["title"]
         })
     return bubble_chart_data
 
+def format_labels(labels, limit=20):
+    labels = [str(label) for label in labels]
+    return ", ".join(labels[:limit]) + (f" and {len(labels) - limit} more" if len(labels) > limit else "")
+
+def display_batch_predictions(texts, ids, id_label, dictionary, lda_model, topic_summaries):
+    """
+    Score each text as a separate proposal and show the per-proposal topic proportions.
+    `ids` (aligned with `texts`) labels every result under `id_label`, so the downloaded CSV
+    can be joined back to the input; texts that are empty are skipped and listed.
+    """
+    result_columns = ['text', 'top_topic'] + topic_columns(lda_model.num_topics)
+    if id_label in result_columns:
+        st.error(f"The id column cannot be named '{id_label}': it is one of the result columns ({', '.join(result_columns)}). Rename it or pick another id column.")
+        return
+    with section('RQ2', 'predict_batch'):
+        # Single process: forking spaCy workers from the threaded Streamlit server can deadlock.
+        # The offline CLIs keep the process pool.
+        results = predict_topics_batch(texts, dictionary, lda_model, n_process=1)
+    skipped = ids[~texts.index.isin(results.index)]
+    if len(skipped):
+        st.info(f"Skipped {len(skipped)} rows without text ({id_label} {format_labels(skipped)}).")
+    if results.empty:
+        st.warning("No proposal texts found in the input.")
+        return
+    results.insert(0, id_label, ids.loc[results.index].to_numpy())
+    short = results.loc[results['text'].str.strip().str.len() < MIN_TEXT_LENGTH, id_label]
+    if len(short):
+        st.warning(f"{len(short)} of the texts have fewer than {MIN_TEXT_LENGTH} characters, so their predictions are less reliable ({id_label} {format_labels(short)}).")
+    titles = {f"Topic_{i}": topic_summaries.get(i, {"title": f"Topic {i + 1}"})["title"] for i in range(lda_model.num_topics)}
+    st.write(f"**Scored {len(results)} proposals.**")
+    st.dataframe(results.replace({'top_topic': titles}).rename(columns=titles), hide_index=True)
+    st.download_button(
+        "Download topic proportions (CSV)",
+        results.to_csv(index=False),
+        file_name="predicted_topics.csv",
+        mime="text/csv"
+    )
+    mean_proportions = results[list(titles)].mean()
+    display_bar_chart([{"z": float(value) * 100, "name": titles[topic]} for topic, value in mean_proportions.items()])
+
 def display_bar_chart(tree_map_data):
     sorted_data = sorted(tree_map_data, key=lambda x: x["z"], reverse=True)
     categories = [entry["name"] for entry in sorted_data]  
@@ -485,10 +667,16 @@ def main():
         It explores how these ideas go through the whole cycle of PB, and offers insights into key themes through topic modeling.
     """)
     st.write("")
-    pro_merged, sample_proposals, topic_numbers, lda_model, dictionary, proposals_by_round_district, top_proposals, district_topic_data = load_data()
+    version = data_version()
+    pro_merged, sample_proposals, topic_numbers, district_topic_data = load_data()
+    fingerprint = model_fingerprint()
+    lda_model, dictionary = load_topic_model(fingerprint)
+    with section('RQ2', 'load_doc_topics'):
+        doc_topics = load_doc_topics(fingerprint)
     display_random_sample(sample_proposals)
+    display_search(pro_merged, lda_model, dictionary, fingerprint, version)
     st.write("__")
-    display_map(pro_merged)
+    display_map(pro_merged, version)
     st.write("")
     st.markdown("""
         ### 3. Major themes (topics)
@@ -522,9 +710,9 @@ def main():
         Topics range from enhancing public spaces like sports parks, playgrounds, and green areas to addressing functional improvements such as traffic infrastructure, lighting for safety, and outdoor fitness facilities.    
         Notably, Topic 2 reflects a unique characteristic of the Helsinki case: it centres on waterfront-related proposals, which is primarily due to the city’s extensive coastline and strong public interest in improving access to and the usability of coastal areas.
         """)
-    display_topics(lda_model, topic_summaries, top_proposals)
-    plot_topic_distribution(proposals_by_round_district, topic_summaries)
-    create_heatmap(proposals_by_round_district, topic_summaries, district_order)
+    display_topics(lda_model, topic_summaries, doc_topics, sample_proposals)
+    plot_topic_distribution(doc_topics, topic_summaries)
+    create_heatmap(doc_topics, topic_summaries, district_order)
     st.subheader('3.5 Predict Topics for New Proposals')
     st.write("""
         Once the model has been trained on historical data, it can be used to predict the topic distribution for new proposals submitted by citizens.
@@ -545,17 +733,40 @@ def main():
         
         ___________________________ Copy and paste the proposal text above __________________________
         """)
-    user_input = st.text_area(
-        "Enter text (or multiple texts separated by new lines):",
-        placeholder="Type your proposal here..."
-    )
-    if st.button("Predict Topics"):
-        if len(user_input.strip()) < 100:
-            st.warning("Please enter at least 100 characters for better prediction results.")
-        else:
-            st.write(f"**This is the input:** {user_input}")
-            prediction_results = predict_topics(user_input, dictionary, lda_model, topic_summaries)
-            display_bar_chart(prediction_results)
+    input_mode = st.radio("Score the input as", ["One proposal", "One proposal per line", "Uploaded CSV file"], horizontal=True)
+    if input_mode == "Uploaded CSV file":
+        uploaded_file = st.file_uploader("CSV file with one proposal per row", type="csv")
+        if uploaded_file is not None:
+            uploaded = pd.read_csv(uploaded_file)
+            text_columns = list(uploaded.columns)
+            text_column = st.selectbox("Column with the proposal text", text_columns, index=text_columns.index('texts') if 'texts' in text_columns else 0)
+            id_column = st.selectbox("Column identifying the rows", ["Row number"] + text_columns, help="Copied to the results so they can be joined back to the file.")
+            if st.button("Predict Topics"):
+                if id_column == "Row number":
+                    ids, id_label = pd.Series(uploaded.index + 1, index=uploaded.index), "row"
+                else:
+                    ids, id_label = uploaded[id_column], id_column
+                display_batch_predictions(uploaded[text_column], ids, id_label, dictionary, lda_model, topic_summaries)
+    else:
+        user_input = st.text_area(
+            "Enter text (or multiple texts separated by new lines):",
+            placeholder="Type your proposal here..."
+        )
+        if st.button("Predict Topics"):
+            if input_mode == "One proposal per line":
+                lines = pd.Series(user_input.splitlines(), dtype=object)
+                # Blank lines only separate proposals; line numbers still count them
+                lines = lines[lines.str.strip() != ""]
+                display_batch_predictions(lines, pd.Series(lines.index + 1, index=lines.index), "line", dictionary, lda_model, topic_summaries)
+            elif len(user_input.strip()) < MIN_TEXT_LENGTH:
+                st.warning(f"Please enter at least {MIN_TEXT_LENGTH} characters for better prediction results.")
+            else:
+                st.write(f"**This is the input:** {user_input}")
+                prediction_results = predict_topics(user_input, dictionary, lda_model, topic_summaries, fingerprint)
+                display_bar_chart(prediction_results)
+                cache_stats = get_prediction_cache().stats()
+                st.caption(f"Prediction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['size']} cached texts)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with section('RQ2', 'rerun'):
+        main()
\ No newline at end of file
@@ -1,74 +1,80 @@
 # Import libraries
 import streamlit as st
 import pandas as pd
+import numpy as np
 import re
-import streamlit_highcharts as hc
+from utils import datastore
+from utils.bundle import TOPIC_COLUMNS, data_version
+from utils.charts import render_chart, xy_pairs
+from utils.profiling import profiled, section
+from utils.correlation import correlation_matrix, district_level, proposal_level, significance_stars
+from utils.rankings import load_ranking_index
+from utils.similarity import FEATURE_GROUPS, load_district_similarity
 
 # Set page configuration
 st.set_page_config(page_title="🔗 RQ3: District Characteristics and Citizen Proposals", layout='wide')
 
-# Load data at the start to avoid reloading on every interaction
-@st.cache_data
+# Shared with the other pages through the data store, which loads each dataset once per process
+@profiled('RQ3')
 def load_data():
     """
     Load datasets required for district-level analysis.
     """
-    indexes = pd.read_csv('app/data/indexes.csv')  
-    weighted_averages_cleaned = pd.read_csv('app/data/weighted_averages_cleaned.csv')  # Compressed district statistics (2018-2023)
-    district_topic_data = pd.read_csv("app/data/district_topic_proportions.csv")
+    indexes = datastore.indexes()
+    weighted_averages_cleaned = datastore.weighted_averages()  # Compressed district statistics (2018-2023)
+    district_topic_data = datastore.district_topic_proportions()
     
     return indexes, weighted_averages_cleaned, district_topic_data
 indexes, weighted_averages_cleaned, district_topic_data = load_data()
 
+def load_proposal_topics():
+    """
+    Topic vectors of the individual proposals, used for the proposal-level correlations.
+    """
+    return datastore.sample_proposals()[['round', 'district'] + TOPIC_COLUMNS]
+
 district_list = sorted(weighted_averages_cleaned["Area"].unique())
 
 ### ---- 1. Time-Series Graph of Four Indices ---- ###
 def plot_indices_time_series(indexes, selected_district):
-    df = indexes[indexes["Area"] == selected_district]
-
     index_colors = {
         "Demographic Diversity Index": "blue",
         "Economic Prosperity Index": "green",
         "Socioeconomic Dependency Index": "red",
         "Public Service Accessibility Index": "orange"
     }
-    series_data = []
-    for index, color in index_colors.items():
-        series_data.append({
-            "name": index,
-            "data": [[int(year), float(value)] for year, value in zip(df["Year"], df[index])],
-            "color": color
-        })
 
-    options = {
-        "chart": {"type": "spline"},
-        "title": {"text": f"Four Indices Over Time: {selected_district}"},
-        "xAxis": {"title": {"text": "Year"}, "categories": df["Year"].tolist()},
-        "yAxis": {"title": {"text": "Index Value"}},
-        "series": series_data,
-        "legend": {"enabled": True}  
-    }
+    def build():
+        df = indexes[indexes["Area"] == selected_district]
+        years = df["Year"].to_numpy(dtype=int)
+        series_data = [
+            {"name": index, "data": xy_pairs(years, df[index]), "color": color}
+            for index, color in index_colors.items()
+        ]
+        return {
+            "chart": {"type": "spline"},
+            "title": {"text": f"Four Indices Over Time: {selected_district}"},
+            "xAxis": {"title": {"text": "Year"}, "categories": years.tolist()},
+            "yAxis": {"title": {"text": "Index Value"}},
+            "series": series_data,
+            "legend": {"enabled": True}  
+        }
 
-    hc.streamlit_highcharts(options)
+    render_chart("indices_time_series", selected_district, build)
 
 ### ---- 2. Ranking of District-Level Statistics ---- ###
-def plot_district_ranking(weighted_averages_cleaned, selected_district):
+def plot_district_ranking(ranking_index, selected_district):
     """
     Plot a Highcharts bar chart ranking the selected district's statistics against all other districts.
     """
-    df = weighted_averages_cleaned.set_index("Area")
-    rankings = {
-        column: (df[column].rank(ascending=False, method="min").loc[selected_district])
-        for column in df.columns if column != "Area"
-    }
-    rankings_df = pd.DataFrame.from_dict(rankings, orient="index", columns=["Rank"]).reset_index()
-    rankings_df = rankings_df.sort_values(by="Rank", ascending=True)
-    categories = rankings_df["index"].tolist()
-    data_values = rankings_df["Rank"].tolist()
-    gradient_colors = [
-        f"rgba(0, 0, 255, {0.2 + (0.8 * ((len(data_values) - i - 1) / len(data_values)))})"
-        for i in range(len(data_values))
-    ]
+    render_chart("district_ranking", selected_district, lambda: district_ranking_options(ranking_index, selected_district), height=1000)
+
+def district_ranking_options(ranking_index, selected_district):
+    rankings = ranking_index.row(selected_district).sort_values(kind="stable")
+    categories = rankings.index.tolist()
+    data_values = rankings.to_numpy().tolist()
+    alphas = 0.2 + (0.8 * ((len(data_values) - np.arange(len(data_values)) - 1) / len(data_values)))
+    gradient_colors = [f"rgba(0, 0, 255, {alpha})" for alpha in alphas.tolist()]
     options = {
         "chart": {"type": "bar", "height": 1000},  
         "title": {"text": f"District Ranking (2018-2023) for {selected_district}"},
@@ -109,8 +115,7 @@ def plot_district_ranking(weighted_averages_cleaned, selected_district):
             }
         }
     }
-
-    hc.streamlit_highcharts(options, height=1000)
+    return options
 
 def display_topic_trends(district_topic_data, selected_district, topic_colors=None):
 
@@ -125,54 +130,6 @@ def display_topic_trends(district_topic_data, selected_district, topic_colors=No
             "Topic_7_Developing_Spaces_for_Children_and_Youth": "#e377c2",
         }
 
-    filtered_data = district_topic_data[district_topic_data["district"] == selected_district].sort_values(by="Year")
-    filtered_data["Year"] = filtered_data["Year"].astype(int)
-    min_value = filtered_data["Proportion"].min() * 100 if not filtered_data.empty else 0
-    max_value = filtered_data["Proportion"].max() * 100 if not filtered_data.empty else 100
-    y_min = max(0, min_value - 5)  
-    y_max = max_value + 5  
-    series_data = []
-    for topic in filtered_data["Topic"].unique():
-        topic_df = filtered_data[filtered_data["Topic"] == topic].sort_values(by="Year")
-        series_data.append({
-            "name": re.sub(r"Topic_\d+_", "", topic).replace("_", " "),  
-            "data": [[int(year), float(prop) * 100] for year, prop in zip(topic_df["Year"], topic_df["Proportion"])],
-            "color": topic_colors.get(topic, "#999999"),
-            "marker": {"enabled": True, "radius": 4},  
-            "lineWidth": 2,
-            "states": {"inactive": {"opacity": 0.2}},  
-            "dashStyle": "Solid" if "Enhancing" in topic else "Dash",  
-        })
-
-    chart_options = {
-        "chart": {
-            "type": "spline",  
-            "events": {"load": "function() { initializeOpacity(this); }"}  
-        },
-        "title": {"text": f"Topic Trends Over Time in {selected_district}"},
-        "xAxis": {"title": {"text": "Year"}, "categories": [int(year) for year in sorted(filtered_data["Year"].unique())]},
-        "yAxis": {"title": {"text": "Proportion (%)"}, "min": y_min, "max": y_max},
-        "legend": {"layout": "horizontal", "align": "center", "verticalAlign": "bottom"},
-        "series": series_data,
-        "tooltip": {
-            "formatter": """function() { 
-                return '<b>' + this.series.name + '</b><br>' + 
-                '<b>Year:</b> ' + this.x + '<br>' + 
-                '<b>Proportion:</b> ' + this.y.toFixed(2) + '%'; 
-            }"""
-        },
-        "plotOptions": {
-            "series": {
-                "states": {
-                    "inactive": {"opacity": 0.2}  
-                },
-                "events": {
-                    "legendItemClick": "function() { toggleSeries(this); return false; }"  # Custom click behavior
-                }
-            }
-        }
-    }
-
     highlight_script = """
     function initializeOpacity(chart) {
         chart.series.forEach(function(series) {
@@ -189,10 +146,165 @@ def display_topic_trends(district_topic_data, selected_district, topic_colors=No
         });
     }
     """
-    chart_options["chart"]["events"]["load"] = highlight_script
-    hc.streamlit_highcharts(chart_options, height=500)
+
+    def build():
+        filtered_data = district_topic_data[district_topic_data["district"] == selected_district].sort_values(by="Year")
+        # Topics x years matrix of percentages, filled in one scatter rather than per topic
+        topic_codes, topics = pd.factorize(filtered_data["Topic"].to_numpy())
+        years, year_codes = np.unique(filtered_data["Year"].to_numpy(dtype=int), return_inverse=True)
+        proportions = np.full((len(topics), len(years)), np.nan)
+        proportions[topic_codes, year_codes] = filtered_data["Proportion"].to_numpy(dtype=float) * 100
+        y_min = max(0, np.nanmin(proportions) - 5) if proportions.size else 0
+        y_max = np.nanmax(proportions) + 5 if proportions.size else 105
+        series_data = []
+        for topic, row in zip(topics, proportions):
+            present = ~np.isnan(row)
+            series_data.append({
+                "name": re.sub(r"Topic_\d+_", "", topic).replace("_", " "),  
+                "data": xy_pairs(years[present], row[present]),
+                "color": topic_colors.get(topic, "#999999"),
+                "marker": {"enabled": True, "radius": 4},  
+                "lineWidth": 2,
+                "states": {"inactive": {"opacity": 0.2}},  
+                "dashStyle": "Solid" if "Enhancing" in topic else "Dash",  
+            })
+
+        chart_options = {
+            "chart": {
+                "type": "spline",  
+                "events": {"load": "function() { initializeOpacity(this); }"}  
+            },
+            "title": {"text": f"Topic Trends Over Time in {selected_district}"},
+            "xAxis": {"title": {"text": "Year"}, "categories": years.tolist()},
+            "yAxis": {"title": {"text": "Proportion (%)"}, "min": float(y_min), "max": float(y_max)},
+            "legend": {"layout": "horizontal", "align": "center", "verticalAlign": "bottom"},
+            "series": series_data,
+            "tooltip": {
+                "formatter": """function() { 
+                return '<b>' + this.series.name + '</b><br>' + 
+                '<b>Year:</b> ' + this.x + '<br>' + 
+                '<b>Proportion:</b> ' + this.y.toFixed(2) + '%'; 
+            }"""
+            },
+            "plotOptions": {
+                "series": {
+                    "states": {
+                        "inactive": {"opacity": 0.2}  
+                    },
+                    "events": {
+                        "legendItemClick": "function() { toggleSeries(this); return false; }"  # Custom click behavior
+                    }
+                }
+            }
+        }
+
+        chart_options["chart"]["events"]["load"] = highlight_script
+        return chart_options
+
+    render_chart("topic_trends", selected_district, build, height=500)
     
 
+### ---- 4. Similar Districts ---- ###
+def display_similar_districts(selected_district):
+    """
+    List the districts whose profiles are closest to the selected one.
+    """
+    st.write(f"#### Districts Similar to {selected_district}")
+    col1, col2, col3 = st.columns([4, 2, 2])
+    with col1:
+        groups = st.multiselect(
+            "Compare on",
+            FEATURE_GROUPS,
+            default=list(FEATURE_GROUPS),
+            format_func=lambda group: {"statistics": "District statistics", "indices": "Four indices", "topics": "Proposal topics"}[group],
+        )
+    with col2:
+        metric = st.radio("Distance", ["cosine", "mahalanobis"], format_func=str.capitalize, horizontal=True)
+    with col3:
+        k = st.slider("Number of districts", 1, 10, 5)
+    if not groups:
+        st.info("Select at least one feature group to compare districts on.")
+        return
+    with section('RQ3', 'similar_districts'):
+        neighbours = load_district_similarity(data_version()).neighbours(selected_district, k, groups, metric)
+    st.dataframe(neighbours, hide_index=True, column_config={"Distance": st.column_config.NumberColumn(format="%.3f")})
+
+### ---- 5. Correlations between Indices and Topics ---- ###
+INDEX_COLUMNS = [
+    "Economic Prosperity Index",
+    "Socioeconomic Dependency Index",
+    "Public Service Accessibility Index",
+    "Demographic Diversity Index",
+]
+
+@st.cache_data(max_entries=64)
+def compute_correlations(level, years, districts, method, permutations, version=None):
+    """
+    Correlation and p-value matrices (topics x indices) for one combination of filters. `version`
+    keys the cache on the bundle, whose tables are read from the page's globals.
+    """
+    if level == "Proposals":
+        joined = proposal_level(load_proposal_topics(), indexes)
+    else:
+        joined = district_level(district_topic_data, indexes)
+    joined = joined[joined["Year"].isin(years) & joined["Area"].isin(districts)]
+    topics = [col for col in joined.columns if col.startswith("Topic_")]
+    r, p = correlation_matrix(joined[topics], joined[INDEX_COLUMNS], method.lower(), permutations)
+    return pd.DataFrame(r, index=topics, columns=INDEX_COLUMNS), pd.DataFrame(p, index=topics, columns=INDEX_COLUMNS), len(joined)
+
+def display_correlation_heatmap():
+    col1, col2, col3, col4 = st.columns([2, 2, 3, 2])
+    with col1:
+        level = st.radio("Unit of analysis", ["Proposals", "District and year"], help="Correlate individual proposals' topic vectors, or the mean topic proportions of each district and year, with the district's indices.")
+    with col2:
+        method = st.radio("Coefficient", ["Pearson", "Spearman"])
+    with col3:
+        # Rounds with both topic proportions and indices, so ingested rounds show up once aggregated
+        year_options = sorted(int(year) for year in set(district_topic_data["Year"]) & set(indexes["Year"]))
+        years = st.multiselect("Years", year_options, default=year_options, format_func=lambda year: f"{year} (round {(year - 2016) // 2})")
+        districts = st.multiselect("Districts", district_list, placeholder="All districts")
+    with col4:
+        permutations = 999 if st.checkbox("Permutation test", help="Estimate p-values from 999 random shuffles instead of the t distribution.") else 0
+
+    with section('RQ3', 'compute_correlations'):
+        r, p, n = compute_correlations(level, tuple(sorted(years)), tuple(districts or district_list), method, permutations, data_version())
+    if n < 3:
+        st.warning("Not enough observations for the selected filters.")
+        return
+    def build():
+        stars = significance_stars(p.to_numpy())
+        data = [
+            {
+                "x": j,
+                "y": i,
+                "value": None if pd.isna(r.iat[i, j]) else round(float(r.iat[i, j]), 4),
+                "p": None if pd.isna(p.iat[i, j]) else float(p.iat[i, j]),
+                "label": "" if pd.isna(r.iat[i, j]) else f"{r.iat[i, j]:.4f}{stars[i, j]}",
+            }
+            for i in range(len(r.index))
+            for j in range(len(r.columns))
+        ]
+        options = {
+            "chart": {"type": "heatmap", "height": 600},
+            "title": {"text": f"{method} correlation between indices and topic proportions"},
+            "subtitle": {"text": f"n = {n} {'proposals' if level == 'Proposals' else 'district-years'}; * p < 0.1, ** p < 0.05, *** p < 0.01"},
+            "xAxis": {"categories": list(r.columns)},
+            "yAxis": {"categories": [re.sub(r"Topic_\d+_", "", topic).replace("_", " ") for topic in r.index], "title": None, "reversed": True},
+            "colorAxis": {"min": -1, "max": 1, "stops": [[0, "#3b4cc0"], [0.5, "#f7f7f7"], [1, "#b40426"]]},
+            "legend": {"align": "right", "layout": "vertical", "verticalAlign": "middle"},
+            "tooltip": {"headerFormat": "", "pointFormat": "r = <b>{point.value:.4f}</b><br>p = {point.p:.4g}"},
+            "series": [{
+                "name": "Correlation",
+                "data": data,
+                "borderWidth": 1,
+                "dataLabels": {"enabled": True, "format": "{point.label}", "style": {"textOutline": "none", "fontWeight": "normal"}},
+            }],
+        }
+        return options
+
+    key = (level, tuple(sorted(years)), tuple(districts or district_list), method, permutations)
+    render_chart("correlation_heatmap", key, build, height=600)
+
 def main():
     """
     Main function to run the Streamlit app.
@@ -221,13 +333,16 @@ def main():
         plot_indices_time_series(indexes, selected_district)
         display_topic_trends(district_topic_data, selected_district)
     with col2:
-        plot_district_ranking(weighted_averages_cleaned, selected_district)
+        plot_district_ranking(load_ranking_index(data_version()), selected_district)
+    st.write("")
+    display_similar_districts(selected_district)
     st.write("")
-    st.write('#### Pearson Correlation Coefficients between District Characteristics and Citizen Proposal Topics')
+    st.write('#### Correlation Coefficients between District Characteristics and Citizen Proposal Topics')
     st.write("")
     st.markdown(
     """
-    The matrix below shows the Pearson correlation coefficients between four district-level indices and the thematic focus of citizen proposals.  
+    The matrix below shows the Pearson correlation coefficients between four district-level indices and the thematic focus of individual citizen proposals.  
+    Use the controls to switch to Spearman correlations or permutation tests, or to restrict the analysis to particular voting rounds or districts.  
     Significance levels are marked as: `*` (*p* < 0.1), `**` (*p* < 0.05), `***` (*p* < 0.01).  
 
     The analysis reveals how local socioeconomic and infrastructural conditions relate to citizens’ priorities in participatory budgeting.  
@@ -237,7 +352,7 @@ def main():
     Notably, the Public Service Accessibility Index also shows positive links with Topic 3 and Topic 6 (*Community Events and Participatory Programmes*), implying that better service access may foster proposals that enhance community life rather than address basic infrastructure gaps.
     """
     )
-    st.image('app/data/correlation_heatmap.png')
+    display_correlation_heatmap()
     st.write("")
     st.markdown(
         """
@@ -247,4 +362,5 @@ def main():
         """
     )
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with section('RQ3', 'rerun'):
+        main()
\ No newline at end of file
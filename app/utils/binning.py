@@ -0,0 +1,159 @@
+# Import libraries
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+from utils.geometry import METRIC_CRS
+
+# Cell size in metres precomputed for each map zoom level
+ZOOM_CELL_SIZES = {11: 2000, 12: 1000, 13: 500, 14: 250}
+
+SQRT3 = np.sqrt(3)
+
+_to_metric = Transformer.from_crs(4326, METRIC_CRS, always_xy=True)
+_to_lonlat = Transformer.from_crs(METRIC_CRS, 4326, always_xy=True)
+
+
+def hex_cells(x, y, size):
+    """
+    Axial (q, r) coordinates of the pointy-top hexagon of circumradius `size` containing each point.
+    """
+    q = (SQRT3 / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    # Cube rounding: round all three coordinates and fix the one with the largest error
+    cx, cz = q, r
+    cy = -cx - cz
+    rx, ry, rz = np.round(cx), np.round(cy), np.round(cz)
+    dx, dy, dz = np.abs(rx - cx), np.abs(ry - cy), np.abs(rz - cz)
+    fix_x = (dx > dy) & (dx > dz)
+    fix_z = ~fix_x & (dz >= dy)
+    rx = np.where(fix_x, -ry - rz, rx)
+    rz = np.where(fix_z, -rx - ry, rz)
+    return rx.astype(np.int64), rz.astype(np.int64)
+
+
+def hex_polygons(q, r, size):
+    cx = size * SQRT3 * (q + r / 2)
+    cy = size * 1.5 * r
+    angles = np.deg2rad(60 * np.arange(6) - 30)
+    xs = cx[:, None] + size * np.cos(angles)[None, :]
+    ys = cy[:, None] + size * np.sin(angles)[None, :]
+    return xs, ys
+
+
+def square_polygons(i, j, size):
+    x0, y0 = i * size, j * size
+    xs = np.stack([x0, x0 + size, x0 + size, x0], axis=1)
+    ys = np.stack([y0, y0, y0 + size, y0 + size], axis=1)
+    return xs, ys
+
+
+class ProposalBins:
+    """
+    Spatial aggregation of geolocated proposals into hexagon or square bins and districts.
+
+    Points are projected once and their bin assignment is computed once per (shape, cell size),
+    so filtering only re-runs the bincounts. Each bin carries the number of proposals, the share
+    selected in the vote, the mean adjusted budget and the dominant topic.
+    """
+
+    def __init__(self, proposals, topic_mixtures=None):
+        proposals = proposals.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+        self.proposals = proposals
+        self.x, self.y = _to_metric.transform(proposals['longitude'].to_numpy(), proposals['latitude'].to_numpy())
+        self.selected = (proposals['selected'] == 'Selected').to_numpy(dtype=float)
+        self.budget = proposals['adj_budget'].to_numpy(dtype=float)
+        self.topics = None
+        if topic_mixtures is not None:
+            # Topic vectors aligned to the proposals by (id, round); proposals without one get zeros
+            keys = ['id', 'round']
+            mixtures = topic_mixtures.drop_duplicates(keys).astype({key: 'int64' for key in keys})
+            aligned = proposals[keys].astype('int64').merge(mixtures, on=keys, how='left')
+            self.topic_names = [col for col in mixtures.columns if col not in keys]
+            self.topics = aligned[self.topic_names].fillna(0).to_numpy(dtype=float)
+        self._cells = {}
+
+    def cells(self, shape, cell_size):
+        key = (shape, cell_size)
+        if key not in self._cells:
+            if shape == 'hex':
+                a, b = hex_cells(self.x, self.y, cell_size / SQRT3)
+            else:
+                a, b = np.floor(self.x / cell_size).astype(np.int64), np.floor(self.y / cell_size).astype(np.int64)
+            self._cells[key] = (a, b)
+        return self._cells[key]
+
+    def aggregate(self, codes, mask=None):
+        """
+        Aggregate the proposals grouped by the integer `codes` (one per proposal).
+        """
+        if mask is not None:
+            codes = np.where(mask, codes, -1)
+        keep = codes >= 0
+        bins, inverse = np.unique(codes[keep], return_inverse=True)
+        count = np.bincount(inverse, minlength=len(bins))
+        selected = np.bincount(inverse, weights=self.selected[keep], minlength=len(bins))
+        has_budget = ~np.isnan(self.budget[keep])
+        budget_sum = np.bincount(inverse[has_budget], weights=self.budget[keep][has_budget], minlength=len(bins))
+        budget_count = np.bincount(inverse[has_budget], minlength=len(bins))
+        result = pd.DataFrame({
+            'code': bins,
+            'count': count,
+            'selected_ratio': selected / count,
+            'mean_budget': np.divide(budget_sum, budget_count, out=np.full(len(bins), np.nan), where=budget_count > 0),
+        })
+        if self.topics is not None:
+            topics = self.topics[keep]
+            sums = np.stack([np.bincount(inverse, weights=topics[:, k], minlength=len(bins)) for k in range(topics.shape[1])], axis=1)
+            result['dominant_topic'] = np.where(sums.sum(axis=1) > 0, sums.argmax(axis=1), -1)
+        return result
+
+    def grid(self, cell_size, shape='hex', mask=None):
+        """
+        Aggregate into a hexagon ('hex') or square ('square') grid and attach the bin outlines.
+        """
+        a, b = self.cells(shape, cell_size)
+        # Pack both cell coordinates into one integer code so a single np.unique groups them
+        offset = 1 << 20
+        codes = (a + offset) * (offset << 1) + (b + offset)
+        bins = self.aggregate(codes, mask)
+        a_bins, b_bins = bins['code'] // (offset << 1) - offset, bins['code'] % (offset << 1) - offset
+        if shape == 'hex':
+            xs, ys = hex_polygons(a_bins.to_numpy(), b_bins.to_numpy(), cell_size / SQRT3)
+        else:
+            xs, ys = square_polygons(a_bins.to_numpy(), b_bins.to_numpy(), cell_size)
+        lons, lats = _to_lonlat.transform(xs, ys)
+        bins['ring'] = list(np.stack([lons, lats], axis=2).round(6))
+        return bins
+
+    def districts(self, geometry, mask=None):
+        """
+        Aggregate by the district polygon each proposal falls in (`geometry` is a DistrictGeometry).
+        """
+        import geopandas as gpd
+        points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(self.proposals['longitude'], self.proposals['latitude']), crs=4326)
+        joined = gpd.sjoin(points, geometry.gdf, how='left', predicate='within')
+        joined = joined[~joined.index.duplicated()]
+        codes = joined['index_right'].fillna(-1).to_numpy(dtype=np.int64)
+        bins = self.aggregate(codes, mask)
+        bins['Area'] = geometry.areas.to_numpy()[bins['code']]
+        bins['geometry'] = geometry.gdf.geometry.to_numpy()[bins['code']]
+        return bins
+
+
+def bins_to_geojson(bins, properties):
+    """
+    Build a GeoJSON FeatureCollection from grid or district bins, keeping only `properties`.
+    """
+    records = bins[properties].astype(object).where(bins[properties].notna(), None).to_dict('records')
+    if 'ring' in bins:
+        geometries = [{'type': 'Polygon', 'coordinates': [ring.tolist() + [ring[0].tolist()]]} for ring in bins['ring']]
+    else:
+        geometries = [geom.__geo_interface__ for geom in bins['geometry']]
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'properties': record, 'geometry': geom}
+            for record, geom in zip(records, geometries)
+        ],
+    }
@@ -0,0 +1,275 @@
+# Import libraries
+import argparse
+import hashlib
+import json
+import os
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+DATA_DIR = 'app/data'
+BUNDLE_DIR = 'app/data/bundle'
+MANIFEST_FILE = 'manifest.json'
+# When the pro_merged.csv snapshot was merged; the bundle reports it until proposals are ingested
+SNAPSHOT_DATE = '2025-07-07'
+
+TOPIC_COLUMNS = [f"Topic_{i}" for i in range(7)]
+# District of proposals without coordinates or outside every district
+NO_LOCATION = 'location_not_specified'
+
+# Explicit schema for every CSV in app/data. Columns not listed keep the dtype pandas infers.
+TABLES = {
+    'district_data': {
+        'categorical': ['Area'],
+        'dtypes': {'id': 'int32', 'Year': 'int16'},
+    },
+    'district_topic_proportions': {
+        'categorical': ['district', 'Topic'],
+        'dtypes': {'Year': 'int16', 'Proportion': 'float64'},
+    },
+    'indexes': {
+        'categorical': ['Area'],
+        'dtypes': {'Year': 'int16'},
+    },
+    'pro_merged': {
+        'categorical': ['district', 'areaScope', 'state', 'selected'],
+        'dtypes': {'id': 'int32', 'round': 'int8'},
+    },
+    'proposals_by_round_district': {
+        'categorical': ['district'],
+        'dtypes': {'round': 'int8', 'selected': 'bool', **{col: 'float64' for col in TOPIC_COLUMNS}},
+    },
+    'sample_proposals': {
+        'categorical': ['district', 'top_topic'],
+        'dtypes': {'id': 'int32', 'round': 'int8', **{col: 'float64' for col in TOPIC_COLUMNS}},
+    },
+    'topic_numbers': {
+        'categorical': [],
+        'dtypes': {'topic': 'int16'},
+    },
+    'weighted_averages_cleaned': {
+        'categorical': ['Area'],
+        'dtypes': {},
+    },
+}
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def apply_schema(df, name):
+    """
+    Cast a frame read from CSV to the dtypes declared for `name` in TABLES.
+    """
+    schema = TABLES[name]
+    dtypes = {col: dtype for col, dtype in schema['dtypes'].items() if col in df.columns}
+    dtypes.update({col: 'category' for col in schema['categorical'] if col in df.columns})
+    return df.astype(dtypes)
+
+
+def read_csv(name, columns=None, data_dir=DATA_DIR):
+    df = pd.read_csv(os.path.join(data_dir, f'{name}.csv'), usecols=columns)
+    return apply_schema(df, name)
+
+
+def load_manifest(bundle_dir=BUNDLE_DIR):
+    path = os.path.join(bundle_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, bundle_dir=BUNDLE_DIR):
+    """
+    Stamp the manifest with a new version token and replace it atomically, so a running
+    dashboard never reads a half-written file.
+    """
+    hashes = {name: [entry['sha256']] + [s['sha256'] for s in entry.get('segments', [])] for name, entry in manifest['tables'].items()}
+    manifest['version'] = hashlib.sha256(json.dumps(hashes, sort_keys=True).encode()).hexdigest()[:12]
+    path = os.path.join(bundle_dir, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+# Manifest path -> (mtime, size, version token), so data_version() only parses the manifest
+# after it has been replaced
+_versions = {}
+
+
+def data_version(bundle_dir=BUNDLE_DIR):
+    """
+    Token that changes whenever the bundle is rebuilt or proposals are appended; the pages key
+    their data caches on it. None when the pages read the CSVs. Costs one stat() per call
+    unless the manifest has changed.
+    """
+    path = os.path.join(bundle_dir, MANIFEST_FILE)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    cached = _versions.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    manifest = load_manifest(bundle_dir)
+    version = manifest.get('version') if manifest is not None else None
+    _versions[path] = (stat.st_mtime_ns, stat.st_size, version)
+    return version
+
+
+def data_updated(bundle_dir=BUNDLE_DIR):
+    """
+    Date of the latest proposals, e.g. "7 Jul, 2025".
+    """
+    manifest = load_manifest(bundle_dir)
+    updated = date.fromisoformat((manifest or {}).get('updated', SNAPSHOT_DATE))
+    return f"{updated.day} {updated:%b, %Y}"
+
+
+def read_table(name, columns=None, bundle_dir=BUNDLE_DIR, data_dir=DATA_DIR):
+    """
+    Load table `name` as a DataFrame, materialising only `columns`.
+
+    Reads the memory-mapped Arrow file from the bundle when it has been built and falls
+    back to the CSV in app/data otherwise, so both paths return the same dtypes. Segments
+    appended by utils.ingest are concatenated after the base table.
+    """
+    manifest = load_manifest(bundle_dir)
+    if manifest is None or name not in manifest['tables']:
+        return read_csv(name, columns, data_dir)
+    entry = manifest['tables'][name]
+    path = os.path.join(bundle_dir, entry['file'])
+    table = feather.read_table(path, columns=columns, memory_map=True)
+    if not entry.get('segments'):
+        return table.to_pandas()
+    frames = [table.to_pandas()] + [
+        feather.read_table(os.path.join(bundle_dir, segment['file']), columns=columns, memory_map=True).to_pandas()
+        for segment in entry['segments']
+    ]
+    return apply_schema(pd.concat(frames, ignore_index=True), name)
+
+
+def segment_schema(schema):
+    """
+    `schema` with dictionary columns stored as plain strings: every batch of a segment would
+    otherwise carry its own dictionary, which the IPC file format does not allow.
+    """
+    return pa.schema([
+        pa.field(field.name, field.type.value_type if pa.types.is_dictionary(field.type) else field.type)
+        for field in schema
+    ])
+
+
+def append_segment(name, frames, bundle_dir=BUNDLE_DIR):
+    """
+    Write the DataFrames yielded by `frames` into one new Arrow segment of table `name`, a batch
+    at a time, and register it in the manifest. Returns the number of rows written; nothing is
+    written when `frames` is empty.
+    """
+    manifest = load_manifest(bundle_dir)
+    if manifest is None or name not in manifest['tables']:
+        raise ValueError(f"{name} is not in the bundle; build it first with: PYTHONPATH=app python -m utils.bundle")
+    entry = manifest['tables'][name]
+    segments = entry.setdefault('segments', [])
+    schema = segment_schema(pa.ipc.open_file(pa.memory_map(os.path.join(bundle_dir, entry['file']))).schema)
+    file = f'{name}-{len(segments) + 1:05d}.arrow'
+    path = os.path.join(bundle_dir, file)
+    rows, writer = 0, None
+    try:
+        for df in frames:
+            batch = pa.RecordBatch.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+            if writer is None:
+                writer = pa.ipc.new_file(path + '.tmp', schema)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(path + '.tmp')
+        raise
+    if writer is None:
+        return 0
+    writer.close()
+    os.replace(path + '.tmp', path)
+    segments.append({'file': file, 'rows': rows, 'sha256': file_hash(path)})
+    manifest['updated'] = date.today().isoformat()
+    write_manifest(manifest, bundle_dir)
+    return rows
+
+
+def build_bundle(data_dir=DATA_DIR, bundle_dir=BUNDLE_DIR):
+    """
+    Convert every CSV in TABLES into an uncompressed Arrow IPC file and write a manifest
+    with the row count, schema and content hashes of both the source and the output.
+
+    Segments appended by utils.ingest are kept, since their proposals are not in the CSVs
+    until `python -m utils.ingest --compact` writes them back.
+    """
+    os.makedirs(bundle_dir, exist_ok=True)
+    previous = load_manifest(bundle_dir) or {'tables': {}}
+    manifest = {'format': 'arrow-ipc', 'updated': previous.get('updated', SNAPSHOT_DATE), 'tables': {}}
+    for name in TABLES:
+        source = os.path.join(data_dir, f'{name}.csv')
+        df = read_csv(name, data_dir=data_dir)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        output = os.path.join(bundle_dir, f'{name}.arrow')
+        # Uncompressed so the file can be memory-mapped without a decode step
+        feather.write_feather(table, output, compression='uncompressed')
+        manifest['tables'][name] = {
+            'file': f'{name}.arrow',
+            'rows': table.num_rows,
+            'schema': {field.name: str(field.type) for field in table.schema},
+            'source_sha256': file_hash(source),
+            'sha256': file_hash(output),
+        }
+        segments = previous['tables'].get(name, {}).get('segments')
+        if segments:
+            manifest['tables'][name]['segments'] = segments
+        print(f"{name}: {table.num_rows} rows -> {output}" + (f" (+{sum(s['rows'] for s in segments)} ingested)" if segments else ""))
+    write_manifest(manifest, bundle_dir)
+    return manifest
+
+
+def check_bundle(data_dir=DATA_DIR, bundle_dir=BUNDLE_DIR):
+    """
+    Return the names of tables whose source CSV or bundle file no longer match the manifest.
+    """
+    manifest = load_manifest(bundle_dir)
+    if manifest is None:
+        return list(TABLES)
+    stale = []
+    for name in TABLES:
+        entry = manifest['tables'].get(name)
+        output = os.path.join(bundle_dir, f'{name}.arrow')
+        if (
+            entry is None
+            or not os.path.exists(output)
+            or entry['source_sha256'] != file_hash(os.path.join(data_dir, f'{name}.csv'))
+            or entry['sha256'] != file_hash(output)
+            or any(
+                not os.path.exists(os.path.join(bundle_dir, segment['file']))
+                or segment['sha256'] != file_hash(os.path.join(bundle_dir, segment['file']))
+                for segment in entry.get('segments', [])
+            )
+        ):
+            stale.append(name)
+    return stale
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the columnar data bundle from the CSVs in app/data.")
+    parser.add_argument('--check', action='store_true', help="only report tables that are out of date")
+    args = parser.parse_args()
+    if args.check:
+        stale = check_bundle()
+        print("Bundle is up to date." if not stale else f"Out of date: {', '.join(stale)}")
+        raise SystemExit(1 if stale else 0)
+    build_bundle()
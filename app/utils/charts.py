@@ -0,0 +1,122 @@
+# Import libraries
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+import streamlit_highcharts as hc
+from streamlit.logger import get_logger
+
+from utils.bundle import data_version
+from utils.profiling import section
+
+logger = get_logger(__name__)
+
+
+class ChartCache:
+    """
+    Highcharts options built once per (chart, key) and shared across reruns and sessions.
+
+    Each entry is serialised to JSON when it is built, which both checks it contains no NumPy
+    scalars and records its payload size. Build times are collected per chart name so the
+    expensive charts are easy to spot.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(self, name, key, build):
+        cache_key = (name, key)
+        with self._lock:
+            stats = self._stats.setdefault(name, {'builds': 0, 'hits': 0, 'build_ms': 0.0, 'last_build_ms': 0.0, 'payload_bytes': 0})
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                stats['hits'] += 1
+                return self._entries[cache_key][0]
+        start = time.perf_counter()
+        options = build()
+        payload = json.dumps(options, ensure_ascii=False)
+        elapsed = (time.perf_counter() - start) * 1000
+        logger.debug("Built chart %s %r in %.1f ms (%d bytes)", name, key, elapsed, len(payload))
+        with self._lock:
+            self._entries[cache_key] = (options, payload)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            stats['builds'] += 1
+            stats['build_ms'] += elapsed
+            stats['last_build_ms'] = elapsed
+            stats['payload_bytes'] = len(payload)
+        return options
+
+    def payload(self, name, key):
+        """
+        The JSON serialisation of a cached chart, or None if it is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get((name, key))
+        return entry[1] if entry is not None else None
+
+    def stats(self):
+        """
+        Per-chart build counts, cache hits, mean and last build time (ms) and payload size.
+        """
+        with self._lock:
+            return {
+                name: {**stats, 'mean_build_ms': stats['build_ms'] / stats['builds'] if stats['builds'] else 0.0}
+                for name, stats in self._stats.items()
+            }
+
+
+@st.cache_resource
+def get_chart_cache():
+    return ChartCache()
+
+
+def render_chart(name, key, build, height=None):
+    """
+    Render a Highcharts chart whose options come from `build()`, built only once per (name, key)
+    and data version, so charts are rebuilt after the bundle is rebuilt or proposals are ingested.
+    """
+    cache = get_chart_cache()
+    key = (data_version(), key)
+    with section('charts', name) as timer:
+        options = cache.get_or_build(name, key, build)
+        timer.payload(lambda: cache.payload(name, key))
+        if height is None:
+            hc.streamlit_highcharts(options)
+        else:
+            hc.streamlit_highcharts(options, height=height)
+
+
+def plain_values(values, decimals=None):
+    """
+    A float array as a list of Python floats, with NaN as None so it serialises to null.
+    """
+    values = np.asarray(values, dtype=float)
+    if decimals is not None:
+        values = values.round(decimals)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def xy_pairs(x, y, decimals=None):
+    """
+    [[x, y], ...] built column-wise instead of point by point.
+    """
+    return [list(point) for point in zip(np.asarray(x).tolist(), plain_values(y, decimals))]
+
+
+def heatmap_points(values, decimals=None):
+    """
+    Highcharts heatmap points [[x, y, value], ...] for a 2-D array indexed [x, y], listing every
+    x of the first y category first.
+    """
+    values = np.asarray(values, dtype=float)
+    nx, ny = values.shape
+    xs = np.tile(np.arange(nx), ny).tolist()
+    ys = np.repeat(np.arange(ny), nx).tolist()
+    return [list(point) for point in zip(xs, ys, plain_values(values.T.ravel(), decimals))]
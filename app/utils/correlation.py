@@ -0,0 +1,87 @@
+"""
+Correlations between the district indices and proposal topic proportions.
+
+All index x topic coefficients and their p-values are computed in one matrix product over
+standardised columns rather than pair by pair. Spearman correlations are Pearson correlations
+of the ranks. Permutation p-values shuffle the topic rows and reuse the same product.
+"""
+# Import libraries
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from utils.bundle import TOPIC_COLUMNS
+from utils.topic_aggregation import round_year, topic_label
+
+SIGNIFICANCE_LEVELS = [(0.01, '***'), (0.05, '**'), (0.1, '*')]
+
+
+def _standardise(matrix):
+    centred = matrix - matrix.mean(axis=0)
+    norm = np.sqrt((centred ** 2).sum(axis=0))
+    return centred / np.where(norm > 0, norm, np.nan)
+
+
+def correlation_matrix(x, y, method='pearson', permutations=0, seed=0):
+    """
+    Correlation coefficients and two-sided p-values between every column of `x` (n x p)
+    and every column of `y` (n x q). Returns two p x q arrays.
+
+    p-values come from the t distribution with n - 2 degrees of freedom, as in
+    scipy.stats.pearsonr/spearmanr, or from `permutations` random shuffles of `y` when given.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n = len(x)
+    if method == 'spearman':
+        x, y = stats.rankdata(x, axis=0), stats.rankdata(y, axis=0)
+    zx, zy = _standardise(x), _standardise(y)
+    r = np.clip(zx.T @ zy, -1.0, 1.0)
+    if n < 3:
+        return r, np.full(r.shape, np.nan)
+
+    if permutations:
+        rng = np.random.default_rng(seed)
+        exceed = np.zeros(r.shape)
+        for _ in range(permutations):
+            exceed += np.abs(zx.T @ zy[rng.permutation(n)]) >= np.abs(r) - 1e-12
+        return r, (exceed + 1) / (permutations + 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = r * np.sqrt((n - 2) / (1 - r ** 2))
+    return r, 2 * stats.t.sf(np.abs(t), n - 2)
+
+
+def significance_stars(p_values):
+    stars = np.full(np.shape(p_values), '', dtype=object)
+    for level, marker in reversed(SIGNIFICANCE_LEVELS):
+        stars = np.where(np.asarray(p_values) < level, marker, stars)
+    return stars
+
+
+def proposal_level(proposals, indexes):
+    """
+    One row per proposal: its topic vector next to the indices of its district in the round's year.
+    """
+    proposals = proposals.dropna(subset=['district'])
+    joined = pd.DataFrame({
+        'Area': proposals['district'].astype(str).to_numpy(),
+        'Year': [round_year(int(r)) for r in proposals['round']],
+        'round': proposals['round'].astype(int).to_numpy(),
+    })
+    topics = proposals[TOPIC_COLUMNS].to_numpy(dtype=float)
+    joined[[topic_label(k) for k in range(len(TOPIC_COLUMNS))]] = topics
+    indexes = indexes.assign(Area=indexes['Area'].astype(str))
+    return joined.merge(indexes, on=['Area', 'Year'], how='inner')
+
+
+def district_level(district_topic_data, indexes):
+    """
+    One row per district and year: mean topic proportions next to the district's indices.
+    """
+    wide = district_topic_data.assign(district=district_topic_data['district'].astype(str)).pivot_table(
+        index=['district', 'Year'], columns='Topic', values='Proportion', observed=True
+    )
+    wide = wide.reset_index().rename(columns={'district': 'Area'})
+    wide.columns.name = None
+    indexes = indexes.assign(Area=indexes['Area'].astype(str))
+    return wide.merge(indexes, on=['Area', 'Year'], how='inner')
@@ -0,0 +1,173 @@
+"""
+One shared, read-only copy of each dataset the pages use.
+
+Every page used to load its own tables in a `st.cache_data` function, so a table used by two
+pages was read twice and every cache hit handed out a fresh deep copy. The DataStore instead
+loads each dataset from the bundle on first use and keeps it for the whole process, shared by
+all pages and sessions. Its column arrays are marked read-only and the accessors return shallow
+copies: a page can add, replace or reorder columns of the frame it gets, but writing into the
+shared values (`df.loc[...] = ...`) raises ValueError instead of changing the data every other
+session sees.
+
+The store is keyed by the bundle's version token, so proposals appended with utils.ingest are
+loaded on the next rerun. Row counts, memory and load times per dataset are listed on the
+diagnostics view (Home page with ?diagnostics=1).
+"""
+# Import libraries
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+from streamlit.logger import get_logger
+
+from utils.bundle import data_version, read_table
+from utils.profiling import memory_bytes
+
+logger = get_logger(__name__)
+
+# Dataset name -> columns to load (None for all). The proposal texts are left out of
+# pro_merged: no page shows them, and they are most of the table's memory.
+DATASETS = {
+    'district_data': None,
+    'district_topic_proportions': None,
+    'indexes': None,
+    'pro_merged': [
+        'id', 'round', 'title', 'latitude', 'longitude', 'versionsCount', 'total_comments_count',
+        'selected', 'adj_budget', 'district',
+    ],
+    'sample_proposals': None,
+    'topic_numbers': None,
+    'weighted_averages_cleaned': None,
+}
+
+
+def read_only(df):
+    """
+    `df` rebuilt over read-only column arrays. Arrays that already are read-only (memory-mapped
+    from the bundle) are shared as they are; the rest are copied once and frozen.
+    """
+    columns = {}
+    for name, column in df.items():
+        categorical = isinstance(column.dtype, pd.CategoricalDtype)
+        values = (column.cat.codes if categorical else column).to_numpy()
+        if values.flags.writeable:
+            values = values.copy()
+            values.flags.writeable = False
+        columns[name] = pd.Categorical.from_codes(values, dtype=column.dtype) if categorical else values
+    # copy=False keeps one block per column, so pandas cannot consolidate them into a writable copy
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+class DataStore:
+    """
+    The datasets of one bundle version, each loaded once on first use.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self._frames = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _load(self, name):
+        start = time.perf_counter()
+        memory_before = memory_bytes()
+        df = read_table(name, columns=DATASETS[name])
+        # Measured before freezing: pandas cannot size the strings of a read-only object array.
+        # The frozen frame holds the same string objects, so the total is the same.
+        usage = df.memory_usage(deep=True)
+        df = read_only(df)
+        elapsed = (time.perf_counter() - start) * 1000
+        memory_after = memory_bytes()
+        self._stats[name] = {
+            'rows': len(df),
+            'columns': len(df.columns),
+            'memory_bytes': int(usage.sum()),
+            'load_ms': elapsed,
+            'rss_delta_bytes': memory_after - memory_before if memory_before is not None else None,
+            'hits': 0,
+        }
+        logger.debug("Loaded dataset %s (%d rows, %d bytes) in %.1f ms", name, len(df), usage.sum(), elapsed)
+        return df
+
+    def get(self, name):
+        """
+        A shallow copy of dataset `name`. The lock is held while loading, so concurrent sessions
+        asking for the same dataset wait for the one load instead of each starting their own.
+        """
+        if name not in DATASETS:
+            raise KeyError(f"Unknown dataset {name!r}; expected one of {sorted(DATASETS)}")
+        with self._lock:
+            if name not in self._frames:
+                self._frames[name] = self._load(name)
+            else:
+                self._stats[name]['hits'] += 1
+            df = self._frames[name]
+        return df.copy(deep=False)
+
+    def stats(self):
+        """
+        Rows, columns, memory (bytes), load time (ms), RSS growth during the load and cache hits
+        of every dataset loaded so far.
+        """
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+# Two entries so sessions still rendering the previous version keep it while the new one loads
+@st.cache_resource(max_entries=2)
+def get_data_store(version=None):
+    return DataStore(version)
+
+
+def load_dataset(name):
+    return get_data_store(data_version()).get(name)
+
+
+def district_data():
+    """
+    Yearly district statistics: Area (category), Year (int16), id and the indicator columns.
+    """
+    return load_dataset('district_data')
+
+
+def district_topic_proportions():
+    """
+    Share of each topic per district and year: district, Topic (category), Year (int16), Proportion.
+    """
+    return load_dataset('district_topic_proportions')
+
+
+def indexes():
+    """
+    The four indices per district and year: Area (category), Year (int16) and one column per index.
+    """
+    return load_dataset('indexes')
+
+
+def proposals():
+    """
+    All proposals without their texts: id (int32), round (int8), title, coordinates, counts,
+    selected and district (category), adj_budget.
+    """
+    return load_dataset('pro_merged')
+
+
+def sample_proposals():
+    """
+    The proposals with topic vectors: id (int32), round (int8), title, texts, district and
+    top_topic (category) and Topic_0..Topic_6.
+    """
+    return load_dataset('sample_proposals')
+
+
+def topic_numbers():
+    return load_dataset('topic_numbers')
+
+
+def weighted_averages():
+    """
+    Compressed district statistics (2018-2023), one row per Area (category).
+    """
+    return load_dataset('weighted_averages_cleaned')
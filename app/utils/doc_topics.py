@@ -0,0 +1,138 @@
+"""
+Dense document-topic matrix for the proposals the topic model was trained on.
+
+The matrix is inferred from the model's MatrixMarket corpus in one batched call and stored as
+a float32 .npy next to a row index of (id, round, district, selected), so the per-topic top
+proposals, district heatmaps and topic shares are derived from it on demand for any number of
+topics. Regenerate it after activating another model, from the repository root:
+
+    PYTHONPATH=app python -m utils.doc_topics
+"""
+# Import libraries
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import streamlit as st
+
+from utils.bundle import DATA_DIR, read_table
+from utils.topics import CORPUS_DOCUMENTS_FILE, active_model_files, infer_topic_matrix, model_fingerprint
+
+MATRIX_FILE = 'doc_topics.npy'
+INDEX_FILE = 'doc_topics_index.arrow'
+MANIFEST_FILE = 'doc_topics.json'
+INDEX_COLUMNS = ['id', 'round', 'district', 'selected']
+
+
+def corpus_row_index(files, documents):
+    """
+    (id, round, district, selected) of each of the `documents` corpus documents, in corpus order.
+    """
+    if files['version']:
+        # Versioned models write the row index of their corpus next to it
+        from utils.lda_pipeline import DOCUMENTS_FILE
+        documents_file = os.path.join(os.path.dirname(files['corpus']), DOCUMENTS_FILE)
+    else:
+        documents_file = CORPUS_DOCUMENTS_FILE
+    if os.path.exists(documents_file):
+        index = pd.read_csv(documents_file)
+        index['selected'] = index['selected'] == 'Selected'
+    else:
+        # The original corpus was built from the first rows of sample_proposals; utils.topic_aggregation
+        # appends new proposals after them
+        index = read_table('sample_proposals', columns=INDEX_COLUMNS).head(documents)
+    if len(index) != documents:
+        raise ValueError(f"Row index has {len(index)} rows but the corpus has {documents} documents")
+    return index[INDEX_COLUMNS].astype({'id': 'int32', 'round': 'int8', 'district': 'category'})
+
+
+def build_doc_topics(data_dir=DATA_DIR):
+    import gensim
+    from gensim.corpora import MmCorpus
+    files = active_model_files()
+    lda_model = gensim.models.ldamodel.LdaModel.load(files['model'])
+    corpus = list(MmCorpus(files['corpus']))
+    index = corpus_row_index(files, len(corpus))
+    matrix = infer_topic_matrix(corpus, lda_model).astype(np.float32)
+    np.save(os.path.join(data_dir, MATRIX_FILE), matrix)
+    feather.write_feather(index.reset_index(drop=True), os.path.join(data_dir, INDEX_FILE), compression='uncompressed')
+    manifest = {'model_fingerprint': model_fingerprint(), 'documents': matrix.shape[0], 'num_topics': matrix.shape[1]}
+    with open(os.path.join(data_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class DocumentTopics:
+    """
+    Memory-mapped document-topic matrix with its row index and derived aggregates.
+    """
+
+    def __init__(self, data_dir=DATA_DIR):
+        with open(os.path.join(data_dir, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.matrix = np.load(os.path.join(data_dir, MATRIX_FILE), mmap_mode='r')
+        self.index = feather.read_table(os.path.join(data_dir, INDEX_FILE), memory_map=True).to_pandas()
+        self.num_topics = self.matrix.shape[1]
+
+    def top_documents(self, topic, n=10):
+        """
+        Row index entries of the `n` documents with the highest share of `topic`, best first.
+        """
+        column = np.asarray(self.matrix[:, topic])
+        n = min(n, len(column))
+        rows = np.argpartition(-column, n - 1)[:n]
+        rows = rows[np.argsort(-column[rows], kind='stable')]
+        top = self.index.iloc[rows].reset_index(drop=True)
+        top['probability'] = column[rows].astype(float)
+        return top
+
+    def topic_shares(self):
+        """
+        Share of all topic mass held by each topic, summed over the documents.
+        """
+        totals = np.asarray(self.matrix, dtype=np.float64).sum(axis=0)
+        return totals / totals.sum()
+
+    def dominant_topic_counts(self):
+        return np.bincount(np.argmax(self.matrix, axis=1), minlength=self.num_topics)
+
+    def group_means(self, column):
+        """
+        Mean topic mixture per value of an index column (e.g. district or round), as a DataFrame.
+        Documents with a missing value are left out.
+        """
+        groups = self.index[column].astype('category')
+        codes = groups.cat.codes.to_numpy()
+        keep = codes >= 0
+        counts = np.bincount(codes[keep], minlength=len(groups.cat.categories))
+        matrix = np.asarray(self.matrix)[keep]
+        sums = np.stack([np.bincount(codes[keep], weights=matrix[:, k], minlength=len(counts)) for k in range(self.num_topics)], axis=1)
+        means = sums / np.maximum(counts, 1)[:, None]
+        return pd.DataFrame(means, index=pd.Index(groups.cat.categories, name=column), columns=[f"Topic_{k}" for k in range(self.num_topics)])
+
+
+# Keyed by the model fingerprint so the matrix follows the active topic model
+@st.cache_resource
+def load_doc_topics(fingerprint, data_dir=DATA_DIR):
+    manifest_file = os.path.join(data_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        build_doc_topics(data_dir)
+    else:
+        with open(manifest_file) as f:
+            if json.load(f)['model_fingerprint'] != fingerprint:
+                build_doc_topics(data_dir)
+    return DocumentTopics(data_dir)
+
+
+def main():
+    try:
+        manifest = build_doc_topics()
+    except ValueError as error:
+        raise SystemExit(str(error))
+    print(f"Wrote a {manifest['documents']} x {manifest['num_topics']} document-topic matrix to {DATA_DIR}/{MATRIX_FILE}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# Import libraries
+import geopandas as gpd
+import pandas as pd
+import streamlit as st
+
+GEOJSON_FILE = 'app/data/districts.geojson'
+METRIC_CRS = 3067  # ETRS-TM35FIN, used so the tolerance is in metres
+SIMPLIFY_TOLERANCE = 5
+
+
+class DistrictGeometry:
+    """
+    Reprojected, simplified district polygons keyed by Area.
+
+    Built once per process (see `load_district_geometry`) and shared by every
+    session, so the GeoJSON is not parsed and reprojected on each rerun.
+    """
+
+    def __init__(self, geojson_file=GEOJSON_FILE, tolerance=SIMPLIFY_TOLERANCE):
+        gdf = gpd.read_file(geojson_file)
+        if tolerance:
+            gdf = gdf.to_crs(epsg=METRIC_CRS)
+            gdf['geometry'] = gdf.geometry.simplify(tolerance, preserve_topology=True)
+        gdf = gdf.to_crs(epsg=4326)
+        self.gdf = gdf[['Area', 'geometry']].reset_index(drop=True)
+        self.areas = self.gdf['Area']
+        self._geometries = None
+
+    def join(self, df_year, column):
+        """
+        Return the district polygons with `column` from `df_year` attached by Area.
+
+        The result is a shallow copy: geometries are shared with the store, only
+        the Area and value columns are new.
+        """
+        values = df_year.drop_duplicates('Area').set_index('Area')[column]
+        joined = self.gdf.copy(deep=False)
+        joined[column] = self.areas.map(values).to_numpy()
+        return joined
+
+    def feature_collection(self, df_year, column):
+        """
+        GeoJSON FeatureCollection of the districts with Area and `column` as properties.
+
+        The geometry dicts are converted from shapely once and reused, so building a new
+        collection only costs the per-district property lookups.
+        """
+        if self._geometries is None:
+            self._geometries = [geom.__geo_interface__ for geom in self.gdf.geometry]
+        values = self.areas.map(df_year.drop_duplicates('Area').set_index('Area')[column])
+        values = [None if pd.isna(value) else float(value) for value in values]
+        return {
+            'type': 'FeatureCollection',
+            'features': [
+                {'type': 'Feature', 'properties': {'Area': area, column: value}, 'geometry': geometry}
+                for area, value, geometry in zip(self.areas, values, self._geometries)
+            ],
+        }
+
+
+@st.cache_resource
+def load_district_geometry(geojson_file=GEOJSON_FILE):
+    return DistrictGeometry(geojson_file)
@@ -0,0 +1,194 @@
+"""
+Composite district indices (DDI, EPI, SDI, PSAI) computed from district_data.
+
+The indicators are forward-filled per district (2023 has no income, Gini or workforce data yet),
+held as NumPy matrices in raw and min-max scaled form, and every index is computed for all
+Area x Year rows at once. Results are memoised per index by a hash of the part of the
+configuration it depends on, so changing one index's weights only recomputes that column.
+Regenerate indexes.csv from the repository root with:
+
+    PYTHONPATH=app python -m utils.indexes
+"""
+# Import libraries
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+
+from utils.bundle import DATA_DIR, read_table
+from utils.datastore import district_data
+
+INDEX_NAMES = {
+    'ddi': "Demographic Diversity Index",
+    'epi': "Economic Prosperity Index",
+    'sdi': "Socioeconomic Dependency Index",
+    'psai': "Public Service Accessibility Index",
+}
+
+# Offset keeping zero indicators from collapsing the SDI geometric mean
+SDI_EPSILON = 1e-5
+
+DEFAULT_CONFIG = {
+    # Simpson's index per category, averaged over the categories (Sullivan's extension)
+    'ddi': {
+        'Education': [
+            "Proportion of basic education",
+            "Proportion of upper secondary education",
+            "Proportion of lower tertiary education",
+            "Proportion of higher education",
+        ],
+        'Age': [
+            "Proportion of youth (0-14)",
+            "Proportion of elderly (65+)",
+            "Proportion of working age (15-64)",
+        ],
+        'Gender': ["Proportion of males", "Proportion of females"],
+        'Language': [
+            "Proportion of foreign language",
+            "Proportion of finnish and sami",
+            "Proportion of swedish",
+        ],
+        'Workforce': [
+            "Proportion of creative class in workforce",
+            "Proportion of non creative class in workforce",
+        ],
+    },
+    # Weighted mean of min-max scaled indicators; inverted ones enter as 1 - x
+    'epi': {
+        'weights': {
+            "Income subject to state taxation euro average": 0.4,
+            "Gini coefficient disposable income": 0.2,
+            "Unemployment rate": 0.2,
+            "Proportion of higher education": 0.2,
+        },
+        'inverted': ["Gini coefficient disposable income", "Unemployment rate"],
+    },
+    # Geometric mean of min-max scaled indicators
+    'sdi': [
+        "Proportion of four or more persons household",
+        "Proportion of foreign language",
+        "Demographic dependency ratio",
+        "Proportion of subsidised rental apartments",
+    ],
+    # Mean of the service indicators; the published indexes.csv uses the raw values
+    'psai': {
+        'indicators': [
+            "Service points for dog areas per 1000 persons",
+            "Service points for parks and green areas per 1000 persons",
+            "Service points for playgrounds per 1000 persons",
+            "Service points for cultural activities per 1000 persons",
+            "Service points for circular economy per 1000 persons",
+            "Service points for daycare and pre primary education per 1000 persons",
+            "Service points for child and family services per 1000 persons",
+            "Service points for social welfare services per 1000 persons",
+        ],
+        'scaling': None,  # None, 'minmax' or 'zscore'
+    },
+}
+
+
+def default_config():
+    return copy.deepcopy(DEFAULT_CONFIG)
+
+
+def config_hash(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class IndexEngine:
+    """
+    Vectorised computation of the four indices for every Area x Year row of district_data.
+    """
+
+    def __init__(self, district_data, memo_size=256):
+        data = district_data.sort_values(['Area', 'Year']).reset_index(drop=True)
+        indicators = [col for col in data.columns if col not in ('id', 'Area', 'Year', 'latitude', 'longitude')]
+        data[indicators] = data.groupby('Area', observed=True)[indicators].ffill()
+        self.keys = data[['Area', 'Year']]
+        self.columns = {col: i for i, col in enumerate(indicators)}
+        self.raw = data[indicators].to_numpy(dtype=float)
+        low, high = np.nanmin(self.raw, axis=0), np.nanmax(self.raw, axis=0)
+        span = np.where(high > low, high - low, 1.0)
+        self.minmax = (self.raw - low) / span
+        std = np.nanstd(self.raw, axis=0, ddof=1)
+        self.zscore = (self.raw - np.nanmean(self.raw, axis=0)) / np.where(std > 0, std, 1.0)
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _take(self, matrix, columns):
+        return matrix[:, [self.columns[col] for col in columns]]
+
+    def ddi(self, categories):
+        if not categories:
+            return np.full(len(self.keys), np.nan)
+        simpson = [1 - np.sum(self._take(self.raw, cols) ** 2, axis=1) for cols in categories.values()]
+        return np.mean(simpson, axis=0)
+
+    def epi(self, config):
+        columns = list(config['weights'])
+        weights = np.array([config['weights'][col] for col in columns], dtype=float)
+        if not columns or weights.sum() <= 0:
+            return np.full(len(self.keys), np.nan)
+        values = self._take(self.minmax, columns)
+        inverted = np.isin(columns, config.get('inverted', []))
+        values = np.where(inverted, 1 - values, values)
+        return values @ weights / weights.sum()
+
+    def sdi(self, indicators):
+        if not indicators:
+            return np.full(len(self.keys), np.nan)
+        return np.exp(np.mean(np.log(self._take(self.minmax, indicators) + SDI_EPSILON), axis=1))
+
+    def psai(self, config):
+        if not config['indicators']:
+            return np.full(len(self.keys), np.nan)
+        matrix = {None: self.raw, 'minmax': self.minmax, 'zscore': self.zscore}[config.get('scaling')]
+        return np.mean(self._take(matrix, config['indicators']), axis=1)
+
+    def index(self, name, config):
+        """
+        One index column for the given sub-configuration, memoised by its hash.
+        """
+        key = (name, config_hash(config))
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        values = getattr(self, name)(config)
+        values.flags.writeable = False
+        with self._lock:
+            self._memo[key] = values
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return values
+
+    def compute(self, config=None, names=None):
+        """
+        DataFrame of Area, Year and the requested indices (all four by default).
+        """
+        config = config or DEFAULT_CONFIG
+        result = self.keys.copy()
+        for name in names or INDEX_NAMES:
+            result[INDEX_NAMES[name]] = self.index(name, config[name])
+        return result
+
+
+# Keyed by the data version, so a rebuilt bundle gets an engine over the new district data
+@st.cache_resource(max_entries=2)
+def load_index_engine(version=None):
+    return IndexEngine(district_data())
+
+
+def main():
+    indexes = IndexEngine(read_table('district_data')).compute()
+    indexes.to_csv(f'{DATA_DIR}/indexes.csv', index=False)
+    print(f"Wrote {len(indexes)} rows to {DATA_DIR}/indexes.csv. Rebuild the data bundle to pick them up: PYTHONPATH=app python -m utils.bundle")
+
+
+if __name__ == "__main__":
+    main()
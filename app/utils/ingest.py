@@ -0,0 +1,219 @@
+"""
+Streaming ingestion of OmaStadi proposals into the data bundle.
+
+Proposal records are read one at a time from a JSON-lines dump or from a paged JSON endpoint (a
+local stand-in for the OmaStadi API: each page is {"proposals": [...], "next": url-or-null}).
+They pass through a chain of generators:
+
+    read -> clean -> deduplicate by (id, round) -> batch -> assign districts -> append
+
+The result is written as a new Arrow segment of the pro_merged table, one batch at a time, so
+memory holds a single batch plus the (id, round) keys already stored. Appending gives the bundle
+a new version token, which the pages key their data caches on: a running dashboard shows the
+new proposals on its next rerun, and the Home page reports the date of the update. Run from
+the repository root:
+
+    PYTHONPATH=app python -m utils.ingest proposals.jsonl
+    PYTHONPATH=app python -m utils.ingest http://localhost:8000/proposals.json --batch-size 500
+
+Then fold the new proposals into the topic tables with `python -m utils.topic_aggregation`.
+`--compact` writes the ingested proposals back into pro_merged.csv and rebuilds the bundle.
+"""
+# Import libraries
+import argparse
+import csv
+import json
+import math
+import os
+import urllib.parse
+import urllib.request
+from collections import Counter
+
+import pandas as pd
+
+from utils.bundle import BUNDLE_DIR, DATA_DIR, append_segment, build_bundle, load_manifest, read_table, write_manifest
+from utils.geometry import GEOJSON_FILE
+from utils.spatial_join import NO_LOCATION, DistrictLocator
+
+TABLE = 'pro_merged'
+KEYS = ['id', 'round']
+COLUMNS = [
+    'id', 'round', 'title', 'texts', 'areaScope', 'latitude', 'longitude', 'versionsCount', 'state',
+    'total_comments_count', 'selected', 'link_plans', 'num_link_proposals', 'adj_budget', 'budgetamount', 'district',
+]
+TEXT_COLUMNS = ['title', 'texts', 'areaScope', 'state', 'district']
+NUMBER_COLUMNS = ['versionsCount', 'total_comments_count', 'link_plans', 'num_link_proposals', 'adj_budget', 'budgetamount']
+BATCH_SIZE = 1000
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_pages(url):
+    """
+    Follow the `next` links of a paged endpoint, yielding the proposals of one page at a time.
+    """
+    while url:
+        with urllib.request.urlopen(url) as response:
+            page = json.load(response)
+        yield from page['proposals']
+        url = urllib.parse.urljoin(url, page['next']) if page.get('next') else None
+
+
+def read_source(source):
+    return read_pages(source) if source.startswith(('http://', 'https://')) else read_jsonl(source)
+
+
+def as_text(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def as_number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return value if math.isfinite(value) else math.nan
+
+
+def clean_record(record):
+    """
+    One record in pro_merged's columns and types, or None if it has no usable id, round or title.
+    """
+    try:
+        key = {'id': int(record['id']), 'round': int(record['round'])}
+    except (KeyError, TypeError, ValueError):
+        return None
+    cleaned = {**key, **{column: as_text(record.get(column)) for column in TEXT_COLUMNS}}
+    if cleaned['title'] is None:
+        return None
+    cleaned.update({column: as_number(record.get(column)) for column in NUMBER_COLUMNS})
+    latitude, longitude = as_number(record.get('latitude')), as_number(record.get('longitude'))
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        latitude = longitude = math.nan
+    cleaned['latitude'], cleaned['longitude'] = latitude, longitude
+    if cleaned['state'] is not None:
+        cleaned['state'] = cleaned['state'].lower()
+    selected = record.get('selected')
+    if isinstance(selected, str):
+        selected = selected.strip().lower() in ('selected', 'true', '1')
+    cleaned['selected'] = 'Selected' if selected else 'Not selected'
+    return cleaned
+
+
+def clean(records, counts):
+    for record in records:
+        counts['read'] += 1
+        cleaned = clean_record(record)
+        if cleaned is None:
+            counts['rejected'] += 1
+            continue
+        yield cleaned
+
+
+def deduplicate(records, seen, counts):
+    """
+    Drop records whose (id, round) is in `seen`, which is extended as records pass.
+    """
+    for record in records:
+        key = (record['id'], record['round'])
+        if key in seen:
+            counts['duplicates'] += 1
+            continue
+        seen.add(key)
+        yield record
+
+
+def batched(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def assign_districts(batches, locator, counts):
+    """
+    Turn each batch into a DataFrame and set `district` to the polygon each proposal falls in.
+
+    Proposals without coordinates or outside the city are `location_not_specified`, whatever
+    district they came with; the latter are counted as `outside_city`.
+    """
+    for batch in batches:
+        df = pd.DataFrame(batch, columns=COLUMNS)
+        assigned = locator.assign(df['longitude'], df['latitude'])
+        df['district'] = assigned['district'].to_numpy()
+        counts['assigned'] += int((assigned['district'] != NO_LOCATION).sum())
+        counts['outside_city'] += int(assigned['outside_city'].sum())
+        counts['written'] += len(df)
+        yield df
+
+
+def stored_keys(bundle_dir=BUNDLE_DIR):
+    stored = read_table(TABLE, columns=KEYS, bundle_dir=bundle_dir)
+    return set(zip(stored['id'].tolist(), stored['round'].tolist()))
+
+
+def ingest(records, batch_size=BATCH_SIZE, bundle_dir=BUNDLE_DIR, geojson_file=GEOJSON_FILE):
+    """
+    Run `records` through the pipeline and append the new proposals to the bundle.
+    Returns the counts of records read, rejected, duplicated, assigned, outside the city and
+    written.
+    """
+    counts = Counter()
+    locator = DistrictLocator(geojson_file)
+    pipeline = deduplicate(clean(records, counts), stored_keys(bundle_dir), counts)
+    append_segment(TABLE, assign_districts(batched(pipeline, batch_size), locator, counts), bundle_dir)
+    return counts
+
+
+def compact(data_dir=DATA_DIR, bundle_dir=BUNDLE_DIR):
+    """
+    Write the stored proposals, ingested segments included, back to pro_merged.csv and rebuild
+    the bundle from the CSVs. Returns the number of proposals.
+    """
+    proposals = read_table(TABLE, bundle_dir=bundle_dir, data_dir=data_dir)
+    # Proposal texts can contain bare carriage returns, which pandas leaves unquoted by default
+    proposals[COLUMNS].to_csv(os.path.join(data_dir, f'{TABLE}.csv'), index=False, quoting=csv.QUOTE_NONNUMERIC)
+    manifest = load_manifest(bundle_dir)
+    for segment in manifest['tables'][TABLE].pop('segments', []):
+        os.remove(os.path.join(bundle_dir, segment['file']))
+    write_manifest(manifest, bundle_dir)
+    build_bundle(data_dir, bundle_dir)
+    return len(proposals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream OmaStadi proposals into the data bundle.")
+    parser.add_argument('source', nargs='?', help="JSON-lines file or URL of a paged JSON endpoint")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="proposals held in memory and written at a time")
+    parser.add_argument('--compact', action='store_true', help="write ingested proposals back to pro_merged.csv and rebuild the bundle")
+    args = parser.parse_args()
+    if args.compact:
+        print(f"Wrote {compact()} proposals to {DATA_DIR}/{TABLE}.csv.")
+        return
+    if args.source is None:
+        parser.error("a source is required unless --compact is given")
+    counts = ingest(read_source(args.source), args.batch_size)
+    print(
+        f"Read {counts['read']} records: {counts['written']} new, {counts['duplicates']} already stored, "
+        f"{counts['rejected']} rejected; {counts['assigned']} placed in a district by their coordinates, "
+        f"{counts['outside_city']} outside the city."
+    )
+    if counts['written']:
+        print("Fold them into the topic tables with: PYTHONPATH=app python -m utils.topic_aggregation")
+        print("and rebuild the search index with: PYTHONPATH=app python -m utils.search")
+
+
+if __name__ == "__main__":
+    main()
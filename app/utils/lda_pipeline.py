@@ -0,0 +1,186 @@
+"""
+Offline pipeline that retrains the LDA topic model from pro_merged.
+
+Tokenises the proposals with the same preprocessing as the dashboard, builds the dictionary
+and MatrixMarket corpus, trains LdaMulticore on all cores and writes a versioned directory
+under app/data/models with the artefacts and their metadata. Run from the repository root:
+
+    PYTHONPATH=app python -m utils.lda_pipeline --num-topics 7 --activate
+"""
+# Import libraries
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+from gensim.corpora import Dictionary, MmCorpus
+from gensim.models import CoherenceModel, LdaMulticore
+
+from utils.bundle import data_version, read_table
+from utils.text import preprocess_batch
+from utils.topics import CORPUS_FILE, DICTIONARY_FILE, LDA_MODEL_FILE, MODEL_MANIFEST, MODELS_DIR, load_model_manifest
+
+TOKENS_FILE = "tokens.jsonl"
+DOCUMENTS_FILE = "documents.csv"
+METADATA_FILE = "metadata.json"
+
+
+def load_documents(min_length=1):
+    """
+    One row per proposal (deduplicated on id and round) with a non-empty text.
+    """
+    proposals = read_table('pro_merged', columns=['id', 'round', 'texts', 'district', 'selected'])
+    proposals = proposals.drop_duplicates(['id', 'round']).dropna(subset=['texts'])
+    proposals = proposals[proposals['texts'].str.strip().str.len() >= min_length]
+    return proposals.reset_index(drop=True)
+
+
+def documents_hash(documents):
+    """
+    Hash of the proposals the model is trained on, including any appended with utils.ingest.
+    """
+    hashes = pd.util.hash_pandas_object(documents[['id', 'round', 'texts']], index=False)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+
+def tokenize(texts, workers):
+    return preprocess_batch(texts, batch_size=256, n_process=workers)
+
+
+def build_dictionary(tokens, no_below=5, no_above=0.5):
+    dictionary = Dictionary(tokens)
+    dictionary.filter_extremes(no_below=no_below, no_above=no_above)
+    dictionary.compactify()
+    return dictionary
+
+
+def train(corpus, dictionary, num_topics, workers, passes=10, iterations=100, random_state=42):
+    return LdaMulticore(
+        corpus=corpus,
+        id2word=dictionary,
+        num_topics=num_topics,
+        workers=max(1, workers - 1),  # one core is left for the master process
+        passes=passes,
+        iterations=iterations,
+        chunksize=2000,
+        random_state=random_state,
+    )
+
+
+def evaluate(lda_model, corpus, tokens, dictionary, workers):
+    coherence = CoherenceModel(
+        model=lda_model, texts=tokens, dictionary=dictionary, coherence='c_v', processes=workers
+    ).get_coherence()
+    return {'coherence': float(coherence), 'perplexity': float(lda_model.log_perplexity(corpus))}
+
+
+def write_manifest(version, metadata, activate, models_dir=MODELS_DIR):
+    manifest = load_model_manifest(models_dir) or {'active': None, 'versions': {}}
+    manifest['versions'][version] = {
+        key: metadata[key] for key in ('created_at', 'num_topics', 'coherence', 'perplexity', 'training_seconds')
+    }
+    if activate:
+        manifest['active'] = version
+    save_manifest(manifest, models_dir)
+    return manifest
+
+
+def save_manifest(manifest, models_dir=MODELS_DIR):
+    """
+    Replace the manifest atomically, so a running dashboard never reads a half-written file.
+    """
+    path = os.path.join(models_dir, MODEL_MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def set_active(version, models_dir=MODELS_DIR):
+    manifest = load_model_manifest(models_dir)
+    if manifest is None or version not in manifest['versions']:
+        raise ValueError(f"Unknown model version: {version}")
+    manifest['active'] = version
+    save_manifest(manifest, models_dir)
+
+
+def run(num_topics, passes, iterations, workers, no_below, no_above, random_state, activate, models_dir=MODELS_DIR):
+    created_at = datetime.now(timezone.utc)
+    version = f"{created_at:%Y%m%d-%H%M%S}-k{num_topics}"
+    version_dir = os.path.join(models_dir, version)
+    os.makedirs(version_dir)
+
+    documents = load_documents()
+    print(f"Tokenising {len(documents)} proposals...")
+    tokens = tokenize(documents['texts'].tolist(), workers)
+    dictionary = build_dictionary(tokens, no_below, no_above)
+    corpus = [dictionary.doc2bow(doc_tokens) for doc_tokens in tokens]
+    print(f"Vocabulary of {len(dictionary)} terms.")
+
+    start = time.perf_counter()
+    lda_model = train(corpus, dictionary, num_topics, workers, passes, iterations, random_state)
+    training_seconds = time.perf_counter() - start
+    print(f"Trained {num_topics} topics in {training_seconds:.1f}s.")
+    scores = evaluate(lda_model, corpus, tokens, dictionary, workers)
+
+    lda_model.save(os.path.join(version_dir, os.path.basename(LDA_MODEL_FILE)))
+    dictionary.save(os.path.join(version_dir, os.path.basename(DICTIONARY_FILE)))
+    MmCorpus.serialize(os.path.join(version_dir, os.path.basename(CORPUS_FILE)), corpus)
+    # Row index of the corpus and the tokens it was built from, for later sweeps and aggregation
+    documents[['id', 'round', 'district', 'selected']].to_csv(os.path.join(version_dir, DOCUMENTS_FILE), index=False)
+    with open(os.path.join(version_dir, TOKENS_FILE), 'w') as f:
+        for doc_tokens in tokens:
+            f.write(json.dumps(doc_tokens, ensure_ascii=False) + "\n")
+
+    metadata = {
+        'version': version,
+        'created_at': created_at.isoformat(),
+        'num_topics': num_topics,
+        'coherence': scores['coherence'],
+        'perplexity': scores['perplexity'],
+        'training_seconds': round(training_seconds, 2),
+        'documents': len(documents),
+        'vocabulary': len(dictionary),
+        'params': {
+            'passes': passes,
+            'iterations': iterations,
+            'workers': workers,
+            'no_below': no_below,
+            'no_above': no_above,
+            'random_state': random_state,
+        },
+        'data_version': data_version(),
+        'documents_sha256': documents_hash(documents),
+    }
+    with open(os.path.join(version_dir, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    write_manifest(version, metadata, activate, models_dir)
+    print(f"Wrote {version_dir} (coherence {scores['coherence']:.3f}, perplexity {scores['perplexity']:.3f}).")
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the LDA topic model from pro_merged.csv.")
+    parser.add_argument('--num-topics', type=int, default=7)
+    parser.add_argument('--passes', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--no-below', type=int, default=5, help="drop terms in fewer documents than this")
+    parser.add_argument('--no-above', type=float, default=0.5, help="drop terms in more than this share of documents")
+    parser.add_argument('--random-state', type=int, default=42)
+    parser.add_argument('--activate', action='store_true', help="make the new version the one the dashboard uses")
+    parser.add_argument('--set-active', metavar='VERSION', help="only switch the dashboard to an existing version")
+    args = parser.parse_args()
+    if args.set_active:
+        try:
+            set_active(args.set_active)
+        except ValueError as error:
+            parser.exit(1, f"{error}\n")
+        return
+    run(args.num_topics, args.passes, args.iterations, args.workers, args.no_below, args.no_above, args.random_state, args.activate)
+
+
+if __name__ == "__main__":
+    main()
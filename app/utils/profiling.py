@@ -0,0 +1,313 @@
+"""
+Opt-in timing of the sections of each page rerun.
+
+Start the app with MCV_PROFILE=1 to record wall time, the change in process RSS and payload size
+for every instrumented section, both overall and per browser session. The results are shown on
+the hidden diagnostics view (Home page with ?diagnostics=1) and can be downloaded as JSON or in
+the Prometheus text format. RSS is process-wide, so with several sessions running a section's
+RSS change includes whatever the others allocated meanwhile. MCV_PROFILE=tracemalloc measures
+Python allocations instead, which is more precise but slows every allocation down (and is just
+as process-wide).
+
+When profiling is off, `section` returns a shared no-op and `profiled` leaves functions
+untouched, so the instrumentation costs one flag check per section.
+"""
+# Import libraries
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import streamlit as st
+
+PROFILE_ENV = 'MCV_PROFILE'
+PROFILE_MODE = os.environ.get(PROFILE_ENV, '').strip().lower()
+ENABLED = PROFILE_MODE not in ('', '0', 'false', 'off')
+TRACEMALLOC = PROFILE_MODE == 'tracemalloc'
+# What the memory columns measure; both are process-wide, not per session
+MEMORY_LABEL = 'traced_delta' if TRACEMALLOC else 'process_rss_delta'
+
+# Upper bounds (ms) of the latency histogram buckets, as in a Prometheus histogram
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+WINDOW = 500
+MAX_SESSIONS = 100
+
+if TRACEMALLOC:
+    import tracemalloc
+    tracemalloc.start()
+
+
+def memory_bytes():
+    """
+    Traced Python allocations in tracemalloc mode, otherwise the resident set size (Linux only).
+    """
+    if TRACEMALLOC:
+        return tracemalloc.get_traced_memory()[0]
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def payload_size(payload):
+    if payload is None:
+        return 0
+    if isinstance(payload, bytes):
+        return len(payload)
+    if isinstance(payload, str):
+        return len(payload.encode('utf-8'))
+    return len(json.dumps(payload, default=str).encode('utf-8'))
+
+
+def current_session():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'bare'
+
+
+class SectionStats:
+    """
+    Running totals of one section, cumulative histogram counts and a window of recent samples.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.memory_delta = 0
+        self.payload_bytes = 0
+        self.buckets = np.zeros(len(BUCKETS_MS) + 1, dtype=np.int64)
+        self.recent = deque(maxlen=WINDOW)
+
+    def add(self, elapsed_ms, memory_delta, payload_bytes):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.memory_delta += memory_delta
+        self.payload_bytes += payload_bytes
+        self.buckets[np.searchsorted(BUCKETS_MS, elapsed_ms)] += 1
+        self.recent.append(elapsed_ms)
+
+    def summary(self):
+        recent = np.asarray(self.recent)
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count,
+            'p50_ms': float(np.percentile(recent, 50)),
+            'p95_ms': float(np.percentile(recent, 95)),
+            'max_ms': float(recent.max()),
+            f'mean_{MEMORY_LABEL}_mb': self.memory_delta / self.count / 2 ** 20,
+            'mean_payload_kb': self.payload_bytes / self.count / 1024,
+        }
+
+    def recent_histogram(self):
+        """
+        Counts per bucket over the last WINDOW samples only.
+        """
+        return np.bincount(np.searchsorted(BUCKETS_MS, np.asarray(self.recent)), minlength=len(BUCKETS_MS) + 1)
+
+
+class Profiler:
+    """
+    Process-wide store of section timings, keyed by (page, section) and by session.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self.sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, page, name, elapsed_ms, memory_delta, payload_bytes, session):
+        key = (page, name)
+        with self._lock:
+            self.sections.setdefault(key, SectionStats()).add(elapsed_ms, memory_delta, payload_bytes)
+            per_session = self.sessions.setdefault(session, {})
+            self.sessions.move_to_end(session)
+            totals = per_session.setdefault(key, [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed_ms
+            if len(self.sessions) > MAX_SESSIONS:
+                self.sessions.popitem(last=False)
+
+    def reset(self):
+        with self._lock:
+            self.sections.clear()
+            self.sessions.clear()
+
+    def summary(self):
+        with self._lock:
+            return [{'page': page, 'section': name, **stats.summary()} for (page, name), stats in sorted(self.sections.items())]
+
+    def session_summary(self):
+        with self._lock:
+            return [
+                {'session': session, 'page': page, 'section': name, 'count': count, 'total_ms': total}
+                for session, sections in self.sessions.items()
+                for (page, name), (count, total) in sorted(sections.items())
+            ]
+
+    def histogram(self, page, name, recent=True):
+        with self._lock:
+            stats = self.sections[(page, name)]
+            return stats.recent_histogram() if recent else stats.buckets.copy()
+
+    def to_json(self):
+        with self._lock:
+            sections = [
+                {'page': page, 'section': name, **stats.summary(), 'buckets_ms': list(BUCKETS_MS), 'bucket_counts': stats.buckets.tolist()}
+                for (page, name), stats in sorted(self.sections.items())
+            ]
+        return json.dumps({'sections': sections, 'sessions': self.session_summary()}, indent=2)
+
+    def to_prometheus(self):
+        """
+        The cumulative histograms and totals in the Prometheus text exposition format.
+        """
+        lines = [
+            '# HELP mcv_section_seconds Wall time of a dashboard section.',
+            '# TYPE mcv_section_seconds histogram',
+        ]
+        with self._lock:
+            items = sorted(self.sections.items())
+            for (page, name), stats in items:
+                labels = f'page="{page}",section="{name}"'
+                cumulative = np.cumsum(stats.buckets)
+                for bound, count in zip(BUCKETS_MS, cumulative[:-1]):
+                    lines.append(f'mcv_section_seconds_bucket{{{labels},le="{bound / 1000:g}"}} {count}')
+                lines.append(f'mcv_section_seconds_bucket{{{labels},le="+Inf"}} {cumulative[-1]}')
+                lines.append(f'mcv_section_seconds_sum{{{labels}}} {stats.total_ms / 1000:.6f}')
+                lines.append(f'mcv_section_seconds_count{{{labels}}} {stats.count}')
+            metric = f'mcv_section_{MEMORY_LABEL}_bytes'
+            lines += [f'# HELP {metric} Summed process-wide {"traced allocation" if TRACEMALLOC else "RSS"} change over a section.', f'# TYPE {metric} gauge']
+            lines += [f'{metric}{{page="{page}",section="{name}"}} {stats.memory_delta}' for (page, name), stats in items]
+            lines += ['# HELP mcv_section_payload_bytes Summed payload size produced by a section.', '# TYPE mcv_section_payload_bytes counter']
+            lines += [f'mcv_section_payload_bytes{{page="{page}",section="{name}"}} {stats.payload_bytes}' for (page, name), stats in items]
+        return '\n'.join(lines) + '\n'
+
+
+@st.cache_resource
+def get_profiler():
+    return Profiler()
+
+
+class Section:
+    """
+    Context manager timing one section. `payload` takes the payload or a callable returning it,
+    which is only evaluated (outside the timed region) when profiling is on.
+    """
+
+    def __init__(self, page, name):
+        self.page = page
+        self.name = name
+        self._payload = None
+
+    def payload(self, payload):
+        self._payload = payload
+
+    def __enter__(self):
+        self._memory = memory_bytes()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed_ms = (time.perf_counter() - self._start) * 1000
+        memory = memory_bytes()
+        memory_delta = memory - self._memory if memory is not None and self._memory is not None else 0
+        payload = self._payload() if callable(self._payload) else self._payload
+        get_profiler().record(self.page, self.name, elapsed_ms, memory_delta, payload_size(payload), current_session())
+        return False
+
+
+class _NoSection:
+    def payload(self, payload):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SECTION = _NoSection()
+
+
+def section(page, name):
+    """
+    Time the enclosed block as `name` on `page` when profiling is on.
+    """
+    return Section(page, name) if ENABLED else NO_SECTION
+
+
+def profiled(page, name=None):
+    """
+    Decorator form of `section`; the function itself is returned when profiling is off.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Section(page, name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def display_diagnostics():
+    """
+    The hidden diagnostics view: section timings, histograms, sessions, chart build times and
+    the memory of the shared datasets.
+    """
+    import pandas as pd
+    import streamlit_highcharts as hc
+    from utils.bundle import data_version
+    from utils.charts import get_chart_cache
+    from utils.datastore import get_data_store
+    st.title("Diagnostics")
+    if not ENABLED:
+        st.info(f"Profiling is off. Start the app with `{PROFILE_ENV}=1 streamlit run app/Home.py` to record section timings.")
+        return
+    profiler = get_profiler()
+    summary = pd.DataFrame(profiler.summary())
+    if summary.empty:
+        st.write("Nothing recorded yet. Open the other pages and come back.")
+        return
+    st.subheader("Sections")
+    st.dataframe(summary.sort_values('p95_ms', ascending=False), hide_index=True, use_container_width=True)
+    st.caption(f"`mean_{MEMORY_LABEL}_mb` is the change in {'traced Python allocations' if TRACEMALLOC else 'process RSS'} over a section. It is process-wide, so it includes the work of other sessions running at the same time.")
+
+    st.subheader("Latency histogram")
+    keys = list(zip(summary['page'], summary['section']))
+    page, name = st.selectbox("Section", keys, format_func=lambda key: f"{key[0]} / {key[1]}")
+    recent = st.toggle(f"Last {WINDOW} samples only", value=True)
+    labels = [f"≤ {bound} ms" for bound in BUCKETS_MS] + [f"> {BUCKETS_MS[-1]} ms"]
+    hc.streamlit_highcharts({
+        'chart': {'type': 'column'},
+        'title': {'text': f"{page} / {name}"},
+        'xAxis': {'categories': labels, 'title': {'text': 'Wall time'}},
+        'yAxis': {'title': {'text': 'Samples'}, 'allowDecimals': False},
+        'series': [{'name': 'Samples', 'data': profiler.histogram(page, name, recent).tolist()}],
+        'legend': {'enabled': False},
+    }, height=400)
+
+    st.subheader("Sessions")
+    st.dataframe(pd.DataFrame(profiler.session_summary()), hide_index=True, use_container_width=True)
+
+    st.subheader("Chart builds")
+    charts = pd.DataFrame.from_dict(get_chart_cache().stats(), orient='index')
+    st.dataframe(charts.rename_axis('chart').reset_index(), hide_index=True, use_container_width=True)
+
+    st.subheader("Datasets")
+    datasets = pd.DataFrame.from_dict(get_data_store(data_version()).stats(), orient='index')
+    st.dataframe(datasets.rename_axis('dataset').reset_index(), hide_index=True, use_container_width=True)
+
+    col1, col2, col3 = st.columns(3)
+    col1.download_button("Download JSON", profiler.to_json(), file_name="profile.json", mime="application/json")
+    col2.download_button("Download Prometheus text", profiler.to_prometheus(), file_name="profile.prom", mime="text/plain")
+    if col3.button("Reset"):
+        profiler.reset()
+        st.rerun()
@@ -0,0 +1,57 @@
+# Import libraries
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.datastore import load_dataset
+
+
+class RankingIndex:
+    """
+    District rankings for every statistic of a per-Area table, built once.
+
+    Ranks (1 = highest value, ties share the lowest rank) are kept as an int16 matrix of
+    Areas x statistics, alongside percentile and z-score variants, so looking up one
+    district is a single row read. Missing values get rank 0.
+    """
+
+    KINDS = ('rank', 'percentile', 'zscore')
+
+    def __init__(self, table, key='Area'):
+        table = table.set_index(key)
+        table.index = table.index.astype(str)
+        values = table.select_dtypes('number')
+        self.areas = values.index
+        self.statistics = values.columns
+        self._positions = {area: i for i, area in enumerate(self.areas)}
+        self.ranks = values.rank(ascending=False, method='min').fillna(0).to_numpy(dtype=np.int16)
+        self.percentiles = (values.rank(pct=True) * 100).to_numpy(dtype=np.float32)
+        std = values.std()
+        self.zscores = ((values - values.mean()) / std.where(std > 0)).to_numpy(dtype=np.float32)
+        for matrix in (self.ranks, self.percentiles, self.zscores):
+            matrix.flags.writeable = False
+
+    def matrix(self, kind='rank'):
+        return {'rank': self.ranks, 'percentile': self.percentiles, 'zscore': self.zscores}[kind]
+
+    def row(self, area, kind='rank'):
+        """
+        One district's ranks (or percentiles / z-scores) as a Series indexed by statistic.
+        """
+        return pd.Series(self.matrix(kind)[self._positions[area]], index=self.statistics, name=area)
+
+    def most_similar(self, area, k=5, kind='rank'):
+        """
+        The `k` districts whose rank vectors are closest to `area`'s (mean absolute difference).
+        """
+        matrix = self.matrix(kind).astype(np.float32)
+        distances = np.nanmean(np.abs(matrix - matrix[self._positions[area]]), axis=1)
+        distances[self._positions[area]] = np.inf
+        order = np.argsort(distances, kind='stable')[:k]
+        return pd.DataFrame({'Area': self.areas[order], 'distance': distances[order]})
+
+
+# Keyed by the data version like the data store, so the rankings follow a rebuilt bundle
+@st.cache_resource(max_entries=2)
+def load_ranking_index(version=None, table_name='weighted_averages_cleaned'):
+    return RankingIndex(load_dataset(table_name))
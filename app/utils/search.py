@@ -0,0 +1,216 @@
+"""
+Keyword (BM25) and topic-space search over the proposals in pro_merged.
+
+The index is built offline from the lemmatised title and text of every proposal and written
+to app/data/search as plain .npy arrays (a CSR inverted index, document lengths and the LDA
+topic vectors) plus a feather row index, all of which are memory-mapped when the dashboard
+loads them. BM25 matches lower-cased lemmas; the topic vectors are inferred from the lemmas as
+they are, since the LDA dictionary is case-sensitive.
+
+The dashboard builds the index on first use, and again whenever the data bundle or the active
+topic model has changed since it was built. To build it ahead of time (e.g. in a deploy step),
+run from the repository root:
+
+    PYTHONPATH=app python -m utils.search
+"""
+# Import libraries
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy as np
+import pyarrow.feather as feather
+import streamlit as st
+
+from utils.bundle import data_version, read_table
+from utils.text import SPACY_MODEL, preprocess, preprocess_batch
+from utils.topics import infer_topic_matrix, model_fingerprint
+
+SEARCH_DIR = 'app/data/search'
+SEARCH_MANIFEST = 'manifest.json'
+DOCUMENT_COLUMNS = ['id', 'round', 'district', 'selected', 'title']
+ARRAYS = ['indptr', 'doc_ids', 'term_freqs', 'doc_lengths', 'topics']
+
+# Standard BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def analyze(texts, workers=1):
+    """
+    Lemmas of each text, with the same cleaning and stopwords as the topic model.
+    """
+    return [[token for token in tokens if token.strip()] for tokens in preprocess_batch(texts, n_process=workers)]
+
+
+def bm25_terms(lemmas):
+    return [lemma.lower() for lemma in lemmas]
+
+
+def build_index(lda_model, dictionary, search_dir=SEARCH_DIR, workers=1):
+    documents = read_table('pro_merged', columns=DOCUMENT_COLUMNS + ['texts']).drop_duplicates(['id', 'round'])
+    documents = documents.reset_index(drop=True)
+    texts = (documents['title'].fillna('') + '. ' + documents['texts'].fillna('')).tolist()
+    print(f"Analysing {len(texts)} proposals...")
+    lemmas = analyze(texts, workers)
+    tokens = [bm25_terms(doc_lemmas) for doc_lemmas in lemmas]
+
+    # Inverted index in CSR form: the postings of term t are doc_ids[indptr[t]:indptr[t + 1]]
+    vocabulary = sorted({token for doc_tokens in tokens for token in doc_tokens})
+    term_ids = {term: i for i, term in enumerate(vocabulary)}
+    postings = [(term_ids[term], doc, tf) for doc, doc_tokens in enumerate(tokens) for term, tf in Counter(doc_tokens).items()]
+    postings = np.array(postings, dtype=np.int64).reshape(-1, 3)
+    postings = postings[np.lexsort((postings[:, 1], postings[:, 0]))]
+    arrays = {
+        'indptr': np.concatenate([[0], np.cumsum(np.bincount(postings[:, 0], minlength=len(vocabulary)))]).astype(np.int64),
+        'doc_ids': postings[:, 1].astype(np.int32),
+        'term_freqs': np.minimum(postings[:, 2], np.iinfo(np.uint16).max).astype(np.uint16),
+        'doc_lengths': np.array([len(doc_tokens) for doc_tokens in tokens], dtype=np.float32),
+        'topics': infer_topic_matrix([dictionary.doc2bow(doc_lemmas) for doc_lemmas in lemmas], lda_model).astype(np.float32),
+    }
+
+    os.makedirs(search_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(search_dir, f'{name}.npy'), array)
+    feather.write_feather(documents[DOCUMENT_COLUMNS], os.path.join(search_dir, 'documents.arrow'), compression='uncompressed')
+    with open(os.path.join(search_dir, 'vocabulary.json'), 'w') as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+    manifest = {
+        'built_at': datetime.now(timezone.utc).isoformat(),
+        'analyzer': SPACY_MODEL,
+        'model_fingerprint': model_fingerprint(),
+        # Bundle version, which also changes when proposals are ingested into segments
+        'data_version': data_version(),
+        'documents': len(documents),
+        'vocabulary': len(vocabulary),
+        'postings': len(postings),
+    }
+    with open(os.path.join(search_dir, SEARCH_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class SearchIndex:
+    """
+    Memory-mapped BM25 and topic-similarity search over the proposals.
+    """
+
+    def __init__(self, search_dir=SEARCH_DIR):
+        with open(os.path.join(search_dir, SEARCH_MANIFEST)) as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(search_dir, 'vocabulary.json')) as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(search_dir, f'{name}.npy'), mmap_mode='r'))
+        self.documents = feather.read_table(os.path.join(search_dir, 'documents.arrow'), memory_map=True).to_pandas()
+        self.average_length = float(np.mean(self.doc_lengths)) or 1.0
+        self._sqrt_topics = np.sqrt(self.topics)
+
+    def mask(self, districts=None, rounds=None):
+        keep = np.ones(len(self.documents), dtype=bool)
+        if districts:
+            keep &= self.documents['district'].isin(districts).to_numpy()
+        if rounds:
+            keep &= self.documents['round'].isin(rounds).to_numpy()
+        return keep
+
+    def bm25(self, terms, mask=None):
+        """
+        BM25 score of every proposal for the query `terms` (already analysed).
+        """
+        n = len(self.documents)
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(terms):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end].astype(np.float32)
+            idf = np.log(1 + (n - (end - start) + 0.5) / ((end - start) + 0.5))
+            norm = K1 * (1 - B + B * self.doc_lengths[docs] / self.average_length)
+            scores[docs] += idf * tf * (K1 + 1) / (tf + norm)
+        if mask is not None:
+            scores[~mask] = 0
+        return scores
+
+    def topic_similarity(self, topic_vector, mask=None):
+        """
+        Bhattacharyya coefficient between `topic_vector` and every proposal's topic mixture.
+        """
+        scores = self._sqrt_topics @ np.sqrt(np.asarray(topic_vector, dtype=np.float32))
+        if mask is not None:
+            scores = np.where(mask, scores, 0)
+        return scores
+
+    def top(self, scores, k=20):
+        """
+        The `k` highest-scoring proposals with a positive score, best first.
+        """
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        results = self.documents.iloc[candidates].reset_index(drop=True)
+        results.insert(0, 'score', scores[candidates])
+        return results
+
+    def search(self, query, mode='keywords', k=20, districts=None, rounds=None, lda_model=None, dictionary=None):
+        """
+        Ranked proposals for a free-text query, by keywords (BM25) or by topic similarity.
+        """
+        lemmas = [token for token in preprocess(query) if token.strip()]
+        mask = self.mask(districts, rounds)
+        if mode == 'keywords':
+            return self.top(self.bm25(bm25_terms(lemmas), mask), k)
+        bow = dictionary.doc2bow(lemmas)
+        if not bow:
+            return self.top(np.zeros(len(self.documents)), k)
+        topic_vector = infer_topic_matrix([bow], lda_model)[0]
+        return self.top(self.topic_similarity(topic_vector, mask), k)
+
+
+def index_is_current(version, fingerprint, search_dir=SEARCH_DIR):
+    path = os.path.join(search_dir, SEARCH_MANIFEST)
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        manifest = json.load(f)
+    return manifest.get('data_version') == version and manifest.get('model_fingerprint') == fingerprint
+
+
+# Keyed by the data version and the model fingerprint, so the index follows both
+@st.cache_resource(max_entries=1)
+def load_search_index(version, fingerprint, _lda_model, _dictionary, search_dir=SEARCH_DIR):
+    """
+    The search index, built first if it is missing or out of date. None when it cannot be built
+    because the spaCy model is not installed.
+    """
+    if not index_is_current(version, fingerprint, search_dir):
+        try:
+            build_index(_lda_model, _dictionary, search_dir)
+        except OSError:
+            return None
+    return SearchIndex(search_dir)
+
+
+def main():
+    import gensim
+    from utils.topics import active_model_files
+    parser = argparse.ArgumentParser(description="Build the proposal search index.")
+    parser.add_argument('--workers', type=int, default=1, help="spaCy processes used for lemmatisation")
+    parser.add_argument('--output', default=SEARCH_DIR)
+    args = parser.parse_args()
+    files = active_model_files()
+    lda_model = gensim.models.ldamodel.LdaModel.load(files['model'])
+    dictionary = gensim.corpora.Dictionary.load(files['dictionary'])
+    start = time.perf_counter()
+    manifest = build_index(lda_model, dictionary, args.output, args.workers)
+    print(f"Indexed {manifest['documents']} proposals and {manifest['vocabulary']} terms in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
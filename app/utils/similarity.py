@@ -0,0 +1,198 @@
+# Import libraries
+import argparse
+import copy
+import itertools
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils import datastore
+
+FEATURE_GROUPS = ('statistics', 'indices', 'topics')
+METRICS = ('cosine', 'mahalanobis')
+
+
+class DistrictSimilarity:
+    """
+    Nearest-neighbour search over district profiles.
+
+    Each district is described by three feature groups: the averaged statistics of
+    weighted_averages_cleaned, its index values and its topic mixture, the last two averaged
+    over the years seen so far. Features are z-scored and each group is scaled to equal
+    weight, then cosine and Mahalanobis distance matrices are precomputed for every
+    combination of groups, so a query is a row lookup and a sort.
+
+    Per-year index and topic values are kept as running sums: `add_years` folds in only the
+    years not seen before and then refreshes the matrices. `updated` uses it to follow a new
+    data version when the years already seen are unchanged.
+    """
+
+    def __init__(self, statistics, indexes, district_topic_data):
+        statistics = statistics.set_index('Area')
+        statistics.index = statistics.index.astype(str)
+        self.features = {'statistics': statistics.select_dtypes('number')}
+        self.years = {'indices': set(), 'topics': set()}
+        self._sums = {'indices': None, 'topics': None}
+        self._counts = {'indices': None, 'topics': None}
+        self.add_years(indexes, district_topic_data)
+        self.fingerprint = self._fingerprint(statistics, indexes, district_topic_data)
+
+    def _fingerprint(self, statistics, indexes, district_topic_data):
+        """
+        Order-independent hashes of the statistics and of the rows of the years already folded in.
+        """
+        parts = (
+            statistics,
+            indexes[indexes['Year'].isin(self.years['indices'])],
+            district_topic_data[district_topic_data['Year'].isin(self.years['topics'])],
+        )
+        return tuple(int(pd.util.hash_pandas_object(part, index=False).sum()) for part in parts)
+
+    def updated(self, statistics, indexes, district_topic_data):
+        """
+        The index for newer data. If only new years were added, they are folded into a copy of
+        this one, which sessions may still be reading; otherwise it is rebuilt from scratch.
+        """
+        if self._fingerprint(statistics, indexes, district_topic_data) != self.fingerprint:
+            return DistrictSimilarity(statistics, indexes, district_topic_data)
+        other = copy.copy(self)
+        other.features = dict(self.features)
+        other.years = {group: set(years) for group, years in self.years.items()}
+        other._sums, other._counts = dict(self._sums), dict(self._counts)
+        other.add_years(indexes, district_topic_data)
+        other.fingerprint = other._fingerprint(statistics, indexes, district_topic_data)
+        return other
+
+    def _fold(self, group, wide):
+        counts = wide.notna().astype(int)
+        sums = wide.fillna(0)
+        if self._sums[group] is not None:
+            sums = sums.add(self._sums[group], fill_value=0)
+            counts = counts.add(self._counts[group], fill_value=0)
+        self._sums[group], self._counts[group] = sums, counts
+        self.features[group] = sums / counts.where(counts > 0)
+
+    def add_years(self, indexes, district_topic_data):
+        """
+        Fold in the years of `indexes` / `district_topic_data` not seen before; returns them.
+        """
+        new_years = {
+            'indices': set(indexes['Year']) - self.years['indices'],
+            'topics': set(district_topic_data['Year']) - self.years['topics'],
+        }
+        if new_years['indices']:
+            new_indexes = indexes[indexes['Year'].isin(new_years['indices'])].assign(Area=lambda df: df['Area'].astype(str))
+            self._fold('indices', new_indexes.drop(columns='Year').groupby('Area').sum(min_count=1))
+        if new_years['topics']:
+            new_topics = district_topic_data[district_topic_data['Year'].isin(new_years['topics'])].assign(
+                district=lambda df: df['district'].astype(str), Topic=lambda df: df['Topic'].astype(str)
+            )
+            self._fold('topics', new_topics.pivot_table(index='district', columns='Topic', values='Proportion', aggfunc='sum'))
+        added = sorted(new_years['indices'] | new_years['topics'])
+        if added:
+            for group, years in new_years.items():
+                self.years[group] |= years
+            self._build()
+        return added
+
+    def _build(self):
+        self.areas = self.features['statistics'].index
+        self._positions = {area: i for i, area in enumerate(self.areas)}
+        blocks = {}
+        for group in FEATURE_GROUPS:
+            values = self.features[group].reindex(self.areas).to_numpy(dtype=float)
+            std = np.nanstd(values, axis=0)
+            z = (values - np.nanmean(values, axis=0)) / np.where(std > 0, std, 1.0)
+            # Missing values sit at the mean; each group contributes equally whatever its width
+            blocks[group] = np.nan_to_num(z) / np.sqrt(values.shape[1])
+        self.distances = {}
+        for size in range(1, len(FEATURE_GROUPS) + 1):
+            for groups in itertools.combinations(FEATURE_GROUPS, size):
+                x = np.hstack([blocks[group] for group in groups])
+                self.distances[(groups, 'cosine')] = cosine_distances(x)
+                self.distances[(groups, 'mahalanobis')] = mahalanobis_distances(x)
+
+    def neighbours(self, area, k=5, groups=FEATURE_GROUPS, metric='cosine'):
+        """
+        The `k` districts closest to `area` using the given feature groups and metric.
+        """
+        groups = tuple(group for group in FEATURE_GROUPS if group in groups)
+        row = self.distances[(groups, metric)][self._positions[area]].copy()
+        row[self._positions[area]] = np.inf
+        order = np.argsort(row, kind='stable')[:k]
+        return pd.DataFrame({'Area': self.areas[order], 'Distance': row[order]})
+
+
+def cosine_distances(x):
+    norm = np.linalg.norm(x, axis=1, keepdims=True)
+    unit = x / np.where(norm > 0, norm, 1.0)
+    return np.clip(1 - unit @ unit.T, 0.0, 2.0)
+
+
+def mahalanobis_distances(x):
+    """
+    Pairwise Mahalanobis distances. There are about as many features as districts, so the
+    sample covariance is singular; the Ledoit-Wolf shrinkage estimate is used instead.
+    """
+    from sklearn.covariance import LedoitWolf
+    centred = x - x.mean(axis=0)
+    eigenvalues, eigenvectors = np.linalg.eigh(LedoitWolf(assume_centered=True).fit(centred).covariance_)
+    # Whitening: Euclidean distance in this space equals Mahalanobis distance in the original one
+    whitened = centred @ eigenvectors / np.sqrt(np.maximum(eigenvalues, 1e-12))
+    squared = (whitened ** 2).sum(axis=1)
+    return np.sqrt(np.maximum(squared[:, None] + squared[None, :] - 2 * whitened @ whitened.T, 0.0))
+
+
+@st.cache_resource
+def similarity_holder():
+    return {'lock': threading.Lock(), 'similarity': None, 'version': None}
+
+
+def load_district_similarity(version=None):
+    """
+    The similarity index for data `version`, carried over from the previous version's when
+    only new years were added.
+    """
+    holder = similarity_holder()
+    with holder['lock']:
+        if holder['similarity'] is None or holder['version'] != version:
+            data = (datastore.weighted_averages(), datastore.indexes(), datastore.district_topic_proportions())
+            previous = holder['similarity']
+            holder['similarity'] = DistrictSimilarity(*data) if previous is None else previous.updated(*data)
+            holder['version'] = version
+        return holder['similarity']
+
+
+def check_incremental(statistics, indexes, district_topic_data):
+    """
+    Build the index without the latest year, fold that year in with `updated` and compare every
+    distance matrix with a full rebuild. Returns the largest absolute difference.
+    """
+    latest = max(indexes['Year'].max(), district_topic_data['Year'].max())
+    earlier = DistrictSimilarity(
+        statistics, indexes[indexes['Year'] < latest], district_topic_data[district_topic_data['Year'] < latest]
+    )
+    incremental = earlier.updated(statistics, indexes, district_topic_data)
+    if incremental is earlier or latest in earlier.years['indices'] | earlier.years['topics']:
+        raise ValueError("The incremental update did not fold in the latest year")
+    full = DistrictSimilarity(statistics, indexes, district_topic_data)
+    return max(float(np.max(np.abs(incremental.distances[key] - full.distances[key]))) for key in full.distances)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that folding in a new year matches rebuilding the district similarity index.")
+    parser.add_argument('--tolerance', type=float, default=1e-9)
+    args = parser.parse_args()
+    from utils.bundle import read_table
+    difference = check_incremental(
+        read_table('weighted_averages_cleaned'), read_table('indexes'), read_table('district_topic_proportions')
+    )
+    if difference > args.tolerance:
+        parser.exit(1, f"Incremental and full distance matrices differ by up to {difference:.3g}.\n")
+    print(f"Incremental update matches a full rebuild (max difference {difference:.3g}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Point-in-polygon assignment of proposals to districts.
+
+The unsimplified district polygons are put in a shapely STRtree and all points are matched in
+one bulk `within` query, which tests each candidate against the tree's prepared polygons, so the
+cost grows with the number of points rather than points x districts. A point on a shared border
+goes to the district listed first in districts.geojson. Points in no district can be snapped to
+the nearest one within `snap` metres (shorelines, slivers between polygons); only those points
+are reprojected to ETRS-TM35FIN for it. The rest are flagged as outside the city and get
+`location_not_specified`, like proposals without coordinates. Check pro_merged.csv against districts.geojson with:
+
+    PYTHONPATH=app python -m utils.spatial_join
+    PYTHONPATH=app python -m utils.spatial_join --snap 100 --flagged outside.csv --write
+"""
+# Import libraries
+import argparse
+import csv
+import os
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+import streamlit as st
+from pyproj import Transformer
+
+from utils.bundle import DATA_DIR, NO_LOCATION, read_csv
+from utils.geometry import GEOJSON_FILE, METRIC_CRS
+
+TO_METRIC = Transformer.from_crs(4326, METRIC_CRS, always_xy=True)
+
+
+class DistrictLocator:
+    """
+    STRtree over the district polygons, answering which district each of many points is in.
+    """
+
+    def __init__(self, geojson_file=GEOJSON_FILE):
+        gdf = gpd.read_file(geojson_file).to_crs(epsg=4326)
+        self.areas = gdf['Area'].to_numpy(dtype=object)
+        self.tree = shapely.STRtree(gdf.geometry.to_numpy())
+        # Metric copy for snapping and distances, which only the points outside every district need
+        self.metric_polygons = gdf.to_crs(epsg=METRIC_CRS).geometry.to_numpy()
+        self.metric_tree = shapely.STRtree(self.metric_polygons)
+
+    def metric_points(self, longitude, latitude):
+        x, y = TO_METRIC.transform(np.asarray(longitude, dtype=float), np.asarray(latitude, dtype=float))
+        return shapely.points(x, y)
+
+    def locate(self, longitude, latitude):
+        """
+        Index of the polygon containing each point, or -1.
+        """
+        codes = np.full(len(longitude), -1, dtype=np.int64)
+        point_index, polygon_index = self.tree.query(shapely.points(longitude, latitude), predicate='within')
+        # Keep the first-listed district for points on a shared border
+        order = np.lexsort((polygon_index, point_index))
+        point_index, polygon_index = point_index[order], polygon_index[order]
+        first = np.unique(point_index, return_index=True)[1]
+        codes[point_index[first]] = polygon_index[first]
+        return codes
+
+    def snap(self, longitude, latitude, distance):
+        """
+        Index of the polygon nearest each point if it is within `distance` metres, or -1.
+        """
+        points = self.metric_points(longitude, latitude)
+        codes = np.full(len(points), -1, dtype=np.int64)
+        point_index, polygon_index = self.metric_tree.query(points, predicate='dwithin', distance=distance)
+        if len(point_index):
+            gaps = shapely.distance(points[point_index], self.metric_polygons[polygon_index])
+            order = np.lexsort((gaps, point_index))
+            first = np.unique(point_index[order], return_index=True)[1]
+            codes[point_index[order][first]] = polygon_index[order][first]
+        return codes
+
+    def nearest(self, longitude, latitude):
+        """
+        Index of and distance in metres to the polygon nearest each point. Much slower than
+        `locate`, so only meant for the few points outside the city.
+        """
+        points = self.metric_points(longitude, latitude)
+        (point_index, polygon_index), distance = self.metric_tree.query_nearest(points, return_distance=True, all_matches=False)
+        codes = np.empty(len(points), dtype=np.int64)
+        distances = np.empty(len(points))
+        codes[point_index], distances[point_index] = polygon_index, distance
+        return codes, distances
+
+    def assign(self, longitude, latitude, snap=0):
+        """
+        District of every point as a DataFrame with columns `district` and `outside_city`
+        (has coordinates, but no district within `snap` metres).
+        """
+        longitude = np.asarray(longitude, dtype=float)
+        latitude = np.asarray(latitude, dtype=float)
+        located = ~(np.isnan(longitude) | np.isnan(latitude))
+        x, y = longitude[located], latitude[located]
+        codes = self.locate(x, y)
+        missed = codes < 0
+        if snap and missed.any():
+            codes[missed] = self.snap(x[missed], y[missed], snap)
+
+        district = np.full(len(longitude), NO_LOCATION, dtype=object)
+        district[located] = np.where(codes >= 0, self.areas[codes], NO_LOCATION)
+        outside_city = np.zeros(len(longitude), dtype=bool)
+        outside_city[located] = codes < 0
+        return pd.DataFrame({'district': district, 'outside_city': outside_city})
+
+
+@st.cache_resource
+def load_district_locator(geojson_file=GEOJSON_FILE):
+    return DistrictLocator(geojson_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assign the proposals in pro_merged.csv to districts by their coordinates.")
+    parser.add_argument('--snap', type=float, default=0, help="assign points outside every district to the nearest one within this many metres")
+    parser.add_argument('--flagged', help="write the proposals outside the city to this CSV")
+    parser.add_argument('--write', action='store_true', help="rewrite the district column of pro_merged.csv")
+    args = parser.parse_args()
+
+    proposals = read_csv('pro_merged')
+    locator = DistrictLocator()
+    start = time.perf_counter()
+    assigned = locator.assign(proposals['longitude'], proposals['latitude'], args.snap)
+    elapsed = time.perf_counter() - start
+    changed = proposals['district'].astype(str).to_numpy() != assigned['district'].to_numpy()
+    outside = assigned['outside_city'].to_numpy()
+    print(
+        f"Assigned {proposals['latitude'].notna().sum()} geolocated proposals in {elapsed * 1000:.0f} ms: "
+        f"{outside.sum()} outside the city, {changed.sum()} district(s) differ from pro_merged.csv."
+    )
+    if args.flagged:
+        flagged = proposals.loc[outside, ['id', 'round', 'title', 'latitude', 'longitude', 'district']]
+        codes, distances = locator.nearest(flagged['longitude'], flagged['latitude'])
+        flagged['nearest'], flagged['distance_m'] = locator.areas[codes], distances.round(1)
+        flagged.sort_values('distance_m').to_csv(args.flagged, index=False)
+        print(f"Wrote {len(flagged)} flagged proposals to {args.flagged}.")
+    if args.write and changed.any():
+        proposals['district'] = assigned['district'].to_numpy()
+        # Proposal texts can contain bare carriage returns, which pandas leaves unquoted by default
+        proposals.to_csv(os.path.join(DATA_DIR, 'pro_merged.csv'), index=False, quoting=csv.QUOTE_NONNUMERIC)
+        print("Rewrote pro_merged.csv; rebuild the data bundle with: PYTHONPATH=app python -m utils.bundle")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Import libraries
+import re
+from functools import lru_cache
+
+import streamlit as st
+
+SPACY_MODEL = "fi_core_news_sm"
+# Lemmatisation only needs the tokenizer, tagger/morphologizer and lemmatizer
+DISABLED_COMPONENTS = ["parser", "ner"]
+
+
+@st.cache_resource(show_spinner="Loading the Finnish language model...")
+def load_nlp():
+    """
+    Load the Finnish spaCy pipeline on first use and share it across sessions.
+    """
+    import spacy
+    return spacy.load(SPACY_MODEL, disable=DISABLED_COMPONENTS)
+
+
+@lru_cache(maxsize=1)
+def get_stopwords():
+    from spacy.lang.fi.stop_words import STOP_WORDS
+    return frozenset(STOP_WORDS)
+
+
+def clean_text(text):
+    text = text.lower()
+    text = re.sub(r',([^ ])', r', \1', text)
+    text = re.sub(r'http\S+|www.\S+', '', text)
+    text = re.sub(r'<[A-Za-z]+>', '', text)
+    text = re.sub(r'[<>@#%&]', '', text)
+    text = re.sub(r'&[a-z]+;', '', text)
+    text = re.sub(r'\d+', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def lemmas(doc):
+    stopwords = get_stopwords()
+    return [token.lemma_ for token in doc if not token.is_punct and token.lemma_.lower() not in stopwords]
+
+
+def preprocess(text, nlp=None):
+    nlp = nlp or load_nlp()
+    return lemmas(nlp(clean_text(text)))
+
+
+def preprocess_batch(texts, nlp=None, batch_size=256, n_process=1):
+    """
+    Preprocess many texts at once, streaming them through `nlp.pipe`.
+    """
+    nlp = nlp or load_nlp()
+    cleaned = (clean_text(text) for text in texts)
+    return [lemmas(doc) for doc in nlp.pipe(cleaned, batch_size=batch_size, n_process=n_process)]
@@ -0,0 +1,185 @@
+"""
+Incremental topic-proportion aggregation for new proposals.
+
+Keeps running per-(district, year) sums and counts of the proposals' topic vectors together
+with the (id, round) keys already folded in. New proposals are inferred once, appended to
+sample_proposals.csv and proposals_by_round_district.csv, and district_topic_proportions.csv
+is rewritten from the sums, so an update costs O(new proposals) and re-running it is a no-op.
+Run from the repository root:
+
+    PYTHONPATH=app python -m utils.topic_aggregation
+"""
+# Import libraries
+import csv
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.bundle import NO_LOCATION, read_table
+from utils.topics import active_model_files, predict_topics_batch, topic_columns
+
+DATA_DIR = 'app/data'
+STATE_FILE = 'app/data/topic_aggregation_state.json'
+KEYS = ['id', 'round']
+
+# Year each OmaStadi round is reported under; later rounds continue the two-year cycle
+ROUND_YEARS = {1: 2018, 2: 2020, 3: 2022}
+
+TOPIC_LABELS = [
+    "Topic_1_Enhancing_Parks_with_Playgrounds_and_Recreational_Amenities",
+    "Topic_2_Expanding_Waterfront_Access_and_Recreation",
+    "Topic_3_Developing_Inclusive_Public_Spaces_and_Services",
+    "Topic_4_Improving_Infrastructure_for_Accessibility_and_Safety",
+    "Topic_5_Enhancing_Pathways_and_Park_Connectivity",
+    "Topic_6_Community_Events_and_Participatory_Programmes",
+    "Topic_7_Developing_Spaces_for_Children_and_Youth",
+]
+
+
+def round_year(round_number):
+    return ROUND_YEARS.get(round_number, 2018 + 2 * (round_number - 1))
+
+
+def topic_label(k):
+    return TOPIC_LABELS[k] if k < len(TOPIC_LABELS) else f"Topic_{k + 1}"
+
+
+class TopicAggregator:
+    """
+    Running per-(district, year) sums of topic vectors, persisted as JSON between updates.
+    """
+
+    def __init__(self, num_topics, processed=None, groups=None):
+        self.num_topics = num_topics
+        self.processed = set(map(tuple, processed or []))
+        # (district, year) -> [count, sum of topic vectors]
+        self.groups = groups or {}
+
+    @classmethod
+    def from_proposals(cls, proposals, num_topics):
+        """
+        Seed the state from per-proposal topic vectors, e.g. the current sample_proposals.
+        """
+        aggregator = cls(num_topics)
+        aggregator.fold(proposals, proposals[topic_columns(num_topics)].to_numpy(dtype=float))
+        return aggregator
+
+    @classmethod
+    def load(cls, state_file=STATE_FILE):
+        with open(state_file) as f:
+            state = json.load(f)
+        groups = {
+            (group['district'], group['year']): [group['count'], np.array(group['sums'])]
+            for group in state['groups']
+        }
+        return cls(state['num_topics'], state['processed'], groups)
+
+    def save(self, state_file=STATE_FILE):
+        state = {
+            'num_topics': self.num_topics,
+            'processed': sorted(self.processed),
+            'groups': [
+                {'district': district, 'year': year, 'count': count, 'sums': sums.tolist()}
+                for (district, year), (count, sums) in sorted(self.groups.items())
+            ],
+        }
+        with open(state_file, 'w') as f:
+            json.dump(state, f, ensure_ascii=False)
+
+    def new_proposals(self, proposals):
+        """
+        Proposals whose (id, round) has not been folded in yet, deduplicated.
+        """
+        proposals = proposals.drop_duplicates(KEYS)
+        seen = [(int(i), int(r)) in self.processed for i, r in zip(proposals['id'], proposals['round'])]
+        return proposals[~np.array(seen, dtype=bool)].reset_index(drop=True)
+
+    def fold(self, proposals, topic_matrix):
+        """
+        Add the topic vectors of `proposals` (one row each) to the district/year sums. Proposals
+        without a district, or placed outside every district, are marked as processed only.
+        """
+        for (i, r, district), vector in zip(proposals[KEYS + ['district']].itertuples(index=False, name=None), topic_matrix):
+            self.processed.add((int(i), int(r)))
+            if pd.isna(district) or district == NO_LOCATION:
+                continue
+            key = (str(district), round_year(int(r)))
+            count, sums = self.groups.get(key, (0, np.zeros(self.num_topics)))
+            self.groups[key] = [count + 1, sums + vector]
+
+    def district_topic_proportions(self):
+        """
+        Long-format table (district, Year, Topic, Proportion) read by the RQ2/RQ3 topic trends.
+        """
+        rows = [
+            (district, year, topic_label(k), sums[k] / count)
+            for (district, year), (count, sums) in self.groups.items()
+            for k in range(self.num_topics)
+        ]
+        table = pd.DataFrame(rows, columns=['district', 'Year', 'Topic', 'Proportion'])
+        return table.sort_values(['Topic', 'district', 'Year']).reset_index(drop=True)
+
+
+def load_aggregator(state_file=STATE_FILE, num_topics=len(TOPIC_LABELS)):
+    """
+    The saved state or, on the first run, one seeded from sample_proposals. The derived tables
+    were built from the proposals in pro_merged at the time, including those left out of the
+    sample, so all of them are marked as processed and only proposals added later count as new.
+    """
+    if os.path.exists(state_file):
+        return TopicAggregator.load(state_file)
+    sample = read_table('sample_proposals', columns=KEYS + ['district'] + topic_columns(num_topics))
+    aggregator = TopicAggregator.from_proposals(sample, num_topics)
+    stored = read_table('pro_merged', columns=KEYS)
+    aggregator.processed.update(zip(stored['id'].astype(int).tolist(), stored['round'].astype(int).tolist()))
+    return aggregator
+
+
+def update(proposals, dictionary, lda_model, state_file=STATE_FILE, data_dir=DATA_DIR):
+    """
+    Infer and fold in the proposals not seen before, then update the three derived tables.
+    Returns the number of proposals added.
+    """
+    aggregator = load_aggregator(state_file, lda_model.num_topics)
+    new = aggregator.new_proposals(proposals.dropna(subset=['texts']))
+    if new.empty:
+        return 0
+    columns = topic_columns(lda_model.num_topics)
+    predictions = predict_topics_batch(new['texts'].tolist(), dictionary, lda_model)
+    topic_matrix = predictions[columns].to_numpy()
+
+    per_proposal = new[KEYS + ['title', 'texts', 'district', 'latitude', 'longitude']].copy()
+    per_proposal['selected'] = (new['selected'] == 'Selected').to_numpy()
+    per_proposal[columns] = topic_matrix
+    per_proposal['top_topic'] = predictions['top_topic'].to_numpy()
+    sample_columns = ['id', 'round', 'title', 'texts', 'district', 'selected', 'latitude', 'longitude'] + columns + ['top_topic']
+    # Proposal texts can contain bare carriage returns, which pandas leaves unquoted by default
+    per_proposal[sample_columns].to_csv(
+        os.path.join(data_dir, 'sample_proposals.csv'), mode='a', header=False, index=False, quoting=csv.QUOTE_NONNUMERIC
+    )
+    per_proposal[['round', 'district', 'selected'] + columns].to_csv(
+        os.path.join(data_dir, 'proposals_by_round_district.csv'), mode='a', header=False, index=False
+    )
+
+    aggregator.fold(new, topic_matrix)
+    aggregator.district_topic_proportions().to_csv(os.path.join(data_dir, 'district_topic_proportions.csv'), index=False)
+    aggregator.save(state_file)
+    return len(new)
+
+
+def main():
+    import gensim
+    files = active_model_files()
+    lda_model = gensim.models.ldamodel.LdaModel.load(files['model'])
+    dictionary = gensim.corpora.Dictionary.load(files['dictionary'])
+    proposals = read_table('pro_merged', columns=KEYS + ['title', 'texts', 'district', 'selected', 'latitude', 'longitude'])
+    added = update(proposals, dictionary, lda_model)
+    print(f"Folded in {added} new proposals." if added else "No new proposals.")
+    if added:
+        print("Rebuild the data bundle to pick them up: PYTHONPATH=app python -m utils.bundle")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Parallel sweep over the number of LDA topics that regenerates topic_numbers.csv.
+
+Models for every (num_topics, seed) pair are trained in a process pool and checkpointed as they
+finish. Coherence (c_v) is then scored against a single co-occurrence accumulator built once
+over the union of all models' top words, and each score is checkpointed too, so an interrupted
+sweep resumes where it stopped. Checkpointed models are only reused if they were trained on the
+same corpus and dictionary with the same parameters.
+
+The CSV is started afresh with the models already scored and every new score is appended as
+it lands; at the end it is rewritten in order. It never mixes rows of different sweeps.
+Run from the repository root:
+
+    PYTHONPATH=app python -m utils.topic_sweep --min-topics 2 --max-topics 19 --seeds 10
+"""
+# Import libraries
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from gensim.corpora import Dictionary, MmCorpus
+from gensim.models import CoherenceModel, LdaModel
+
+from utils.bundle import file_hash
+from utils.lda_pipeline import TOKENS_FILE
+from utils.topics import active_model_files
+
+OUTPUT_FILE = "app/data/topic_numbers.csv"
+TOP_N = 20
+
+# Per-process state, loaded once by the pool initializer
+_corpus = None
+_dictionary = None
+
+
+def _init_worker(corpus_file, dictionary_file):
+    global _corpus, _dictionary
+    _corpus = list(MmCorpus(corpus_file))
+    _dictionary = Dictionary.load(dictionary_file)
+
+
+def _train_one(num_topics, seed, passes, iterations):
+    lda_model = LdaModel(
+        corpus=_corpus,
+        id2word=_dictionary,
+        num_topics=num_topics,
+        passes=passes,
+        iterations=iterations,
+        random_state=seed,
+    )
+    top_words = [[int(word_id) for word_id, _ in lda_model.get_topic_terms(k, topn=TOP_N)] for k in range(num_topics)]
+    return {
+        'topic': num_topics,
+        'seed': seed,
+        'perplexity': float(lda_model.log_perplexity(_corpus)),
+        'top_words': top_words,
+    }
+
+
+def load_texts(corpus_file, dictionary, tokens_file=None):
+    """
+    Token lists for the sliding-window coherence. Without the tokens written by the training
+    pipeline, each document is rebuilt from its bag of words, which loses word order.
+    """
+    if tokens_file and os.path.exists(tokens_file):
+        with open(tokens_file) as f:
+            return [json.loads(line) for line in f]
+    return [
+        [dictionary[word_id] for word_id, count in doc for _ in range(int(count))]
+        for doc in MmCorpus(corpus_file)
+    ]
+
+
+def sweep_fingerprint(files, tokens_file, passes, iterations):
+    """
+    Hash of the corpus, dictionary and coherence texts plus the training parameters: the
+    checkpointed models of a sweep with another fingerprint are not comparable.
+    """
+    sha = hashlib.sha256()
+    for path in (files['corpus'], files['dictionary'], tokens_file):
+        if path and os.path.exists(path):
+            sha.update(file_hash(path).encode())
+    sha.update(json.dumps({'passes': passes, 'iterations': iterations, 'top_n': TOP_N}).encode())
+    return sha.hexdigest()[:16]
+
+
+def load_checkpoint(checkpoint_file, fingerprint):
+    """
+    Checkpointed models by (topic, seed) that match `fingerprint`, and the number ignored.
+    """
+    entries = {}
+    ignored = set()
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as f:
+            for line in f:
+                entry = json.loads(line)
+                key = (entry['topic'], entry['seed'])
+                if entry.get('fingerprint') != fingerprint:
+                    ignored.add(key)
+                    continue
+                # Later lines (the scored version of a model) replace earlier ones
+                entries[key] = entry
+    return entries, len(ignored - set(entries))
+
+
+def append_line(path, line):
+    with open(path, 'a') as f:
+        f.write(line + "\n")
+        f.flush()
+
+
+def write_results(entries, output_file):
+    """
+    Replace `output_file` with one row per scored model, by topic count and seed.
+    """
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write("topic,coherence,perplexity\n")
+        for entry in sorted(entries, key=lambda entry: (entry['topic'], entry['seed'])):
+            f.write(result_row(entry) + "\n")
+    os.replace(tmp_file, output_file)
+
+
+def result_row(entry):
+    return f"{entry['topic']},{entry['coherence']},{entry['perplexity']}"
+
+
+def shared_coherence_model(pending, texts, dictionary):
+    """
+    One c_v CoherenceModel whose co-occurrence accumulator covers the top words of every
+    pending model, so scoring each model afterwards reuses the same counts.
+    """
+    all_topics = [topic for entry in pending for topic in entry['top_words']]
+    coherence_model = CoherenceModel(topics=all_topics, texts=texts, dictionary=dictionary, coherence='c_v', topn=TOP_N)
+    coherence_model.estimate_probabilities()
+    return coherence_model
+
+
+def sweep(topic_range, seeds, workers, passes, iterations, output_file=OUTPUT_FILE, checkpoint_file=None, fresh=False):
+    files = active_model_files()
+    tokens_file = os.path.join(os.path.dirname(files['model']), TOKENS_FILE) if files['version'] else None
+    checkpoint_file = checkpoint_file or output_file + '.checkpoint.jsonl'
+    if fresh:
+        for path in (output_file, checkpoint_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    fingerprint = sweep_fingerprint(files, tokens_file, passes, iterations)
+    done, ignored = load_checkpoint(checkpoint_file, fingerprint)
+    if ignored:
+        print(f"Ignoring {ignored} checkpointed models trained on another corpus, dictionary or parameters.")
+    todo = [(k, seed) for k in topic_range for seed in seeds if (k, seed) not in done]
+    print(f"{len(done)} models checkpointed, {len(todo)} to train.")
+    # Start the CSV over with the models of this sweep already scored; new scores are appended
+    write_results([entry for key, entry in done.items() if 'coherence' in entry and key[0] in topic_range and key[1] in seeds], output_file)
+
+    # Phase 1: train in parallel, checkpointing each model as soon as it finishes
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(files['corpus'], files['dictionary'])) as pool:
+        futures = [pool.submit(_train_one, k, seed, passes, iterations) for k, seed in todo]
+        for future in as_completed(futures):
+            entry = future.result()
+            entry['fingerprint'] = fingerprint
+            done[(entry['topic'], entry['seed'])] = entry
+            append_line(checkpoint_file, json.dumps(entry))
+            print(f"Trained k={entry['topic']} seed={entry['seed']} (perplexity {entry['perplexity']:.3f})")
+
+    # Phase 2: score coherence from shared co-occurrence statistics, checkpointing every score
+    requested = [entry for key, entry in sorted(done.items()) if key[0] in topic_range and key[1] in seeds]
+    pending = [entry for entry in requested if 'coherence' not in entry]
+    if pending:
+        dictionary = Dictionary.load(files['dictionary'])
+        texts = load_texts(files['corpus'], dictionary, tokens_file)
+        coherence_model = shared_coherence_model(pending, texts, dictionary)
+        for entry in pending:
+            coherence_model.topics = entry['top_words']
+            entry['coherence'] = float(coherence_model.get_coherence())
+            append_line(checkpoint_file, json.dumps(entry))
+            append_line(output_file, result_row(entry))
+            print(f"Scored k={entry['topic']} seed={entry['seed']} (coherence {entry['coherence']:.3f})")
+    # Rewritten in (topic, seed) order now that every requested model is scored
+    write_results(requested, output_file)
+    print(f"Wrote {output_file}. Rebuild the data bundle to pick it up: PYTHONPATH=app python -m utils.bundle")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep LDA topic counts and regenerate topic_numbers.csv.")
+    parser.add_argument('--min-topics', type=int, default=2)
+    parser.add_argument('--max-topics', type=int, default=19)
+    parser.add_argument('--seeds', type=int, default=10, help="models trained per topic count")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--passes', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    parser.add_argument('--checkpoint', help="defaults to <output>.checkpoint.jsonl")
+    parser.add_argument('--fresh', action='store_true', help="discard the checkpoint and start over")
+    args = parser.parse_args()
+    sweep(
+        range(args.min_topics, args.max_topics + 1),
+        range(args.seeds),
+        args.workers,
+        args.passes,
+        args.iterations,
+        args.output,
+        args.checkpoint,
+        args.fresh,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# Import libraries
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.text import clean_text, preprocess_batch
+
+LDA_MODEL_FILE = "app/data/lda_model.model"
+DICTIONARY_FILE = "app/data/lda_dictionary.dict"
+CORPUS_FILE = "app/data/lda_corpus.mm"
+# (id, round, district, selected) of each document of CORPUS_FILE, in corpus order
+CORPUS_DOCUMENTS_FILE = "app/data/lda_corpus_documents.csv"
+MODELS_DIR = "app/data/models"
+MODEL_MANIFEST = "manifest.json"
+
+# Parallel spaCy workers only pay off once the batch is large enough to amortise their startup
+PARALLEL_THRESHOLD = 1000
+
+_file_hashes = {}
+
+
+def _file_hash(path):
+    # Re-hash a file only when its size or modification time changes
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _file_hashes:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        _file_hashes[key] = sha.hexdigest()
+    return _file_hashes[key]
+
+
+def load_model_manifest(models_dir=MODELS_DIR):
+    path = os.path.join(models_dir, MODEL_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def active_model_files(models_dir=MODELS_DIR):
+    """
+    Paths of the model artefacts the dashboard should use.
+
+    This is the version marked active in app/data/models/manifest.json, or the artefacts at the
+    top of app/data when no retrained version has been activated.
+    """
+    manifest = load_model_manifest(models_dir)
+    if manifest and manifest.get('active'):
+        version_dir = os.path.join(models_dir, manifest['active'])
+        return {
+            'version': manifest['active'],
+            'model': os.path.join(version_dir, os.path.basename(LDA_MODEL_FILE)),
+            'dictionary': os.path.join(version_dir, os.path.basename(DICTIONARY_FILE)),
+            'corpus': os.path.join(version_dir, os.path.basename(CORPUS_FILE)),
+        }
+    return {'version': None, 'model': LDA_MODEL_FILE, 'dictionary': DICTIONARY_FILE, 'corpus': CORPUS_FILE}
+
+
+def model_fingerprint(model_file=None, dictionary_file=None):
+    """
+    Hash of the LDA model (including its companion .npy/.state files) and the dictionary.
+    Defaults to the active model version.
+    """
+    if model_file is None or dictionary_file is None:
+        files = active_model_files()
+        model_file, dictionary_file = model_file or files['model'], dictionary_file or files['dictionary']
+    paths = sorted(glob.glob(glob.escape(model_file) + '*')) + [dictionary_file]
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(os.path.basename(path).encode())
+        sha.update(_file_hash(path).encode())
+    return sha.hexdigest()[:16]
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache with a time-to-live for topic predictions.
+
+    Entries are keyed by the hash of the normalised text, and the whole cache is dropped when
+    the model fingerprint it was filled under changes.
+    """
+
+    def __init__(self, maxsize=512, ttl=24 * 60 * 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.fingerprint = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(clean_text(text).encode()).hexdigest()
+
+    def get_or_compute(self, text, fingerprint, compute):
+        key = self.key(text)
+        now = time.monotonic()
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self._entries.clear()
+                self.fingerprint = fingerprint
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                self._entries[key] = (now, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'fingerprint': self.fingerprint,
+            }
+
+
+@st.cache_resource
+def get_prediction_cache():
+    return PredictionCache()
+
+
+def topic_columns(num_topics):
+    return [f"Topic_{i}" for i in range(num_topics)]
+
+
+def infer_topic_matrix(bows, lda_model):
+    """
+    Infer normalised topic distributions for a list of bag-of-words documents in one pass.
+    """
+    if not bows:
+        return np.empty((0, lda_model.num_topics))
+    gamma, _ = lda_model.inference(bows)
+    return gamma / gamma.sum(axis=1, keepdims=True)
+
+
+def predict_topics_batch(texts, dictionary, lda_model, batch_size=256, n_process=None):
+    """
+    Score every text as a separate document and return one row of topic proportions per text.
+    Texts that are empty or not strings are skipped; the rows keep the index of `texts` (the
+    positions, for a list), so results can be matched back to the input. By default large
+    inputs are lemmatised in a process pool; the dashboard passes n_process=1.
+    """
+    texts = texts if isinstance(texts, pd.Series) else pd.Series(list(texts), dtype=object)
+    kept = texts[[isinstance(text, str) and bool(text.strip()) for text in texts]]
+    texts = kept.tolist()
+    if n_process is None:
+        n_process = 1 if len(texts) < PARALLEL_THRESHOLD else min(4, os.cpu_count() or 1)
+    tokens = preprocess_batch(texts, batch_size=batch_size, n_process=n_process)
+    bows = [dictionary.doc2bow(doc_tokens) for doc_tokens in tokens]
+    matrix = infer_topic_matrix(bows, lda_model)
+
+    columns = topic_columns(lda_model.num_topics)
+    results = pd.DataFrame(matrix, columns=columns, index=kept.index)
+    results.insert(0, 'text', texts)
+    results['top_topic'] = np.array(columns)[matrix.argmax(axis=1)]
+    return results
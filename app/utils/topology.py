@@ -0,0 +1,331 @@
+"""
+Build-time geometry stage for the client-side district choropleth.
+
+districts.geojson is split into arcs at the points where neighbouring districts stop sharing a
+border, so every shared border is stored, simplified and quantised once and both districts
+refer to it. Simplification runs per arc in metres with the arc's end points fixed, so adjacent
+districts stay gap-free at any tolerance. Each level of detail is written as its own TopoJSON
+file into the district_choropleth component's directory, together with a manifest that tells
+the map from which zoom level to use it. Before anything is written, every level is decoded
+again and checked against the source polygons: a district's area and centroid may not move by
+more than the error budget. Rebuild after districts.geojson changes, from the repository root:
+
+    PYTHONPATH=app python -m utils.topology
+    PYTHONPATH=app python -m utils.topology --level 0 5 10000 --level 14 0 100000
+"""
+# Import libraries
+import argparse
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pyproj import Transformer
+from shapely.geometry import LineString, MultiPolygon, Polygon
+
+from utils.geometry import GEOJSON_FILE, METRIC_CRS
+
+OUTPUT_DIR = 'app/components/district_choropleth/frontend'
+MANIFEST_FILE = os.path.join(OUTPUT_DIR, 'districts.json')
+OBJECT_NAME = 'districts'
+# (minimum zoom, simplification tolerance in metres, quantization) per level of detail
+LEVELS = ((0, 10, 10000), (13, 2, 100000), (15, 0, 100000))
+# Largest relative area change and centroid shift (metres) allowed for any district
+MAX_AREA_ERROR = 0.005
+MAX_CENTROID_ERROR = 20
+
+TO_METRIC = Transformer.from_crs(4326, METRIC_CRS, always_xy=True)
+FROM_METRIC = Transformer.from_crs(METRIC_CRS, 4326, always_xy=True)
+
+
+def polygon_parts(geometry):
+    return [geometry] if geometry.geom_type == 'Polygon' else list(geometry.geoms)
+
+
+def closed_ring(coords):
+    """
+    The ring's points as tuples without consecutive duplicates, first point repeated at the end.
+    """
+    points = [coords[0]]
+    for point in coords[1:]:
+        if point != points[-1]:
+            points.append(point)
+    if points[0] != points[-1]:
+        points.append(points[0])
+    return points
+
+
+def extract_arcs(rings):
+    """
+    Split closed rings into arcs wherever the set of rings sharing an edge changes.
+
+    Returns the distinct arcs and, for every ring, the indices of the arcs it is made of, with
+    ~i for an arc that is walked backwards, as in TopoJSON.
+    """
+    def edge(a, b):
+        return (a, b) if a < b else (b, a)
+
+    owners = defaultdict(set)
+    for r, ring in enumerate(rings):
+        for a, b in zip(ring[:-1], ring[1:]):
+            owners[edge(a, b)].add(r)
+
+    arcs, index, ring_arcs = [], {}, []
+
+    def add_arc(points):
+        points = tuple(points)
+        if points in index:
+            return index[points]
+        if points[::-1] in index:
+            return ~index[points[::-1]]
+        index[points] = len(arcs)
+        arcs.append(list(points))
+        return len(arcs) - 1
+
+    for ring in rings:
+        vertices = ring[:-1]
+        shared = [frozenset(owners[edge(a, b)]) for a, b in zip(ring[:-1], ring[1:])]
+        breaks = [i for i in range(len(shared)) if shared[i] != shared[i - 1]]
+        if not breaks:
+            # Nothing to split at: start at the smallest point so an identical ring, such as a
+            # hole and the district filling it, maps to the same arc
+            start = vertices.index(min(vertices))
+            ring_arcs.append([add_arc(vertices[start:] + vertices[:start + 1])])
+            continue
+        ring_arcs.append([
+            add_arc([vertices[i % len(vertices)] for i in range(start, end + 1)])
+            for start, end in zip(breaks, breaks[1:] + [breaks[0] + len(vertices)])
+        ])
+    return arcs, ring_arcs
+
+
+def simplify_arc(points, tolerance):
+    """
+    Douglas-Peucker simplification of one arc in metres; the end points always stay.
+    """
+    if not tolerance or len(points) <= 2:
+        return np.asarray(points)
+    x, y = TO_METRIC.transform(*np.asarray(points).T)
+    simplified = LineString(np.column_stack([x, y])).simplify(tolerance, preserve_topology=True)
+    coords = np.asarray(simplified.coords)
+    if points[0] == points[-1] and len(coords) < 4:
+        # A closed arc collapsing below a triangle would drop its district
+        return np.asarray(points)
+    x, y = FROM_METRIC.transform(*coords.T)
+    result = np.column_stack([x, y])
+    # Keep the end points bit-identical so the arcs still meet after the round trip
+    result[0], result[-1] = points[0], points[-1]
+    return result
+
+
+def quantize(coords, translate, scale):
+    return np.round((np.asarray(coords) - translate) / scale).astype(np.int64)
+
+
+def delta_encode(points):
+    """
+    First point absolute, the rest as offsets from the previous one, with repeated points dropped.
+    """
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(np.diff(points, axis=0) != 0, axis=1)
+    points = points[keep]
+    if len(points) == 1:
+        # An arc shorter than one quantization step still needs its two ends
+        points = np.vstack([points, points])
+    return np.vstack([points[:1], np.diff(points, axis=0)]).tolist()
+
+
+def encode_topology(gdf, tolerance=0, quantization=100000, key='Area'):
+    """
+    TopoJSON Topology of the polygons in `gdf` (EPSG:4326) with shared borders as shared arcs,
+    simplified by `tolerance` metres and quantised to a `quantization` x `quantization` grid.
+    """
+    rings, structure = [], []
+    for geometry in gdf.geometry:
+        parts = []
+        for polygon in polygon_parts(geometry):
+            parts.append([])
+            for ring in [polygon.exterior, *polygon.interiors]:
+                parts[-1].append(len(rings))
+                rings.append(closed_ring(list(ring.coords)))
+        structure.append(parts)
+    arcs, ring_arcs = extract_arcs(rings)
+
+    x0, y0, x1, y1 = gdf.total_bounds
+    translate = np.array([x0, y0])
+    scale = np.array([(x1 - x0) / (quantization - 1), (y1 - y0) / (quantization - 1)])
+    encoded = [delta_encode(quantize(simplify_arc(arc, tolerance), translate, scale)) for arc in arcs]
+
+    geometries = []
+    for i, (value, parts) in enumerate(zip(gdf[key], structure)):
+        polygons = [[ring_arcs[r] for r in part] for part in parts]
+        if len(polygons) == 1:
+            geometry = {'type': 'Polygon', 'arcs': polygons[0]}
+        else:
+            geometry = {'type': 'MultiPolygon', 'arcs': polygons}
+        geometries.append({**geometry, 'id': i, 'properties': {key: value}})
+    return {
+        'type': 'Topology',
+        'transform': {'scale': scale.tolist(), 'translate': translate.tolist()},
+        'objects': {OBJECT_NAME: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': encoded,
+    }
+
+
+def decode_topology(topology):
+    """
+    The shapely polygons of a topology written by `encode_topology`, in geometry order.
+    """
+    scale = np.array(topology['transform']['scale'])
+    translate = np.array(topology['transform']['translate'])
+    arcs = [np.cumsum(np.array(arc), axis=0) * scale + translate for arc in topology['arcs']]
+
+    def ring(indices):
+        points = [arcs[i] if i >= 0 else arcs[~i][::-1] for i in indices]
+        return np.vstack([points[0]] + [p[1:] for p in points[1:]])
+
+    def polygon(rings):
+        return Polygon(ring(rings[0]), [ring(interior) for interior in rings[1:]])
+
+    polygons = []
+    for geometry in topology['objects'][OBJECT_NAME]['geometries']:
+        if geometry['type'] == 'Polygon':
+            polygons.append(polygon(geometry['arcs']))
+        else:
+            polygons.append(MultiPolygon([polygon(part) for part in geometry['arcs']]))
+    return polygons
+
+
+def geometry_errors(gdf, topology):
+    """
+    Per district: relative area change, centroid shift in metres and validity of the decoded
+    topology against the source polygons.
+    """
+    source = gdf.to_crs(epsg=METRIC_CRS).geometry.reset_index(drop=True)
+    decoded = gpd.GeoSeries(decode_topology(topology), crs=4326).to_crs(epsg=METRIC_CRS)
+    return pd.DataFrame({
+        'Area': gdf['Area'].to_numpy(),
+        'area_error': (decoded.area - source.area).abs() / source.area,
+        'centroid_error': decoded.centroid.distance(source.centroid),
+        'valid': decoded.is_valid,
+    })
+
+
+def check_budget(errors, max_area_error=MAX_AREA_ERROR, max_centroid_error=MAX_CENTROID_ERROR):
+    """
+    Raise ValueError naming the districts outside the error budget.
+    """
+    over = errors[(errors['area_error'] > max_area_error) | (errors['centroid_error'] > max_centroid_error) | ~errors['valid']]
+    if len(over):
+        rows = ', '.join(
+            f"{row.Area} (area {row.area_error:.2%}, centroid {row.centroid_error:.1f} m{'' if row.valid else ', invalid'})"
+            for row in over.itertuples()
+        )
+        raise ValueError(f"{len(over)} district(s) exceed the error budget: {rows}")
+
+
+def build_topology(geojson_file=GEOJSON_FILE, output_dir=OUTPUT_DIR, levels=LEVELS,
+                   max_area_error=MAX_AREA_ERROR, max_centroid_error=MAX_CENTROID_ERROR):
+    """
+    Encode and validate every level of detail, then write the level files and the manifest.
+    Nothing is written if a level is over the error budget.
+    """
+    gdf = gpd.read_file(geojson_file).to_crs(epsg=4326)[['Area', 'geometry']].reset_index(drop=True)
+    files, written = [], []
+    for min_zoom, tolerance, quantization in sorted(levels):
+        topology = encode_topology(gdf, tolerance, quantization)
+        errors = geometry_errors(gdf, topology)
+        try:
+            check_budget(errors, max_area_error, max_centroid_error)
+        except ValueError as e:
+            raise ValueError(f"Level from zoom {min_zoom} (tolerance {tolerance} m): {e}") from None
+        content = json.dumps(topology, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        files.append((f'districts-z{min_zoom}.topojson', content))
+        written.append({
+            'min_zoom': min_zoom,
+            'file': files[-1][0],
+            'hash': hashlib.sha256(content).hexdigest()[:12],
+            'tolerance_m': tolerance,
+            'quantization': quantization,
+            'arcs': len(topology['arcs']),
+            'bytes': len(content),
+            'max_area_error': float(errors['area_error'].max()),
+            'max_centroid_error_m': float(errors['centroid_error'].max()),
+        })
+    manifest = {'object': OBJECT_NAME, 'areas': gdf['Area'].tolist(), 'levels': written}
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in os.listdir(output_dir):
+        if name.startswith('districts-z') and name.endswith('.topojson'):
+            os.remove(os.path.join(output_dir, name))
+    for name, content in files:
+        with open(os.path.join(output_dir, name), 'wb') as f:
+            f.write(content)
+    with open(os.path.join(output_dir, os.path.basename(MANIFEST_FILE)), 'w') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+class DistrictTopology:
+    """
+    The Area order and content version of the built levels of detail, which is all the server
+    needs to send a value vector the client can match to its features.
+    """
+
+    def __init__(self, path=MANIFEST_FILE):
+        with open(path, 'rb') as f:
+            content = f.read()
+        manifest = json.loads(content)
+        self.areas = manifest['areas']
+        self.levels = manifest['levels']
+        self.version = hashlib.sha256(content).hexdigest()[:12]
+
+    def values(self, df_year, column, decimals=None):
+        """
+        `column` of `df_year` in the topology's Area order, with None for missing districts.
+        """
+        values = df_year.drop_duplicates('Area').set_index('Area')[column].reindex(self.areas)
+        if decimals is not None:
+            values = values.round(decimals)
+        return [None if np.isnan(value) else float(value) for value in values.to_numpy(dtype=float)]
+
+
+def topology_version(path=MANIFEST_FILE):
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+# Keyed by the manifest's modification time so a rebuilt topology is picked up without a restart
+@st.cache_resource
+def load_district_topology(version, path=MANIFEST_FILE):
+    return DistrictTopology(path) if version is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the simplified district TopoJSON levels of detail for RQ1.")
+    parser.add_argument('--geojson', default=GEOJSON_FILE)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument(
+        '--level', nargs=3, type=float, action='append', metavar=('MIN_ZOOM', 'TOLERANCE_M', 'QUANTIZATION'),
+        help="one level of detail; repeat for several (default: %s)" % ' '.join(f"{z}:{t}:{q}" for z, t, q in LEVELS),
+    )
+    parser.add_argument('--max-area-error', type=float, default=MAX_AREA_ERROR, help="largest relative area change per district")
+    parser.add_argument('--max-centroid-error', type=float, default=MAX_CENTROID_ERROR, help="largest centroid shift per district in metres")
+    args = parser.parse_args()
+    levels = [(int(z), t, int(q)) for z, t, q in args.level] if args.level else LEVELS
+    try:
+        manifest = build_topology(args.geojson, args.output_dir, levels, args.max_area_error, args.max_centroid_error)
+    except ValueError as e:
+        parser.exit(1, f"{e}\nNothing was written; lower the tolerance or raise the budget.\n")
+    for level in manifest['levels']:
+        print(
+            f"Zoom {level['min_zoom']}+: {level['file']}, {level['arcs']} arcs, {level['bytes'] / 1024:.0f} KB, "
+            f"max area error {level['max_area_error']:.3%}, max centroid shift {level['max_centroid_error_m']:.1f} m"
+        )
+
+
+if __name__ == "__main__":
+    main()
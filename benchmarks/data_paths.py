@@ -0,0 +1,292 @@
+"""
+Time the dashboard's non-UI data paths headlessly on synthetic data scaled from pro_merged.
+
+For every scale, a temporary copy of app/data is created. In it, the proposals (pro_merged,
+sample_proposals and the document-topic matrix) are replicated `scale` times with fresh ids
+and jittered coordinates, and the Arrow bundle is rebuilt from the result. The page functions
+are then run against that copy, since the pages read paths relative to the working directory.
+Their Streamlit caches are cleared before every call, so each timing is a cold computation.
+Map cases also report the size of the generated HTML, or of the component arguments for the
+client-side district maps. Topic prediction needs the spaCy model
+and is skipped when it is not installed. Run from the repository root:
+
+    PYTHONPATH=app python benchmarks/data_paths.py --scales 1 10 100 --repeat 5
+    PYTHONPATH=app python benchmarks/data_paths.py --cases map --json results.json
+"""
+# Import libraries
+import argparse
+import csv
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+SOURCE_DIR = os.path.join(ROOT, 'app', 'data')
+# Rebuilt for every scale rather than linked
+GENERATED = {'bundle', 'search', 'pro_merged.csv', 'sample_proposals.csv', 'doc_topics.npy', 'doc_topics_index.arrow'}
+ID_COLUMNS = {'pro_merged.csv': 'id', 'sample_proposals.csv': 'id'}
+JITTER_DEGREES = 0.002
+
+
+def replicate(df, scale, rng, id_column='id'):
+    """
+    `scale` copies of `df`; every copy after the first gets fresh ids and, where present,
+    coordinates moved by a few hundred metres.
+    """
+    offset = int(df[id_column].max()) + 1
+    copies = [df]
+    for k in range(1, scale):
+        copy = df.copy()
+        copy[id_column] = copy[id_column] + k * offset
+        for column in ('latitude', 'longitude'):
+            if column in copy:
+                copy[column] = copy[column] + rng.normal(0, JITTER_DEGREES, len(copy))
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def build_scaled_data(root, scale, seed=0):
+    """
+    Create root/app/data for one scale and return the number of proposals it holds.
+    """
+    from utils.bundle import build_bundle
+    rng = np.random.default_rng(seed)
+    data_dir = os.path.join(root, 'app', 'data')
+    os.makedirs(data_dir)
+    for name in os.listdir(SOURCE_DIR):
+        if name not in GENERATED:
+            os.symlink(os.path.join(SOURCE_DIR, name), os.path.join(data_dir, name))
+    proposals = None
+    for name, id_column in ID_COLUMNS.items():
+        scaled = replicate(pd.read_csv(os.path.join(SOURCE_DIR, name)), scale, rng, id_column)
+        scaled.to_csv(os.path.join(data_dir, name), index=False, quoting=csv.QUOTE_NONNUMERIC)
+        proposals = len(scaled) if name == 'pro_merged.csv' else proposals
+
+    # Document-topic matrix, perturbed per copy and renormalised so the rows stay mixtures
+    matrix = np.load(os.path.join(SOURCE_DIR, 'doc_topics.npy'))
+    index = feather.read_table(os.path.join(SOURCE_DIR, 'doc_topics_index.arrow')).to_pandas()
+    matrix = np.tile(matrix, (scale, 1)) * rng.uniform(0.8, 1.2, (len(matrix) * scale, matrix.shape[1])).astype(np.float32)
+    np.save(os.path.join(data_dir, 'doc_topics.npy'), matrix / matrix.sum(axis=1, keepdims=True))
+    index = replicate(index.astype({'id': 'int64'}), scale, rng).astype({'id': 'int32'})
+    feather.write_feather(index, os.path.join(data_dir, 'doc_topics_index.arrow'), compression='uncompressed')
+
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            build_bundle(data_dir, os.path.join(data_dir, 'bundle'))
+        finally:
+            sys.stdout = stdout
+    return proposals
+
+
+def html_size(map):
+    return len(map.get_root().render().encode('utf-8'))
+
+
+def spacy_available():
+    try:
+        from utils.text import load_nlp
+        load_nlp()
+        return True
+    except OSError:
+        return False
+
+
+def cases(scale):
+    """
+    (name, function) pairs; a function returns a dict of extra metrics or None.
+    """
+    import folium
+    from folium.plugins import FastMarkerCluster
+    from pages import RQ1, RQ2, RQ3
+    from utils.bundle import data_version, read_table
+    from utils.datastore import get_data_store
+    from utils.doc_topics import DocumentTopics
+    from utils.geometry import DistrictGeometry
+    from utils.rankings import RankingIndex
+    from utils.spatial_join import DistrictLocator
+    from utils.topology import MANIFEST_FILE, DistrictTopology
+    from utils.topics import get_prediction_cache, model_fingerprint
+
+    # The data store outlives a scale, so start every scale from a cold one
+    get_data_store.clear()
+    pro_merged, sample_proposals, _, _ = RQ2.load_data()
+    geolocated = pro_merged.dropna(subset=['latitude', 'longitude'])
+    rounds = tuple(sorted(int(r) for r in geolocated['round'].unique()))
+    vote_results = ('Selected', 'Not selected')
+    fingerprint = model_fingerprint()
+    lda_model, dictionary = RQ2.load_topic_model(fingerprint)
+    texts = sample_proposals['texts'].dropna().tolist()
+    district_data, indexes = RQ1.load_data()
+    geometry = DistrictGeometry()
+    # The topology is built into the component, not app/data, so read it from the repository
+    topology_file = os.path.join(ROOT, MANIFEST_FILE)
+    topology = DistrictTopology(topology_file) if os.path.exists(topology_file) else None
+    statistics_table = read_table('weighted_averages_cleaned')
+
+    def load_data_rq1():
+        get_data_store.clear()
+        RQ1.load_data()
+
+    def load_data_rq2():
+        get_data_store.clear()
+        RQ2.load_data()
+
+    def load_data_rq3():
+        get_data_store.clear()
+        RQ3.load_data()
+
+    def load_data_all_pages():
+        # Datasets used by several pages are loaded once; report what the store holds afterwards
+        get_data_store.clear()
+        for page in (RQ1, RQ2, RQ3):
+            page.load_data()
+        stats = get_data_store(data_version()).stats()
+        return {'datasets': len(stats), 'memory_kb': sum(entry['memory_bytes'] for entry in stats.values()) / 1024}
+
+    def get_sampled_df():
+        RQ2.get_sampled_df.clear()
+        sampled = RQ2.get_sampled_df(pro_merged, len(geolocated), rounds, vote_results)
+        return {'rows': len(sampled)}
+
+    def prepare_heatmap_data():
+        RQ2.prepare_heatmap_data(DocumentTopics())
+
+    def predict_single():
+        get_prediction_cache.clear()
+        RQ2.predict_topics(texts[0], dictionary, lda_model, RQ2.topic_summaries, fingerprint)
+
+    def predict_batch():
+        # One percent of the scaled proposals, so the batch grows with the data like the rest
+        batch = (texts * scale)[:max(1, len(texts) * scale // 100)]
+        RQ2.predict_topics_batch(batch, dictionary, lda_model)
+        return {'texts': len(batch)}
+
+    def district_map_payload():
+        # What RQ1 sends per rerun when the district map is drawn client-side
+        df_year = district_data[district_data['Year'] == 2023]
+        values = topology.values(df_year, 'Population', 3)
+        colors, breaks = RQ1.district_classes(values, "OrRd")
+        return {'payload_bytes': len(json.dumps({'values': values, 'colors': colors, 'breaks': breaks}))}
+
+    def statistics_map():
+        df_year = district_data[district_data['Year'] == 2023]
+        map = folium.Map(location=[60.1800, 25.05], zoom_start=10.5, tiles='cartodb positron')
+        RQ1.add_district_choropleth(map, geometry, df_year, 'Population', "OrRd", 'Population in 2023', 3)
+        return {'html_kb': html_size(map) / 1024}
+
+    def index_map():
+        df_year = district_data.merge(indexes, on=["Area", "Year"], how="left")
+        df_year = df_year[df_year['Year'] == 2023]
+        map = folium.Map(location=[60.1800, 25.05], zoom_start=10.5, tiles="cartodb positron")
+        RQ1.add_district_choropleth(map, geometry, df_year, "Economic Prosperity Index", "Greys", "Economic Prosperity Index (2023)", 2)
+        return {'html_kb': html_size(map) / 1024}
+
+    def proposal_marker_map():
+        RQ2.get_sampled_df.clear()
+        RQ2.build_marker_payload.clear()
+        payload = RQ2.build_marker_payload(pro_merged, len(geolocated), rounds, vote_results)
+        m = folium.Map(location=[60.1699, 24.9384], zoom_start=12)
+        FastMarkerCluster(payload, callback=RQ2.marker_callback).add_to(m)
+        return {'markers': len(payload), 'html_kb': html_size(m) / 1024}
+
+    def proposal_hexbin_map():
+        RQ2.load_proposal_bins.clear()
+        RQ2.build_bin_layer.clear()
+        geojson = RQ2.build_bin_layer(RQ2.load_proposal_bins(pro_merged), "Hexagon bins", RQ2.ZOOM_CELL_SIZES[12], rounds, vote_results)
+        m = folium.Map(location=[60.1699, 24.9384], zoom_start=12, tiles='cartodb positron')
+        RQ2.add_bin_layer(m, geojson, "Number of proposals")
+        return {'bins': len(geojson['features']), 'html_kb': html_size(m) / 1024}
+
+    def district_assignment():
+        # Every geolocated proposal of the scaled data against the unsimplified polygons
+        locator = DistrictLocator()
+        assigned = locator.assign(pro_merged['longitude'], pro_merged['latitude'])
+        return {'points': int(pro_merged['latitude'].notna().sum()), 'outside': int(assigned['outside_city'].sum())}
+
+    def district_ranking():
+        ranking_index = RankingIndex(statistics_table)
+        options = RQ3.district_ranking_options(ranking_index, ranking_index.areas[0])
+        return {'payload_kb': len(json.dumps(options)) / 1024}
+
+    yield 'load_data RQ1', load_data_rq1
+    yield 'load_data RQ2', load_data_rq2
+    yield 'load_data RQ3', load_data_rq3
+    yield 'load_data all pages', load_data_all_pages
+    yield 'get_sampled_df', get_sampled_df
+    yield 'prepare_heatmap_data', prepare_heatmap_data
+    if spacy_available():
+        yield 'predict_topics single', predict_single
+        yield 'predict_topics batch', predict_batch
+    else:
+        print("spaCy model not installed; skipping the predict_topics cases.")
+    if topology is not None:
+        yield 'district map payload (RQ1)', district_map_payload
+    yield 'statistics map, Folium (RQ1)', statistics_map
+    yield 'index map, Folium (RQ1)', index_map
+    yield 'proposal marker map (RQ2)', proposal_marker_map
+    yield 'proposal hexbin map (RQ2)', proposal_hexbin_map
+    yield 'district assignment', district_assignment
+    yield 'district ranking payload (RQ3)', district_ranking
+
+
+def time_case(func, repeat):
+    func()  # warm-up: imports, lazily built resources
+    timings, extra = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extra = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': statistics.median(timings), 'min_ms': min(timings), **(extra or {})}
+
+
+def format_extra(result):
+    return ', '.join(f"{key}={value:.0f}" for key, value in result.items() if key not in ('median_ms', 'min_ms'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100], help="replication factors of the proposal data")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per case after one warm-up run")
+    parser.add_argument('--cases', nargs='*', default=[], help="only run cases whose name contains one of these strings")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+    # The pages run without a Streamlit runtime, which logs a warning for every st call
+    logging.disable(logging.WARNING)
+
+    results = []
+    for scale in args.scales:
+        root = tempfile.mkdtemp(prefix=f'mcv-bench-{scale}x-')
+        try:
+            proposals = build_scaled_data(root, scale)
+            os.chdir(root)
+            print(f"\n{scale}x: {proposals} proposals")
+            print(f"{'Case':<34}{'median ms':>12}{'min ms':>10}  extra")
+            for name, func in cases(scale):
+                if args.cases and not any(part in name for part in args.cases):
+                    continue
+                result = time_case(func, args.repeat)
+                results.append({'scale': scale, 'case': name, **result})
+                print(f"{name:<34}{result['median_ms']:>12.1f}{result['min_ms']:>10.1f}  {format_extra(result)}")
+        finally:
+            os.chdir(ROOT)
+            shutil.rmtree(root, ignore_errors=True)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Measure what-if index recomputation plus map refresh on RQ1.
+
+Each iteration draws random EPI weights and a random PSAI indicator set, recomputes the indices
+for all Area x Year rows through the shared IndexEngine, and builds the district map payload
+exactly as RQ1 does: the value vector for the client-side choropleth, or the rendered Folium map
+with --folium. Sessions are simulated with threads sharing one engine and one
+geometry store, as they are under `st.cache_resource`, each pausing for a random think time
+between slider moves. Run from the repository root:
+
+    PYTHONPATH=app python benchmarks/index_weighting.py --sessions 1 4 16
+"""
+# Import libraries
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import folium
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+os.chdir(ROOT)
+
+from pages.RQ1 import add_district_choropleth, district_classes  # noqa: E402
+from utils.bundle import read_table  # noqa: E402
+from utils.geometry import DistrictGeometry  # noqa: E402
+from utils.indexes import IndexEngine, default_config  # noqa: E402
+from utils.topology import DistrictTopology  # noqa: E402
+
+TARGET_MS = 100
+
+
+def random_config(rng):
+    config = default_config()
+    for column in config['epi']['weights']:
+        config['epi']['weights'][column] = round(rng.uniform(0.05, 1.0), 2)
+    indicators = config['psai']['indicators']
+    config['psai']['indicators'] = rng.sample(indicators, rng.randint(1, len(indicators)))
+    return config
+
+
+def refresh(engine, geometry, config, index_name, year):
+    """
+    Recompute the indices and rebuild the map payload; returns the compute and total time in
+    ms and the payload size in bytes. `geometry` is a DistrictTopology, or a DistrictGeometry
+    for the Folium map.
+    """
+    start = time.perf_counter()
+    indexes = engine.compute(config)
+    computed = time.perf_counter()
+    df_year = indexes[indexes['Year'] == year]
+    if isinstance(geometry, DistrictTopology):
+        values = geometry.values(df_year, index_name, 2)
+        colors, breaks = district_classes(values, "Greys")
+        payload = json.dumps({'values': values, 'colors': colors, 'breaks': breaks, 'column': index_name, 'caption': f"{index_name} ({year})"})
+    else:
+        map = folium.Map(location=[60.1800, 25.05], zoom_start=10.5, tiles="cartodb positron")
+        add_district_choropleth(map, geometry, df_year, index_name, "Greys", f"{index_name} ({year})", 2)
+        payload = map.get_root().render()
+    end = time.perf_counter()
+    return (computed - start) * 1000, (end - start) * 1000, len(payload.encode('utf-8'))
+
+
+def percentile(values, q):
+    return values[int(q * (len(values) - 1))]
+
+
+def session(engine, geometry, iterations, think_ms, seed):
+    rng = random.Random(seed)
+    timings = []
+    for _ in range(iterations):
+        time.sleep(rng.expovariate(1000 / think_ms) if think_ms else 0)
+        config = random_config(rng)
+        index_name = rng.choice(["Economic Prosperity Index", "Public Service Accessibility Index"])
+        timings.append(refresh(engine, geometry, config, index_name, rng.choice(range(2018, 2024))))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8], help="concurrent sessions to simulate")
+    parser.add_argument('--iterations', type=int, default=50, help="refreshes per session")
+    parser.add_argument('--folium', action='store_true', help="time the Folium map instead of the client-side choropleth")
+    parser.add_argument('--think-ms', type=float, default=500, help="mean pause between a session's refreshes (0 for back-to-back)")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    engine = IndexEngine(read_table('district_data'))
+    geometry = DistrictGeometry() if args.folium else DistrictTopology()
+    refresh(engine, geometry, default_config(), "Economic Prosperity Index", 2023)  # warm-up
+
+    print(f"{len(engine.keys)} Area x Year rows, {args.iterations} refreshes per session, {args.think_ms:.0f} ms mean think time")
+    print(f"{'Sessions':>8}{'compute p95':>14}{'total p50':>12}{'total p95':>12}{'total max':>12}{'payload KB':>12}  target {TARGET_MS} ms")
+    for sessions in args.sessions:
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            results = list(pool.map(lambda seed: session(engine, geometry, args.iterations, args.think_ms, seed), range(sessions)))
+        compute = sorted(c for timings in results for c, _, _ in timings)
+        total = sorted(t for timings in results for _, t, _ in timings)
+        payload = statistics.mean(p for timings in results for _, _, p in timings)
+        print(
+            f"{sessions:>8}{percentile(compute, 0.95):>14.1f}{statistics.median(total):>12.1f}{percentile(total, 0.95):>12.1f}{total[-1]:>12.1f}"
+            f"{payload / 1024:>12.1f}  {'met' if percentile(total, 0.95) < TARGET_MS else 'missed'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Measure import-to-first-paint for every dashboard page.
+
+Each page is executed headlessly with Streamlit's AppTest in a fresh interpreter, so module
+imports and cached resources are cold, and the time until the first script run completes is
+reported. Pass --baseline REF to run the same measurement on another git revision (checked out
+into a temporary worktree) and print both side by side.
+
+    python benchmarks/startup_time.py --baseline HEAD~1
+"""
+# Import libraries
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ['app/Home.py', 'app/pages/RQ1.py', 'app/pages/RQ2.py', 'app/pages/RQ3.py']
+
+# Runs inside the child interpreter with the checkout as working directory
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=600).run()
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'errors': [str(e.message) for e in at.exception]}))
+"""
+
+
+def time_page(checkout, page):
+    env = dict(os.environ, PYTHONPATH=os.path.join(checkout, 'app'))
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, page], cwd=checkout, env=env, capture_output=True, text=True
+    )
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {'seconds': float('nan'), 'errors': result.stderr.strip().splitlines()[-1:]}
+    return json.loads(lines[-1])
+
+
+def measure(checkout, repeat):
+    timings = {}
+    for page in PAGES:
+        runs = [time_page(checkout, page) for _ in range(repeat)]
+        # The median is over the runs that finished; a page is failed only if none did
+        finished = [run['seconds'] for run in runs if run['seconds'] == run['seconds']]
+        failed = [run for run in runs if run['seconds'] != run['seconds']]
+        timings[page] = {
+            'seconds': statistics.median(finished) if finished else float('nan'),
+            'failed_runs': len(failed),
+            'errors': (failed or runs)[-1]['errors'],
+        }
+    return timings
+
+
+def format_seconds(value):
+    return 'failed' if value != value else f'{value:.2f}s'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--baseline', help="git revision to compare against, e.g. HEAD~1")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per page; the median is reported")
+    args = parser.parse_args()
+
+    after = measure(ROOT, args.repeat)
+    before = None
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            worktree = os.path.join(tmp, 'baseline')
+            subprocess.run(['git', 'worktree', 'add', '--detach', worktree, args.baseline], cwd=ROOT, check=True, capture_output=True)
+            try:
+                before = measure(worktree, args.repeat)
+            finally:
+                subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=ROOT, capture_output=True)
+
+    header = f"{'Page':<20}{'Before':>10}{'After':>10}" if before else f"{'Page':<20}{'Time':>10}"
+    print(header)
+    for page in PAGES:
+        row = f"{os.path.basename(page):<20}"
+        if before:
+            row += f"{format_seconds(before[page]['seconds']):>10}"
+        row += f"{format_seconds(after[page]['seconds']):>10}"
+        print(row)
+    for label, timings in (('before', before), ('after', after)):
+        for page, timing in (timings or {}).items():
+            if timing['failed_runs']:
+                print(f"[{label}] {page}: {timing['failed_runs']} of {args.repeat} runs failed")
+            for error in timing['errors']:
+                print(f"[{label}] {page}: {error}")
+
+
+if __name__ == "__main__":
+    main()